@@ -0,0 +1,5 @@
+__all__ = [
+    "bench_commands",
+    "bench_serializer",
+    "replay_rtm"
+]
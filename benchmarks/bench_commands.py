@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark of the ctf commands against the local fake slack server.
+
+Builds a synthetic workspace (ctf and challenge channels carrying the bot's purposes),
+lets the bot load it and runs the commands through handler_factory.process. Wall time
+and the number of slack api calls of every operation are compared with a stored
+baseline, regressions beyond the threshold make the benchmark fail.
+
+The client side rate limiter and the outbox pacing are disabled, so the times show
+the work of the bot and not the waiting for slack.
+
+Usage: python3 -m benchmarks.bench_commands [--ctfs 10] [--challenges 500] [--players 200]
+                                             [--threshold 0.25] [--save-baseline]
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from handlers import handler_factory
+from handlers.challenge_handler import ChallengeHandler
+from server.botserver import BotServer
+from tests.fakeslack import BOT_ID, FakeSlack
+from util.loghandler import log, logging
+from util.ratelimiter import UnlimitedRateLimiter
+from util.slack_wrapper import SlackWrapper
+from util.util import load_ctfs
+
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), "baseline_commands.json")
+DEFAULT_THRESHOLD = 0.25
+MIN_TIME_DELTA = 0.02       # seconds, smaller differences are treated as noise
+CATEGORIES = ("web", "pwn", "crypto", "re", "misc")
+ADMIN = "U00000000"
+OUTBOX_TIMEOUT = 60
+
+
+def build_workspace(fake_slack, ctf_count, challenge_count, player_count):
+    """Create the ctf and challenge channels of a synthetic ctf database in the fake slack workspace."""
+    players = fake_slack.add_users(player_count)
+
+    for ctf_no in range(ctf_count):
+        name = "ctf{}".format(ctf_no)
+
+        purpose = dict(ChallengeHandler.CTF_PURPOSE, name=name, long_name="Synthetic CTF {}".format(ctf_no))
+        ctf_channel = fake_slack.add_channel(name, members=[BOT_ID] + players, purpose=json.dumps(purpose))
+
+        for chall_no in range(challenge_count):
+            purpose = dict(ChallengeHandler.CHALL_PURPOSE, name="chall{}".format(chall_no),
+                           ctf_id=ctf_channel["id"], category=CATEGORIES[chall_no % len(CATEGORIES)])
+
+            if chall_no % 2:
+                purpose["solved"] = [players[chall_no % player_count]]
+                purpose["solve_date"] = 1533056159 + chall_no
+
+            members = [players[(chall_no * 7 + player_no) % player_count] for player_no in range(chall_no % 8)]
+
+            fake_slack.add_channel("{}-chall{}".format(name, chall_no), is_private=True,
+                                   members=[BOT_ID] + members, purpose=json.dumps(purpose))
+
+    return players
+
+
+class CommandBenchmark:
+    """Runs bot operations against a fake slack workspace and measures them."""
+
+    def __init__(self, ctf_count, challenge_count, player_count):
+        self.workdir = tempfile.mkdtemp(prefix="bench_commands")
+
+        for attr in ("DB", "ARCHIVE_CHECKPOINTS", "STATUS_MESSAGES", "STATUS_BOARDS", "SCHEDULER"):
+            setattr(ChallengeHandler, attr, os.path.join(self.workdir, os.path.basename(getattr(ChallengeHandler, attr))))
+
+        self.fake_slack = FakeSlack().start()
+        self.players = build_workspace(self.fake_slack, ctf_count, challenge_count, player_count)
+        self.general = self.fake_slack.add_channel("general", members=[BOT_ID] + self.players)["id"]
+
+        self.botserver = BotServer()
+        self.botserver.config = {
+            "api_key": "xoxb-benchmark",
+            "admin_users": [ADMIN],
+            "auto_invite": [],
+            "archive_everything": True,
+            "archive_ctf_reminder_offset": "168"
+        }
+
+        self.slack_wrapper = SlackWrapper("xoxb-benchmark", self.fake_slack.api_url)
+        self.slack_wrapper.rate_limiter = UnlimitedRateLimiter()
+        self.slack_wrapper.outbox.interval = 0
+        self.botserver.slack_wrapper = self.slack_wrapper
+
+        self.results = {}
+
+    def close(self):
+        self.slack_wrapper.close()
+        self.fake_slack.stop()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def measure(self, name, func, rounds=1):
+        """
+        Run func rounds times and record the fastest wall time and the average number of
+        api calls (including the posted messages).
+        """
+        self.slack_wrapper.outbox.flush(OUTBOX_TIMEOUT)
+        calls_before = sum(self.fake_slack.calls.values())
+        durations = []
+
+        for _ in range(rounds):
+            start = time.perf_counter()
+            func()
+            self.slack_wrapper.outbox.flush(OUTBOX_TIMEOUT)
+            durations.append(time.perf_counter() - start)
+
+        calls = (sum(self.fake_slack.calls.values()) - calls_before) / rounds
+
+        self.results[name] = {"time": round(min(durations), 4), "calls": calls}
+
+    def command(self, message, channel_id, user_id=ADMIN):
+        handler_factory.process(self.slack_wrapper, self.botserver, message, self.fake_slack.next_ts(),
+                                channel_id, user_id)
+
+    def find_ctf(self, name):
+        return next(ctf for ctf in load_ctfs(ChallengeHandler.DB).values() if ctf.name == name)
+
+    def run(self):
+        self.measure("startup", self.botserver.init_bot_data)
+
+        ctf = self.find_ctf("ctf0")
+
+        self.measure("status short", lambda: self.command("ctf status", self.general), 5)
+        self.measure("status verbose", lambda: self.command("ctf status -v", self.general), 5)
+        self.measure("status category", lambda: self.command("ctf status -v web", self.general), 5)
+        self.measure("status ctf channel", lambda: self.command("ctf status", ctf.channel_id), 5)
+
+        self.measure("addchallenge", lambda: self.command("ctf addchallenge benchmark web", ctf.channel_id))
+        challenge = next((chall for chall in self.find_ctf("ctf0").challenges if chall.name == "benchmark"), None)
+
+        if not challenge:
+            raise RuntimeError("addchallenge failed, check the log")
+
+        self.measure("workon", lambda: self.command("ctf workon benchmark", ctf.channel_id, self.players[1]), 5)
+        self.measure("solve", lambda: self.command("ctf solve", challenge.channel_id, self.players[1]))
+
+        # Renaming and archiving need two more ctfs
+        if len(load_ctfs(ChallengeHandler.DB)) >= 3:
+            self.measure("renamectf", lambda: self.command("ctf renamectf ctf1 renamed", self.general))
+            self.measure("archivectf", lambda: self.command("ctf archivectf nopost", self.find_ctf("ctf2").channel_id))
+
+        self.measure("reload", lambda: self.command("ctf reload", self.general), 3)
+
+        return self.results
+
+
+def load_baseline(filename):
+    try:
+        with open(filename) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return None
+
+
+def compare(results, baseline, threshold):
+    """Print the results next to the baseline and return the names of regressed operations."""
+    regressions = []
+
+    print("{:20} {:>10} {:>10} {:>8} {:>10} {:>10}".format(
+        "operation", "time (ms)", "base (ms)", "change", "api calls", "base"))
+
+    for name, result in results.items():
+        base = (baseline or {}).get(name)
+        line = "{:20} {:>10.1f}".format(name, result["time"] * 1000)
+
+        if not base:
+            print(line + "{:>30}".format(result["calls"]))
+            continue
+
+        change = result["time"] / base["time"] - 1 if base["time"] else 0
+        slower = result["time"] > base["time"] * (1 + threshold) and result["time"] - base["time"] > MIN_TIME_DELTA
+        more_calls = result["calls"] > base["calls"]
+
+        print(line + " {:>10.1f} {:>+8.0%} {:>10} {:>10}{}".format(
+            base["time"] * 1000, change, result["calls"], base["calls"], "  REGRESSION" if slower or more_calls else ""))
+
+        if slower or more_calls:
+            regressions.append(name)
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ctf commands against the fake slack server")
+    parser.add_argument("--ctfs", type=int, default=10)
+    parser.add_argument("--challenges", type=int, default=500)
+    parser.add_argument("--players", type=int, default=200)
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed slowdown against the baseline (0.25 = 25%%)")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as new baseline")
+    args = parser.parse_args()
+
+    log.setLevel(logging.ERROR)
+
+    setup = {"ctfs": args.ctfs, "challenges": args.challenges, "players": args.players}
+    benchmark = CommandBenchmark(args.ctfs, args.challenges, args.players)
+
+    try:
+        results = benchmark.run()
+    finally:
+        benchmark.close()
+
+    baseline = load_baseline(args.baseline)
+
+    if baseline and baseline.get("setup") != setup:
+        print("Baseline was recorded with another setup ({}), not comparing.".format(baseline.get("setup")))
+        baseline = None
+
+    print("Workspace: {ctfs} ctfs x {challenges} challenges ({players} players)".format(**setup))
+    regressions = compare(results, baseline and baseline["operations"], args.threshold)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump({"setup": setup, "operations": results}, f, indent=4)
+
+        print("Baseline saved to {}".format(args.baseline))
+    elif regressions:
+        print("Regressions: {}".format(", ".join(regressions)))
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Compare size and load time of the challenge database in the legacy format
+(default pickle protocol, dict-backed objects, players as dict of Player objects)
+and the current versioned format.
+
+Usage: python3 -m benchmarks.bench_serializer [ctfs] [challenges] [players]
+"""
+import copyreg
+import io
+import pickle
+import sys
+import time
+
+from bottypes.challenge import Challenge
+from bottypes.ctf import CTF
+from bottypes.player import Player
+from util import serializer
+
+
+def build_database(ctf_count, challenge_count, player_count):
+    """Build a synthetic ctf database."""
+    ctfs = {}
+
+    for ctf_no in range(ctf_count):
+        ctf = CTF("CTF{:06d}".format(ctf_no), "ctf{}".format(ctf_no), "Synthetic CTF {}".format(ctf_no))
+
+        for chall_no in range(challenge_count):
+            challenge = Challenge(ctf.channel_id, "CHL{:03d}{:05d}".format(ctf_no, chall_no),
+                                  "chall{}".format(chall_no), ("web", "pwn", "crypto", "re", "misc")[chall_no % 5])
+
+            for player_no in range(chall_no % 8):
+                challenge.add_player("U{:08d}".format((chall_no * 7 + player_no) % player_count))
+
+            challenge.add_tag("tag{}".format(chall_no % 3))
+
+            if chall_no % 2:
+                challenge.mark_as_solved(["U{:08d}".format(chall_no % player_count)], 1533056159 + chall_no)
+
+            ctf.add_challenge(challenge)
+
+        ctfs[ctf.channel_id] = ctf
+
+    return ctfs
+
+
+def legacy_state(obj):
+    """Return the __dict__ an object had in the legacy (dict-backed) bottypes."""
+    state = {slot: getattr(obj, slot) for slot in obj.__slots__}
+
+    if isinstance(obj, Challenge):
+        state["players"] = {user_id: Player(user_id) for user_id in obj.players}
+        state["tags"] = sorted(obj.tags)
+
+    return state
+
+
+def legacy_reduce(obj):
+    # Pickle like a plain object with a __dict__, which is what older versions stored
+    return copyreg._reconstructor, (type(obj), object, None), legacy_state(obj)
+
+
+def dumps_legacy(ctfs):
+    """Serialize the database like older versions did."""
+    buf = io.BytesIO()
+    pickler = pickle.Pickler(buf, protocol=pickle.DEFAULT_PROTOCOL)
+    pickler.dispatch_table = copyreg.dispatch_table.copy()
+    pickler.dispatch_table[CTF] = legacy_reduce
+    pickler.dispatch_table[Challenge] = legacy_reduce
+    pickler.dispatch_table[Player] = legacy_reduce
+    pickler.dump(ctfs)
+
+    return buf.getvalue()
+
+
+def time_loads(data, rounds):
+    start = time.perf_counter()
+
+    for _ in range(rounds):
+        serializer.loads(data)
+
+    return (time.perf_counter() - start) / rounds
+
+
+def main(ctf_count=10, challenge_count=500, player_count=200, rounds=5):
+    ctfs = build_database(ctf_count, challenge_count, player_count)
+
+    legacy = dumps_legacy(ctfs)
+    current = serializer.dumps(ctfs)
+
+    legacy_time = time_loads(legacy, rounds)
+    current_time = time_loads(current, rounds)
+
+    print("Database: {} ctfs x {} challenges ({} players)".format(ctf_count, challenge_count, player_count))
+    print("{:10} {:>12} {:>12}".format("format", "size (KB)", "load (ms)"))
+    print("{:10} {:>12.1f} {:>12.2f}".format("legacy", len(legacy) / 1024, legacy_time * 1000))
+    print("{:10} {:>12.1f} {:>12.2f}".format("current", len(current) / 1024, current_time * 1000))
+    print("size: {:.0%}, load time: {:.0%} of legacy".format(len(current) / len(legacy), current_time / legacy_time))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:4]])
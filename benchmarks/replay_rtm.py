@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Replay a recording of RTM events (see the rtm_record_file config option) against the
+local fake slack server and report the latency and throughput of the bot.
+
+Every recorded batch is passed to BotServer.handle_message at its original time
+(scaled by --speed, 0 replays as fast as possible). The latency of a batch is the
+time from when it was due until the bot finished handling it, so it includes the
+time a batch had to wait for the previous ones.
+
+Channels referenced by the events are created on the fly. With --db, the ctf and
+challenge channels of a challenge database are created up front, so the bot loads
+the same ctfs as during the recording.
+
+Usage: python3 -m benchmarks.replay_rtm recording.jsonl.gz [--speed 1] [--db databases/challenge_handler.bin]
+                                                            [--admin U12345] [--unlimited]
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from handlers import handler_factory
+from handlers.challenge_handler import ChallengeHandler
+from server.botserver import BotServer
+from tests.fakeslack import BOT_ID, FakeSlack
+from util.loghandler import log, logging
+from util.ratelimiter import UnlimitedRateLimiter
+from util.rtmrecorder import read_recording
+from util.slack_wrapper import SlackWrapper
+from util.util import load_ctfs
+
+OUTBOX_TIMEOUT = 300
+
+
+def percentile(values, fraction):
+    """Return the nearest-rank percentile of a sorted list."""
+    if not values:
+        return 0
+
+    return values[min(len(values) - 1, max(0, int(round(fraction * len(values))) - 1))]
+
+
+def collect_users(batches):
+    """Return the ids of all users, which appear in the recorded events."""
+    users = set()
+
+    for batch in batches:
+        for event in batch["events"]:
+            if isinstance(event.get("user"), str):
+                users.add(event["user"])
+
+    return users
+
+
+def build_workspace_from_database(fake_slack, ctfs):
+    """Create the ctf and challenge channels of a challenge database in the fake slack workspace."""
+    for ctf in ctfs.values():
+        purpose = dict(ChallengeHandler.CTF_PURPOSE, name=ctf.name, long_name=ctf.long_name, cred_user=ctf.cred_user,
+                       cred_pw=ctf.cred_pw, finished=ctf.finished, finished_on=ctf.finished_on)
+        players = set()
+
+        for challenge in ctf.challenges:
+            purpose_chall = dict(ChallengeHandler.CHALL_PURPOSE, name=challenge.name, ctf_id=ctf.channel_id,
+                                 category=challenge.category, solved=challenge.solver or "",
+                                 solve_date=challenge.solve_date)
+
+            fake_slack.add_channel("{}-{}".format(ctf.name, challenge.name), True, [BOT_ID] + list(challenge.players),
+                                   json.dumps(purpose_chall), channel_id=challenge.channel_id)
+            players.update(challenge.players)
+
+        fake_slack.add_channel(ctf.name, False, [BOT_ID] + list(players), json.dumps(purpose),
+                               channel_id=ctf.channel_id)
+
+
+class Replayer:
+    """Feeds recorded RTM batches into a bot server connected to the fake slack server."""
+
+    def __init__(self, recording, db=None, admins=None, unlimited=False):
+        entries = list(read_recording(recording))
+
+        self.batches = [entry for entry in entries if "events" in entry]
+        connects = [entry["connect"] for entry in entries if "connect" in entry]
+        self.workdir = tempfile.mkdtemp(prefix="replay_rtm")
+
+        for attr in ("DB", "ARCHIVE_CHECKPOINTS", "STATUS_MESSAGES", "STATUS_BOARDS", "SCHEDULER"):
+            setattr(ChallengeHandler, attr, os.path.join(self.workdir, os.path.basename(getattr(ChallengeHandler, attr))))
+
+        self.fake_slack = FakeSlack(autocreate=True).start()
+
+        for user_id in collect_users(self.batches):
+            self.fake_slack.add_user(user_id, user_id.lower())
+
+        if db:
+            ctfs = load_ctfs(db)
+
+            for user_id in set(player for ctf in ctfs.values() for chall in ctf.challenges for player in chall.players):
+                if user_id not in self.fake_slack.users:
+                    self.fake_slack.add_user(user_id, user_id.lower())
+
+            build_workspace_from_database(self.fake_slack, ctfs)
+
+        self.botserver = BotServer()
+        self.botserver.config = {
+            "api_key": "xoxb-replay",
+            "admin_users": admins or [],
+            "auto_invite": [],
+            "archive_everything": True
+        }
+
+        self.slack_wrapper = SlackWrapper("xoxb-replay", self.fake_slack.api_url)
+
+        if unlimited:
+            self.slack_wrapper.rate_limiter = UnlimitedRateLimiter()
+            self.slack_wrapper.outbox.interval = 0
+
+        self.botserver.slack_wrapper = self.slack_wrapper
+        self.botserver.init_bot_data()
+
+        # Recorded events refer to the bot user of the recording
+        if connects:
+            self.botserver.bot_id = self.slack_wrapper.user_id = connects[-1]["bot_id"]
+            self.botserver.bot_at = "<@{}>".format(self.botserver.bot_id)
+
+    def close(self):
+        self.slack_wrapper.close()
+        self.fake_slack.stop()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def run(self, speed):
+        """Replay all batches and return a dictionary with the measurements."""
+        latencies = []
+        events = 0
+        calls_before = sum(self.fake_slack.calls.values())
+
+        first_time = self.batches[0]["time"] if self.batches else 0
+        start = time.perf_counter()
+
+        for batch in self.batches:
+            now = time.perf_counter()
+            due = start + (batch["time"] - first_time) / speed if speed else now
+
+            if due > now:
+                time.sleep(due - now)
+
+            self.botserver.handle_message(batch["events"])
+            handler_factory.tick(self.slack_wrapper)
+
+            latencies.append(time.perf_counter() - due)
+            events += len(batch["events"])
+
+        duration = time.perf_counter() - start
+        self.slack_wrapper.outbox.flush(OUTBOX_TIMEOUT)
+        latencies.sort()
+
+        return {
+            "batches": len(self.batches),
+            "events": events,
+            "duration": duration,
+            "throughput": events / duration if duration else 0,
+            "p50": percentile(latencies, 0.5),
+            "p90": percentile(latencies, 0.9),
+            "p99": percentile(latencies, 0.99),
+            "max": latencies[-1] if latencies else 0,
+            "api_calls": sum(self.fake_slack.calls.values()) - calls_before,
+            "outbox": self.slack_wrapper.get_outbox_stats()
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded RTM events against the fake slack server")
+    parser.add_argument("recording")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed (0 = as fast as possible)")
+    parser.add_argument("--db", help="challenge database, whose ctfs are created in the fake workspace")
+    parser.add_argument("--admin", action="append", help="user id of a bot admin (can be repeated)")
+    parser.add_argument("--unlimited", action="store_true", help="disable the client side rate limiter and message pacing")
+    args = parser.parse_args()
+
+    log.setLevel(logging.ERROR)
+
+    replayer = Replayer(args.recording, args.db, args.admin, args.unlimited)
+
+    try:
+        result = replayer.run(args.speed)
+    finally:
+        replayer.close()
+
+    print("Replayed {} events in {} batches at {} in {:.2f}s".format(
+        result["events"], result["batches"], "{:g}x".format(args.speed) if args.speed else "max speed",
+        result["duration"]))
+    print("Throughput: {:.1f} events/s, {} api calls".format(result["throughput"], result["api_calls"]))
+    print("Latency (ms): p50 {:.1f}, p90 {:.1f}, p99 {:.1f}, max {:.1f}".format(
+        result["p50"] * 1000, result["p90"] * 1000, result["p99"] * 1000, result["max"] * 1000))
+    print("Outbox: {} messages sent, average send latency {:.1f}ms".format(
+        result["outbox"]["sent"], result["outbox"]["avg_latency"] * 1000))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
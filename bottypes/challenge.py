@@ -3,6 +3,9 @@ import time
 class Challenge:
     MAX_TAGS = 5
 
+    __slots__ = ("channel_id", "ctf_channel_id", "name", "category", "players", "is_solved", "solver", "solve_date",
+                 "tags")
+
     def __init__(self, ctf_channel_id, channel_id, name, category):
         """
         An object representation of an ongoing challenge.
@@ -16,11 +19,31 @@ class Challenge:
         self.ctf_channel_id = ctf_channel_id
         self.name = name
         self.category = category
-        self.players = {}
+        self.players = set()
         self.is_solved = False
         self.solver = None
         self.solve_date = 0
-        self.tags = []
+        self.tags = set()
+
+    def __getstate__(self):
+        return tuple(getattr(self, slot) for slot in self.__slots__)
+
+    def __setstate__(self, state):
+        """
+        Restore a challenge from its state. Also accepts the __dict__ of challenges
+        pickled by older versions, which kept a dict of Player objects and a list of tags.
+        """
+        if isinstance(state, tuple):
+            state = dict(zip(self.__slots__, state))
+
+        self.__init__(state["ctf_channel_id"], state["channel_id"], state["name"], state.get("category"))
+
+        for slot in self.__slots__:
+            if slot in state:
+                setattr(self, slot, state[slot])
+
+        self.players = set(self.players)
+        self.tags = set(self.tags)
 
     def mark_as_solved(self, solver_list, solve_date=None):
         """
@@ -47,7 +70,7 @@ class Challenge:
         dirty = False
         if tag not in self.tags and len(self.tags) < self.MAX_TAGS:
             # The tag doesn't exist and there's room to add it, let's do so
-            self.tags.append(tag)
+            self.tags.add(tag)
             dirty = True
         return dirty
 
@@ -63,19 +86,15 @@ class Challenge:
             dirty = True
         return dirty
 
-    def add_player(self, player):
+    def add_player(self, user_id):
         """
-        Add a player to the list of working players.
+        Add a player to the set of working players using a given slack user ID.
         """
-        self.players[player.user_id] = player
+        self.players.add(user_id)
 
     def remove_player(self, user_id):
         """
-        Remove a player from the list of working players using a given slack
+        Remove a player from the set of working players using a given slack
         user ID.
         """
-        try:
-            del self.players[user_id]
-        except KeyError:
-            # TODO: Should we allow this to percolate up to the caller?
-            pass
+        self.players.discard(user_id)
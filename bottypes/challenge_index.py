@@ -0,0 +1,212 @@
+MAX_SUGGESTIONS = 3        # number of similar challenge names suggested for an unknown name
+MAX_EDIT_DISTANCE = 2      # maximum edit distance of a suggested challenge name
+
+
+def trigrams(name):
+    """Return the trigrams of a name (padded, so prefixes and short names have trigrams too)."""
+    padded = "  {} ".format(name)
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(first, second, limit):
+    """Return the Levenshtein distance of two strings (or limit + 1, if it exceeds the limit)."""
+    if abs(len(first) - len(second)) > limit:
+        return limit + 1
+
+    previous = list(range(len(second) + 1))
+
+    for i, first_char in enumerate(first, 1):
+        current = [i]
+
+        for j, second_char in enumerate(second, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (first_char != second_char)))
+
+        if min(current) > limit:
+            return limit + 1
+
+        previous = current
+
+    return previous[-1]
+
+
+class ChallengeIndex:
+    """
+    Inverted indexes of the challenges of a CTF by name, tag, category and player.
+    The indexes are derived from the challenges and aren't persisted with the CTF.
+    Challenges keep the order, in which they were added, within a tag or category.
+    """
+
+    __slots__ = ("by_id", "by_name", "by_trigram", "by_tag", "by_category", "by_player", "indexed")
+
+    def __init__(self, challenges=()):
+        self.by_id = {}
+        self.by_name = {}
+        self.by_trigram = {}    # trigram -> set of names
+        self.by_tag = {}
+        self.by_category = {}
+        self.by_player = {}
+        self.indexed = {}       # channel id -> (name, tags, category, players) the challenge is indexed with
+
+        for challenge in challenges:
+            self.add(challenge)
+
+    @staticmethod
+    def _insert(index, key, challenge):
+        index.setdefault(key, {})[challenge.channel_id] = challenge
+
+    @staticmethod
+    def _discard(index, key, channel_id):
+        challenges = index.get(key)
+
+        if challenges is not None:
+            challenges.pop(channel_id, None)
+
+            if not challenges:
+                del index[key]
+
+    def _add_name(self, name, challenge):
+        if name not in self.by_name:
+            for trigram in trigrams(name):
+                self.by_trigram.setdefault(trigram, set()).add(name)
+
+        self._insert(self.by_name, name, challenge)
+
+    def _remove_name(self, name, channel_id):
+        self._discard(self.by_name, name, channel_id)
+
+        if name not in self.by_name:
+            for trigram in trigrams(name):
+                names = self.by_trigram.get(trigram)
+                names.discard(name)
+
+                if not names:
+                    del self.by_trigram[trigram]
+
+    def add(self, challenge):
+        """Add a challenge (or update the entries of an already indexed challenge)."""
+        channel_id = challenge.channel_id
+        old_name, old_tags, old_category, old_players = self.indexed.get(
+            channel_id, (None, frozenset(), None, frozenset()))
+        name = challenge.name
+        tags = frozenset(challenge.tags)
+        category = challenge.category or ""
+        players = frozenset(challenge.players)
+
+        for tag in old_tags - tags:
+            self._discard(self.by_tag, tag, channel_id)
+
+        for player in old_players - players:
+            self._discard(self.by_player, player, channel_id)
+
+        if old_category is not None and old_category != category:
+            self._discard(self.by_category, old_category, channel_id)
+
+        if old_name is not None and old_name != name:
+            self._remove_name(old_name, channel_id)
+
+        # Entries, which didn't change, keep their position
+        self._add_name(name, challenge)
+
+        for tag in tags:
+            self._insert(self.by_tag, tag, challenge)
+
+        self._insert(self.by_category, category, challenge)
+
+        for player in players:
+            self._insert(self.by_player, player, challenge)
+
+        self.by_id[channel_id] = challenge
+        self.indexed[channel_id] = (name, tags, category, players)
+
+    update = add
+
+    def remove(self, channel_id):
+        """Remove a challenge by its channel id."""
+        if channel_id not in self.indexed:
+            return
+
+        name, tags, category, players = self.indexed.pop(channel_id)
+        del self.by_id[channel_id]
+
+        self._remove_name(name, channel_id)
+
+        for tag in tags:
+            self._discard(self.by_tag, tag, channel_id)
+
+        for player in players:
+            self._discard(self.by_player, player, channel_id)
+
+        self._discard(self.by_category, category, channel_id)
+
+    def named(self, name):
+        """Return the challenge with exactly this name (or None)."""
+        challenges = self.by_name.get(name)
+
+        return next(iter(challenges.values())) if challenges else None
+
+    def _containing(self, query):
+        """Return the names containing the query (only names sharing all trigrams of the query are compared)."""
+        query_trigrams = {query[i:i + 3] for i in range(len(query) - 2)}
+
+        if not query_trigrams:
+            candidates = self.by_name
+        else:
+            postings = sorted((self.by_trigram.get(trigram, set()) for trigram in query_trigrams), key=len)
+            candidates = set.intersection(*postings)
+
+        return sorted(name for name in candidates if query in name)
+
+    def _similar(self, query):
+        """Return the names within the maximum edit distance of the query, most similar first."""
+        shared = {}
+
+        for trigram in trigrams(query):
+            for name in self.by_trigram.get(trigram, ()):
+                shared[name] = shared.get(name, 0) + 1
+
+        # Very short names share no trigrams with a misspelling, so they're compared directly
+        candidates = set(shared) | {name for name in self.by_name if len(name) <= MAX_EDIT_DISTANCE + 1}
+        distances = ((edit_distance(query, name, MAX_EDIT_DISTANCE), -shared.get(name, 0), name) for name in candidates)
+
+        return [name for distance, _, name in sorted(distances) if distance <= MAX_EDIT_DISTANCE]
+
+    def match(self, query):
+        """
+        Find a challenge by a (partial) name.
+        Return (challenge, []) for an exact match or a unique prefix or substring match.
+        Otherwise return (None, names of similar challenges).
+        """
+        challenge = self.named(query)
+
+        if challenge or not query:
+            return challenge, []
+
+        containing = self._containing(query)
+        prefixed = [name for name in containing if name.startswith(query)]
+
+        for matches in (prefixed, containing):
+            if len(matches) == 1:
+                return self.named(matches[0]), []
+
+        if containing:
+            return None, (prefixed + [name for name in containing if name not in prefixed])[:MAX_SUGGESTIONS]
+
+        return None, self._similar(query)[:MAX_SUGGESTIONS]
+
+    def with_tag(self, tag):
+        """Return the challenges having a tag."""
+        return list(self.by_tag.get(tag, {}).values())
+
+    def in_category(self, category):
+        """Return the challenges of a category."""
+        return list(self.by_category.get(category, {}).values())
+
+    def of_player(self, user_id):
+        """Return the challenges a player is working on."""
+        return list(self.by_player.get(user_id, {}).values())
+
+    def tags(self):
+        return sorted(self.by_tag)
+
+    def categories(self):
+        return sorted(category for category in self.by_category if category)
@@ -1,4 +1,11 @@
+from bottypes.challenge_index import ChallengeIndex
+
+
 class CTF:
+    # Persisted attributes (the challenge index is derived from the challenges)
+    STATE_SLOTS = ("channel_id", "name", "challenges", "cred_user", "cred_pw", "long_name", "finished", "finished_on")
+
+    __slots__ = STATE_SLOTS + ("_index",)
 
     def __init__(self, channel_id, name, long_name):
         """
@@ -15,6 +22,21 @@ class CTF:
         self.long_name = long_name
         self.finished = False
         self.finished_on = 0
+        self._index = None
+
+    def __getstate__(self):
+        return tuple(getattr(self, slot) for slot in self.STATE_SLOTS)
+
+    def __setstate__(self, state):
+        """Restore a CTF from its state (also accepts the __dict__ of CTFs pickled by older versions)."""
+        if isinstance(state, tuple):
+            state = dict(zip(self.STATE_SLOTS, state))
+
+        self.__init__(state["channel_id"], state["name"], state.get("long_name", ""))
+
+        for slot in self.STATE_SLOTS:
+            if slot in state:
+                setattr(self, slot, state[slot])
 
     def add_challenge(self, challenge):
         """
@@ -23,3 +45,46 @@ class CTF:
         challenge : A challenge object
         """
         self.challenges.append(challenge)
+
+        if self._index is not None:
+            self._index.add(challenge)
+
+    def remove_challenge(self, channel_id):
+        """
+        Remove the challenge with the given channel id from this CTF.
+        """
+        self.challenges = [challenge for challenge in self.challenges if challenge.channel_id != channel_id]
+
+        if self._index is not None:
+            self._index.remove(channel_id)
+
+    def update_challenge(self, challenge):
+        """
+        Replace the challenge with the same channel id by the given challenge
+        and update its index entries (f.e. after its tags or players were changed).
+        """
+        for i, current in enumerate(self.challenges):
+            if current.channel_id == challenge.channel_id:
+                self.challenges[i] = challenge
+
+                if self._index is not None:
+                    self._index.update(challenge)
+
+                return
+
+    @property
+    def index(self):
+        """Indexes of the challenges by tag, category and player (built on first use)."""
+        if self._index is None:
+            self._index = ChallengeIndex(self.challenges)
+
+        return self._index
+
+    def challenges_with_tag(self, tag):
+        return self.index.with_tag(tag)
+
+    def challenges_in_category(self, category):
+        return self.index.in_category(category)
+
+    def challenges_of_player(self, user_id):
+        return self.index.of_player(user_id)
@@ -1,10 +1,20 @@
 class Player:
     """
     An object representation of a CTF player.
+    Challenges only keep the user ids of their players, this class is kept to be
+    able to load databases, which were created by older versions.
     """
 
+    __slots__ = ("user_id",)
+
     def __init__(self, user_id):
         """
         user_id : The slack ID of a user
         """
         self.user_id = user_id
+
+    def __getstate__(self):
+        return {"user_id": self.user_id}
+
+    def __setstate__(self, state):
+        self.user_id = state["user_id"]
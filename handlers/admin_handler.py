@@ -1,9 +1,16 @@
 import json
+import os
+import time
+
 from bottypes.command import Command
 from bottypes.command_descriptor import CommandDesc
 from bottypes.invalid_command import InvalidCommand
 from handlers import handler_factory
 from handlers.base_handler import BaseHandler
+from util.loghandler import LOGDIR
+from util.profiler import profiler
+from util.slowlog import slow_log
+from util.tracing import summarize, tracer
 from util.util import (get_display_name_from_user, parse_user_id,
                        resolve_user_by_user_id)
 
@@ -69,6 +76,147 @@ class ToggleMaintenanceModeCommand(Command):
         slack_wrapper.post_message(channel_id, text)
 
 
+class ShowOutboxCommand(Command):
+    """Show the state of the outbound message queue."""
+
+    @classmethod
+    def execute(cls, slack_wrapper, args, timestamp, channel_id, user_id, user_is_admin):
+        """Execute the ShowOutbox command."""
+        stats = slack_wrapper.get_outbox_stats()
+
+        response = "Outbox\n"
+        response += "===================================\n"
+        response += "Queued messages : {}\n".format(stats["depth"])
+
+        for queued_channel, depth in stats["channels"].items():
+            response += "\t<#{}> : {}\n".format(queued_channel, depth)
+
+        response += "Sent : {} ({} merged messages)\n".format(stats["sent"], stats["coalesced"])
+        response += "Failed : {} ({} channels retrying)\n".format(stats["failed"], stats["retrying"])
+        response += "Latency : {:.2f}s avg / {:.2f}s max\n".format(stats["avg_latency"], stats["max_latency"])
+        response += "==================================="
+
+        slack_wrapper.post_message(channel_id, response)
+
+
+class ShowTraceCommand(Command):
+    """Show the traces of the last processed commands or export all buffered traces."""
+
+    DEFAULT_COUNT = 10
+    MAX_COUNT = 50
+    SUMMARY_LINES = 8       # child span groups shown per trace
+    EXPORT_FILE = os.path.join(LOGDIR, "traces.json")
+
+    @classmethod
+    def execute(cls, slack_wrapper, args, timestamp, channel_id, user_id, user_is_admin):
+        """Execute the ShowTrace command."""
+        args = [arg.lower() for arg in args if arg.lower() != "last"]
+
+        if args and args[0] == "export":
+            count = tracer.export(cls.EXPORT_FILE)
+            slack_wrapper.post_message(channel_id, "Exported {} traces to `{}`".format(count, cls.EXPORT_FILE))
+            return
+
+        try:
+            count = int(args[0]) if args else cls.DEFAULT_COUNT
+        except ValueError:
+            raise InvalidCommand("Usage: `!admin trace [last] [count]` or `!admin trace export`")
+
+        traces = tracer.last(max(1, min(count, cls.MAX_COUNT)))
+
+        if not traces:
+            raise InvalidCommand("No commands were traced yet.")
+
+        response = "Last {} traces\n".format(len(traces))
+        response += "===================================\n"
+
+        for trace in traces:
+            response += "*{}* {:.1f}ms ({}){}\n".format(
+                trace.name, trace.duration * 1000, ", ".join("{}={}".format(key, value) for key, value in
+                                                              trace.attrs.items() if key != "error"),
+                " *{}*".format(trace.attrs["error"]) if "error" in trace.attrs else "")
+
+            for name, calls, total in summarize(trace)[:cls.SUMMARY_LINES]:
+                response += "\t{} x{} : {:.1f}ms\n".format(name, calls, total * 1000)
+
+        response += "==================================="
+
+        slack_wrapper.post_message(channel_id, response)
+
+
+class ShowSlowCommandsCommand(Command):
+    """Show the slowest processed commands and reactions (or forget them)."""
+
+    DEFAULT_COUNT = 10
+
+    @classmethod
+    def execute(cls, slack_wrapper, args, timestamp, channel_id, user_id, user_is_admin):
+        """Execute the ShowSlowCommands command."""
+        if args and args[0].lower() == "reset":
+            slow_log.reset()
+            slack_wrapper.post_message(channel_id, "Slow command log cleared")
+            return
+
+        try:
+            count = int(args[0]) if args else cls.DEFAULT_COUNT
+        except ValueError:
+            raise InvalidCommand("Usage: `!admin slow [count]` or `!admin slow reset`")
+
+        entries = slow_log.slowest(max(1, count))
+
+        if not entries:
+            raise InvalidCommand("No commands were processed yet.")
+
+        response = "Slowest commands\n"
+        response += "===================================\n"
+
+        for entry in entries:
+            phases = entry["phases"]
+
+            response += "*{}* ({}) {:.1f}ms in <#{}> at {}{}\n".format(
+                entry["command"], entry["handler"] or "-", entry["duration"] * 1000, entry["channel"],
+                time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry["time"])),
+                " *{}*".format(entry["error"]) if entry["error"] else "")
+            response += "\t{} args, {} slack calls : parse {:.1f}ms, db {:.1f}ms, api {:.1f}ms, render {:.1f}ms\n".format(
+                entry["arg_count"], entry["slack_calls"], phases["parse"] * 1000, phases["db"] * 1000,
+                phases["api"] * 1000, phases["render"] * 1000)
+
+        response += "==================================="
+
+        slack_wrapper.post_message(channel_id, response)
+
+
+class ProfileCommand(Command):
+    """Start or stop profiling the bot and send the summary of the profile to the admin."""
+
+    @classmethod
+    def execute(cls, slack_wrapper, args, timestamp, channel_id, user_id, user_is_admin):
+        """Execute the Profile command."""
+        action = args[0].lower()
+
+        if action == "start":
+            use_cprofile = len(args) > 1 and args[1].lower() == "cprofile"
+
+            try:
+                profiler.start(user_id, use_cprofile)
+            except RuntimeError as ex:
+                raise InvalidCommand(str(ex))
+
+            slack_wrapper.post_message(channel_id, "Profiler started{}. Stop it with `!admin profile stop`".format(
+                " (profiling every command with cProfile)" if use_cprofile else ""))
+
+        elif action == "stop":
+            try:
+                summary = profiler.stop()
+            except RuntimeError as ex:
+                raise InvalidCommand(str(ex))
+
+            slack_wrapper.post_message(user_id, summary)
+
+        else:
+            raise InvalidCommand("Usage: `!admin profile <start|stop> [cprofile]`")
+
+
 class ShowAdminsCommand(Command):
     """Shows list of users in the admin user group."""
 
@@ -186,6 +334,10 @@ class AdminHandler(BaseHandler):
             "maintenance": CommandDesc(ToggleMaintenanceModeCommand, "Toggle maintenance mode", None, None, True),
             "debug": CommandDesc(StartDebuggerCommand, "Break into a debugger shell", None, None, True),
             "join": CommandDesc(JoinChannelCommand, "Join a channel", ["channel_name"], None, True),
+            "outbox": CommandDesc(ShowOutboxCommand, "Show queued messages, send latency and failures of the outbox", None, None, True),
+            "trace": CommandDesc(ShowTraceCommand, "Show where the time of the last commands was spent (or export the traces to logs/traces.json)", None, ["last|export", "count"], True),
+            "slow": CommandDesc(ShowSlowCommandsCommand, "Show the slowest commands and reactions with the time spent per phase", None, ["count|reset"], True),
+            "profile": CommandDesc(ProfileCommand, "Start or stop the sampling profiler (with cprofile, every command is profiled with cProfile too)", ["start|stop"], ["cprofile"], True),
             "makectf": CommandDesc(MakeCTFCommand, "Turn the current channel into a CTF channel by setting the purpose. Requires reload to take effect", ["ctf_name"], None, True)
         }
 
@@ -31,6 +31,14 @@ class BaseHandler(ABC):
     def init(self, slack_wrapper):
         pass
 
+    def process_event(self, slack_wrapper, event):
+        """Called for every event received from the real-time messaging API."""
+        pass
+
+    def tick(self, slack_wrapper):
+        """Called periodically from the main loop for delayed work."""
+        pass
+
     def get_aliases_for_command(self, command):
         cmd_aliases = []
 
@@ -1,3 +1,4 @@
+import itertools
 import pickle
 import time
 from random import randint
@@ -7,12 +8,14 @@ from bottypes.challenge import Challenge
 from bottypes.command import Command
 from bottypes.command_descriptor import CommandDesc
 from bottypes.ctf import CTF
-from bottypes.player import Player
 from bottypes.reaction_descriptor import ReactionDesc
 from handlers import handler_factory
 from handlers.base_handler import BaseHandler
 from util.loghandler import log
-from util.solveposthelper import ST_GIT_SUPPORT, post_ctf_data
+from util.scheduler import Scheduler
+from util.solveposthelper import ST_GIT_SUPPORT, post_ctf_data, start_publisher
+from util.statusboard import STATUS_BOARD_INTERVAL, StatusBoards
+from util.statusregistry import StatusRegistry
 from util.util import *
 
 class SignupCommand():
@@ -37,9 +40,9 @@ class SignupCommand():
         # Ignore responses, because errors here don't matter
         if len(invites) > 0:
             response = slack_wrapper.invite_user(invites, ctf.channel_id)
+        # Challenge players are kept up to date from membership events
         for chall in get_challenges_for_ctf_id(ChallengeHandler.DB, ctf.channel_id):
-            current = slack_wrapper.get_channel_members(chall.channel_id)
-            invites = list(set(members)-set(current))
+            invites = list(set(members)-chall.players)
             if len(invites) > 0:
                 response = slack_wrapper.invite_user(invites, chall.channel_id)
 
@@ -63,9 +66,9 @@ class PopulateCommand():
         # Ignore responses, because errors here don't matter
         if len(invites) > 0:
             slack_wrapper.invite_user(invites, ctf.channel_id)
+        # Challenge players are kept up to date from membership events
         for chall in get_challenges_for_ctf_id(ChallengeHandler.DB, ctf.channel_id):
-            current = slack_wrapper.get_channel_members(chall.channel_id)
-            invites = list(set(members)-set(current))
+            invites = list(set(members)-chall.players)
             if len(invites) > 0:
                 slack_wrapper.invite_user(invites, chall.channel_id)
 
@@ -97,6 +100,7 @@ class AddChallengeTagCommand(Command):
             # Save challenge iff it was modified
             if dirty:
                 save_challenge(ChallengeHandler.DB, challenge)
+                ChallengeHandler.status_boards.mark_dirty(challenge.ctf_channel_id)
 
 
 class RemoveChallengeTagCommand(Command):
@@ -126,6 +130,7 @@ class RemoveChallengeTagCommand(Command):
             # Save challenge iff it was modified
             if dirty:
                 save_challenge(ChallengeHandler.DB, challenge)
+                ChallengeHandler.status_boards.mark_dirty(challenge.ctf_channel_id)
 
 
 class RollCommand(Command):
@@ -182,9 +187,8 @@ class AddCTFCommand(Command):
         ctf = CTF(ctf_channel_id, name, long_name)
 
         # Update list of CTFs
-        ctfs = pickle.load(open(ChallengeHandler.DB, "rb"))
-        ctfs[ctf.channel_id] = ctf
-        pickle.dump(ctfs, open(ChallengeHandler.DB, "wb"))
+        with ctf_transaction(ChallengeHandler.DB) as ctfs:
+            ctfs[ctf.channel_id] = ctf
 
         # Add purpose tag for persistance
         ChallengeHandler.update_ctf_purpose(slack_wrapper, ctf)
@@ -248,6 +252,7 @@ class RenameChallengeCommand(Command):
         # Update database
         update_challenge_name(ChallengeHandler.DB,
                               challenge.channel_id, new_name)
+        ChallengeHandler.status_boards.mark_dirty(ctf.channel_id)
 
         text = "Challenge `{}` renamed to `{}` (#{})".format(old_name, new_name, new_channel_name)
         slack_wrapper.post_message(channel_id, text)
@@ -256,6 +261,32 @@ class RenameChallengeCommand(Command):
 class RenameCTFCommand(Command):
     """Renames an existing challenge channel."""
 
+    @classmethod
+    def rename_challenge_channels(cls, slack_wrapper, ctf, new_name, progress_ts):
+        """
+        Rename all challenge channels of the ctf concurrently, updating the progress message on the way.
+        The challenge purposes only reference the ctf by its channel id, so they don't need to be updated.
+        Return a list of (challenge, error) tuples for channels, which couldn't be renamed.
+        """
+        failed = []
+        last_update = time.time()
+
+        def rename(challenge):
+            return slack_wrapper.rename_channel(
+                challenge.channel_id, "{}-{}".format(new_name, challenge.name), is_private=True)
+
+        for done, (challenge, response) in enumerate(
+                process_concurrently(rename, ctf.challenges, ChallengeHandler.BULK_WORKERS), 1):
+            if not response or not response["ok"]:
+                failed.append((challenge, response["error"] if response else "unknown"))
+
+            if progress_ts and time.time() - last_update >= ChallengeHandler.PROGRESS_UPDATE_INTERVAL:
+                last_update = time.time()
+                slack_wrapper.update_message(ctf.channel_id, progress_ts, "Renaming challenge channels... ({}/{})".format(
+                    done, len(ctf.challenges)))
+
+        return failed
+
     @classmethod
     def execute(cls, slack_wrapper, args, timestamp, channel_id, user_id, user_is_admin):
         old_name = args[0].lower()
@@ -283,7 +314,8 @@ class RenameCTFCommand(Command):
             raise InvalidCommand("Rename CTF failed: Invalid characters for CTF name found.")
 
         text = "Renaming the CTF might take some time depending on active channels..."
-        slack_wrapper.post_message(ctf.channel_id, text)
+        response = slack_wrapper.send_message(ctf.channel_id, text)
+        progress_ts = response["ts"] if response and response["ok"] else None
 
         # Rename the ctf channel
         response = slack_wrapper.rename_channel(ctf.channel_id, new_name)
@@ -291,19 +323,28 @@ class RenameCTFCommand(Command):
         if not response['ok']:
             raise InvalidCommand("\"{}\" channel rename failed:\nError : {}".format(old_name, response['error']))
 
-        # Update channel purpose
-        slack_wrapper.update_channel_purpose_name(ctf.channel_id, new_name)
+        # Update database and channel purpose (no need to fetch the old purpose, the database has it all)
+        with ctf_transaction(ChallengeHandler.DB) as ctfs:
+            ctf = ctfs[ctf.channel_id]
+            ctf.name = new_name
 
-        # Update database
-        update_ctf_name(ChallengeHandler.DB, ctf.channel_id, new_name)
+        ChallengeHandler.update_ctf_purpose(slack_wrapper, ctf)
 
         # Rename all challenge channels for this ctf
-        for chall in ctf.challenges:
-            RenameChallengeCommand().execute(
-                slack_wrapper, [chall.name, chall.name], timestamp, ctf.channel_id, user_id, user_is_admin)
+        failed = cls.rename_challenge_channels(slack_wrapper, ctf, new_name, progress_ts)
+
+        ChallengeHandler.status_boards.mark_dirty(ctf.channel_id)
 
         text = "CTF `{}` renamed to `{}` (#{})".format(old_name, new_name, new_name)
-        slack_wrapper.post_message(ctf.channel_id, text)
+
+        if failed:
+            text += "\nRenaming failed for: {}".format(
+                ", ".join("{} ({})".format(chall.name, error) for chall, error in failed))
+
+        if progress_ts:
+            slack_wrapper.update_message(ctf.channel_id, progress_ts, text)
+        else:
+            slack_wrapper.post_message(ctf.channel_id, text)
 
 
 class AddChallengeCommand(Command):
@@ -369,10 +410,11 @@ class AddChallengeCommand(Command):
         challenge = Challenge(ctf.channel_id, challenge_channel_id, name, category)
 
         # Update database
-        ctfs = pickle.load(open(ChallengeHandler.DB, "rb"))
-        ctf = ctfs[ctf.channel_id]
-        ctf.add_challenge(challenge)
-        pickle.dump(ctfs, open(ChallengeHandler.DB, "wb"))
+        with ctf_transaction(ChallengeHandler.DB) as ctfs:
+            ctf = ctfs[ctf.channel_id]
+            ctf.add_challenge(challenge)
+
+        ChallengeHandler.status_boards.mark_dirty(ctf.channel_id)
 
         # Notify the channel
         text = "New challenge *{0}* created in private channel (type `!workon {0}` to join).".format(name)
@@ -408,6 +450,7 @@ class RemoveChallengeCommand(Command):
         # Remove the challenge channel and ctf challenge entry
         slack_wrapper.archive_private_channel(challenge.channel_id)
         remove_challenge_by_channel_id(ChallengeHandler.DB, challenge.channel_id, ctf.channel_id)
+        ChallengeHandler.status_boards.mark_dirty(ctf.channel_id)
 
         # Show confirmation message
         member = slack_wrapper.get_member(user_id)
@@ -423,23 +466,26 @@ class UpdateStatusCommand(Command):
     """
 
     @classmethod
-    def execute(cls, slack_wrapper, args, timestamp, channel_id, user_id, user_is_admin):
-        """Execute the UpdateStatus command."""
+    def refresh_status(cls, slack_wrapper, args, channel_id, user_id, user_is_admin, verbose):
+        """Rebuild a registered status message with its original settings."""
         timestamp = args["timestamp"]
 
-        # Check message content, if the emoji was placed on a status message
-        # (no tagging atm, so just check it starts like a status message)
-        result = slack_wrapper.get_message(channel_id, timestamp)
+        # Only refresh status messages posted by the bot (and ignore repeated clicks)
+        status_message = ChallengeHandler.status_registry.acquire_refresh(channel_id, timestamp)
 
-        if result["ok"] and result["messages"]:
-            if "==========" in result["messages"][0]["text"]:
-                # check if status contained a category and only update for category then
-                category_match = re.search(r"=== .*? \[(.*?)\] ====", result["messages"][0]["text"], re.S)
-                category = category_match.group(1) if category_match else ""
+        if status_message and status_message.verbose == verbose:
+            pages, _ = StatusCommand.build_status_pages(slack_wrapper, channel_id, status_message.verbose,
+                                                        status_message.category, status_message.unsolved_only)
+            command = StatusCommand.page_command(status_message.category, status_message.unsolved_only)
+            _, status = next(StatusCommand.paginate(pages, status_message.page, 1, command),
+                             (status_message.page, "*This status page is empty now*"))
 
-                status, _ = StatusCommand().build_status_message(slack_wrapper, None, channel_id, user_id, user_is_admin, True, category)
+            slack_wrapper.update_message(channel_id, timestamp, status)
 
-                slack_wrapper.update_message(channel_id, timestamp, status)
+    @classmethod
+    def execute(cls, slack_wrapper, args, timestamp, channel_id, user_id, user_is_admin):
+        """Execute the UpdateStatus command."""
+        cls.refresh_status(slack_wrapper, args, channel_id, user_id, user_is_admin, True)
 
 
 class UpdateShortStatusCommand(Command):
@@ -450,18 +496,7 @@ class UpdateShortStatusCommand(Command):
     @classmethod
     def execute(cls, slack_wrapper, args, timestamp, channel_id, user_id, user_is_admin):
         """Execute the UpdateStatus command."""
-        timestamp = args["timestamp"]
-
-        # Check message content, if the emoji was placed on a status message
-        # (no tagging atm, so just check it starts like a status message)
-        result = slack_wrapper.get_message(channel_id, timestamp)
-
-        if result["ok"] and result["messages"]:
-            text = result["messages"][0]["text"]
-            if "solved /" in text or "no running CTFs" in text:
-                status, _ = StatusCommand().build_status_message(slack_wrapper, None, channel_id, user_id, user_is_admin, False)
-
-                slack_wrapper.update_message(channel_id, timestamp, status)
+        UpdateStatusCommand.refresh_status(slack_wrapper, args, channel_id, user_id, user_is_admin, False)
 
 
 class StatusCommand(Command):
@@ -469,6 +504,8 @@ class StatusCommand(Command):
     Get a status of the currently running CTFs.
     """
 
+    STATUS_MESSAGE_LIMIT = 3900     # characters per status message (slack recommends at most 4000)
+
     @classmethod
     def build_short_status(cls, ctf_list):
         """Build short status list."""
@@ -519,23 +556,45 @@ class StatusCommand(Command):
         return ', '.join(human_readable(relativedelta(seconds=timespan)))
 
     @classmethod
-    def build_verbose_status(cls, slack_wrapper, ctf_list, check_for_finish, category):
-        """Build verbose status list."""
+    def get_member_names(cls, slack_wrapper):
+        """Return the display names of all members by user id."""
         member_list = slack_wrapper.get_members()
 
         # Bail out, if we couldn't read member list
         if not "members" in member_list:
             raise InvalidCommand("Status failed. Could not refresh member list...")
 
-        members = {m["id"]: get_display_name_from_user(m)
-                   for m in member_list['members']}
+        return {m["id"]: get_display_name_from_user(m) for m in member_list['members']}
+
+    @classmethod
+    def select_challenges(cls, ctf, query):
+        """Return the challenges of a CTF matching a status query (`tag:<tag>`, `cat:<category>` or a category)."""
+        if not query:
+            return ctf.challenges
+
+        if query.startswith("tag:"):
+            return ctf.challenges_with_tag(query[len("tag:"):])
+
+        if query.startswith("cat:"):
+            query = query[len("cat:"):]
 
-        response = ""
+        return ctf.challenges_in_category(query)
+
+    @classmethod
+    def iter_verbose_status(cls, members, ctf_list, check_for_finish, category, unsolved_only=False):
+        """Yield the verbose status list CTF by CTF."""
         for ctf in ctf_list:
-            # Build long status list
-            solved = sorted([c for c in ctf.challenges if c.is_solved and (
-                not category or c.category == category)], key=lambda x: x.solve_date)
-            unsolved = [c for c in ctf.challenges if not c.is_solved and (not category or c.category == category)]
+            # Finished CTFs have no unsolved challenges to show
+            if unsolved_only and check_for_finish and ctf.finished:
+                continue
+
+            response = ""
+
+            # Build long status list (only from the challenges matching the query)
+            challenges = cls.select_challenges(ctf, category)
+            solved = [] if unsolved_only else sorted([c for c in challenges if c.is_solved],
+                                                     key=lambda x: x.solve_date)
+            unsolved = [c for c in challenges if not c.is_solved]
 
             # Don't show ctfs not having a category challenge if filter is active
             if category and not solved and not unsolved:
@@ -550,15 +609,16 @@ class StatusCommand(Command):
             # Check if the CTF has any challenges
             if check_for_finish and ctf.finished and not solved:
                 response += "*[ No challenges solved ]*\n"
+                yield response
                 continue
             elif not solved and not unsolved:
-                response += "*[ No challenges available yet ]*\n"
+                response += "*[ No challenges {} ]*\n".format("left" if unsolved_only else "available yet")
+                yield response
                 continue
 
             # Solved challenges
             response += "* > Solved*\n" if solved else ""
             for challenge in solved:
-                players = []
                 response += ":tada: *{}*{} (Solved by : {})\n".format(
                     challenge.name,
                     " ({})".format(challenge.category) if challenge.category else "",
@@ -578,9 +638,17 @@ class StatusCommand(Command):
                     response += "[{} active] *{}* {}: {}\n".  format(
                         len(players),
                         challenge.name,
-                        "[{}]".format(", ".join(challenge.tags)) if len(challenge.tags) > 0 else "",
+                        "[{}]".format(", ".join(sorted(challenge.tags))) if len(challenge.tags) > 0 else "",
                         "({})".format(challenge.category) if challenge.category else "")
-        response = response.strip()
+
+            yield response
+
+    @classmethod
+    def build_verbose_status(cls, slack_wrapper, ctf_list, check_for_finish, category):
+        """Build verbose status list."""
+        members = cls.get_member_names(slack_wrapper)
+
+        response = "".join(cls.iter_verbose_status(members, ctf_list, check_for_finish, category)).strip()
 
         if response == "":  # Response is empty
             response += "*There are currently no running CTFs*"
@@ -588,9 +656,12 @@ class StatusCommand(Command):
         return response
 
     @classmethod
-    def build_status_message(cls, slack_wrapper, args, channel_id, user_id, user_is_admin, verbose=True, category=""):
-        """Gathers the ctf information and builds the status response."""
-        ctfs = pickle.load(open(ChallengeHandler.DB, "rb"))
+    def build_status_pages(cls, slack_wrapper, channel_id, verbose=True, category="", unsolved_only=False):
+        """
+        Gathers the ctf information and returns a generator, which renders the status
+        message by message (pages of at most STATUS_MESSAGE_LIMIT characters).
+        """
+        ctfs = load_ctfs(ChallengeHandler.DB)
 
         # Check if the user is in a ctf channel
         current_ctf = get_ctf_by_channel_id(ChallengeHandler.DB, channel_id)
@@ -600,33 +671,167 @@ class StatusCommand(Command):
             check_for_finish = False
             verbose = True              # override verbose for ctf channels
         else:
-            ctf_list = ctfs.values()
+            ctf_list = list(ctfs.values())
             check_for_finish = True
 
-        if verbose:
-            response = cls.build_verbose_status(slack_wrapper, ctf_list, check_for_finish, category)
-        else:
-            response = cls.build_short_status(ctf_list)
+        if not verbose:
+            return iter([cls.build_short_status(ctf_list)]), verbose
 
-        return response, verbose
+        members = cls.get_member_names(slack_wrapper)
+
+        def render():
+            empty = True
+
+            for page in chunk_text(cls.iter_verbose_status(members, ctf_list, check_for_finish, category,
+                                                           unsolved_only), cls.STATUS_MESSAGE_LIMIT):
+                empty = False
+                yield page
+
+            if empty:
+                yield "*There are currently no running CTFs*"
+
+        return render(), verbose
+
+    @classmethod
+    def page_command(cls, category="", unsolved_only=False):
+        """Return the status command, which shows the other pages of a status."""
+        return " ".join(["!ctf status"] + (["--unsolved"] if unsolved_only else []) + ([category] if category else []))
+
+    @classmethod
+    def paginate(cls, pages, first_page=1, count=None, command="!ctf status"):
+        """
+        Yield (page number, text) for count pages beginning at first_page.
+        If the status spans multiple pages, every page gets a footer with its number
+        (and the command showing the next page).
+        """
+        pages = itertools.islice(pages, first_page - 1, None)
+        number = first_page
+        current = next(pages, None)
+
+        while current is not None and (count is None or number < first_page + count):
+            following = next(pages, None)
+
+            if following is not None:
+                current += "\n_Page {}, continued with_ `{} --page {}`".format(number, command, number + 1)
+            elif number > 1:
+                current += "\n_Page {}_".format(number)
+
+            yield number, current
+
+            current = following
+            number += 1
+
+    @classmethod
+    def parse_args(cls, args):
+        """
+        Parse `[-v] [--unsolved] [--page N] [category|cat:<category>|tag:<tag>]`
+        and return (verbose, query, page, unsolved_only).
+        """
+        verbose = False
+        unsolved_only = False
+        page = None
+        positional = []
+
+        args = iter(args)
+
+        for arg in args:
+            if arg == "-v":
+                verbose = True
+            elif arg == "--unsolved":
+                unsolved_only = True
+            elif arg == "--page":
+                try:
+                    page = int(next(args))
+                except (StopIteration, ValueError):
+                    page = 0
+
+                if page < 1:
+                    raise InvalidCommand("Usage: `!ctf status [-v] [--unsolved] [--page <number>] "
+                                         "[category|cat:<category>|tag:<tag>]`")
+            else:
+                positional.append(arg)
+
+        query = positional[0] if positional else ""
+
+        # A slice of the status only makes sense for the verbose status
+        verbose = verbose or unsolved_only or page is not None or query.startswith(("tag:", "cat:"))
+
+        return verbose, query, page, unsolved_only
 
     @classmethod
     def execute(cls, slack_wrapper, args, timestamp, channel_id, user_id, user_is_admin):
         """Execute the Status command."""
-        verbose = args[0] == "-v" if args else False
+        verbose, category, page, unsolved_only = cls.parse_args(args)
 
-        if verbose:
-            category = args[1] if len(args) > 1 else ""
-        else:
-            category = args[0] if args else ""
+        pages, verbose = cls.build_status_pages(slack_wrapper, channel_id, verbose, category, unsolved_only)
+        reaction = "arrows_clockwise" if verbose else "arrows_counterclockwise"
+        posted = False
 
-        response, verbose = cls.build_status_message(
-            slack_wrapper, args, channel_id, user_id, user_is_admin, verbose, category)
+        # Only a single page is posted, its footer tells how to get the next one
+        for number, response in cls.paginate(pages, page or 1, 1, cls.page_command(category, unsolved_only)):
+            result = slack_wrapper.post_message_with_react(channel_id, response, reaction)
+            posted = True
 
-        if verbose:
-            slack_wrapper.post_message_with_react(channel_id, response, "arrows_clockwise")
-        else:
-            slack_wrapper.post_message_with_react(channel_id, response, "arrows_counterclockwise")
+            # Remember the status message, so refresh reactions can be handled without reading it back
+            if result and result["ok"]:
+                ChallengeHandler.status_registry.register(channel_id, result["ts"], verbose, category, number,
+                                                          unsolved_only)
+
+        if not posted:
+            raise InvalidCommand("Status page {} doesn't exist.".format(page))
+
+
+class StatusBoardCommand(Command):
+    """
+    Post a live status board for the CTF and pin it. The board is edited whenever
+    challenges are added, removed, worked on or solved.
+    """
+
+    @classmethod
+    def render_board(cls, slack_wrapper, ctf_channel_id):
+        """
+        Build the status board text for a CTF (or None, if the CTF doesn't exist anymore).
+        The board only shows the first page of the status, so it fits into a single message.
+        """
+        ctf = load_ctfs(ChallengeHandler.DB).get(ctf_channel_id)
+
+        if not ctf:
+            return None
+
+        pages, _ = StatusCommand.build_status_pages(slack_wrapper, ctf.channel_id)
+        status = next(pages)
+
+        if next(pages, None) is not None:
+            status += "\n_More challenges with_ `!ctf status`"
+
+        return "{}\n_Live status board, last update: {}_".format(status, time.strftime("%H:%M:%S"))
+
+    @classmethod
+    def execute(cls, slack_wrapper, args, timestamp, channel_id, user_id, user_is_admin):
+        """Execute the StatusBoard command."""
+        ctf = get_ctf_by_channel_id(ChallengeHandler.DB, channel_id)
+
+        if not ctf or ctf.channel_id != channel_id:
+            raise InvalidCommand("Status board failed: You are not in a CTF channel.")
+
+        # Replace (or with "off" just remove) an existing board
+        old_ts = ChallengeHandler.status_boards.remove(ctf.channel_id)
+
+        if old_ts:
+            slack_wrapper.unpin_message(ctf.channel_id, old_ts)
+
+        if args and args[0].lower() == "off":
+            slack_wrapper.post_message(channel_id, "Status board for *{}* disabled.".format(ctf.name))
+            return
+
+        result = slack_wrapper.send_message(ctf.channel_id, cls.render_board(slack_wrapper, ctf.channel_id))
+
+        if not result or not result["ok"]:
+            raise InvalidCommand("Status board failed: Couldn't post the board ({}).".format(
+                result.get("error") if result else "no response"))
+
+        slack_wrapper.pin_message(ctf.channel_id, result["ts"])
+        ChallengeHandler.status_boards.add(ctf.channel_id, result["ts"])
 
 
 class WorkonCommand(Command):
@@ -648,8 +853,8 @@ class WorkonCommand(Command):
         # Get challenge object for challenge name or channel id
         challenge = ""
         if challenge_name:
-            challenge = get_challenge_by_name(ChallengeHandler.DB,
-                                              challenge_name, channel_id)
+            challenge = find_challenge_by_name(ChallengeHandler.DB,
+                                               challenge_name, channel_id)
         else:
             challenge = get_challenge_by_channel_id(ChallengeHandler.DB,
                                                     channel_id)
@@ -665,14 +870,57 @@ class WorkonCommand(Command):
         slack_wrapper.invite_user(user_id, challenge.channel_id, is_private=True)
 
         # Update database
-        ctfs = pickle.load(open(ChallengeHandler.DB, "rb"))
+        with ctf_transaction(ChallengeHandler.DB) as ctfs:
+            for ctf in ctfs.values():
+                for chal in ctf.challenges:
+                    if chal.channel_id == challenge.channel_id:
+                        chal.add_player(user_id)
+                        ctf.update_challenge(chal)
+                        break
+
+        ChallengeHandler.status_boards.mark_dirty(challenge.ctf_channel_id)
+
+
+class ShowWorkCommand(Command):
+    """
+    Show the challenges a player is working on in all CTFs.
+    """
+
+    @classmethod
+    def build_work_message(cls, user_id):
+        """Build the list of challenges a user works on (answered from the player index of the CTFs)."""
+        work = get_work_of_user_id(ChallengeHandler.DB, user_id)
 
-        for ctf in ctfs.values():
-            for chal in ctf.challenges:
-                if chal.channel_id == challenge.channel_id:
-                    chal.add_player(Player(user_id))
+        if not work:
+            return "<@{}> isn't working on any challenge.".format(user_id)
 
-        pickle.dump(ctfs, open(ChallengeHandler.DB, "wb"))
+        response = "*<@{}> is working on:*\n".format(user_id)
+
+        for ctf, challenges in work:
+            response += "*#{}*{} : {}\n".format(
+                ctf.name, " (finished)" if ctf.finished else "",
+                ", ".join("{}{}{}".format(challenge.name,
+                                          " ({})".format(challenge.category) if challenge.category else "",
+                                          " :tada:" if challenge.is_solved else "")
+                          for challenge in challenges))
+
+        return response.strip()
+
+    @classmethod
+    def execute(cls, slack_wrapper, args, timestamp, channel_id, user_id, user_is_admin):
+        """Execute the ShowWork command."""
+        slack_wrapper.post_message(channel_id, cls.build_work_message(user_id))
+
+
+class WhoCommand(ShowWorkCommand):
+    """
+    Show the challenges another player is working on in all CTFs.
+    """
+
+    @classmethod
+    def execute(cls, slack_wrapper, args, timestamp, channel_id, user_id, user_is_admin):
+        """Execute the Who command."""
+        slack_wrapper.post_message(channel_id, cls.build_work_message(parse_user_id(args[0])))
 
 
 class SolveCommand(Command):
@@ -719,48 +967,44 @@ class SolveCommand(Command):
                 solver_list.append(add_solve)
                 additional_solver.append(add_solve)
 
-        # Update database
-        ctfs = pickle.load(open(ChallengeHandler.DB, "rb"))
-
-        for ctf in ctfs.values():
-            for chal in ctf.challenges:
-                if chal.channel_id == challenge.channel_id:
-                    if not challenge.is_solved:
-                        # Check for finished ctf
-                        if ctf.finished and not user_is_admin:
-                            raise InvalidCommand("Solve challenge faild: CTF *{}* is over...".format(ctf.name))
+        if challenge.is_solved:
+            return
 
-                        member = slack_wrapper.get_member(user_id)
-                        solver_list = [get_display_name(member)] + additional_solver
+        # Update database
+        with ctf_transaction(ChallengeHandler.DB) as ctfs:
+            ctf = ctfs[challenge.ctf_channel_id]
+            chal = next(chal for chal in ctf.challenges if chal.channel_id == challenge.channel_id)
 
-                        chal.mark_as_solved(solver_list)
+            # Check for finished ctf
+            if ctf.finished and not user_is_admin:
+                raise InvalidCommand("Solve challenge faild: CTF *{}* is over...".format(ctf.name))
 
-                        pickle.dump(ctfs, open(ChallengeHandler.DB, "wb"))
+            chal.mark_as_solved(solver_list)
 
-                        # Update channel purpose
-                        purpose = dict(ChallengeHandler.CHALL_PURPOSE)
-                        purpose['name'] = challenge.name
-                        purpose['ctf_id'] = ctf.channel_id
-                        purpose['solved'] = solver_list
-                        purpose['solve_date'] = chal.solve_date
-                        purpose['category'] = chal.category
+        ChallengeHandler.status_boards.mark_dirty(ctf.channel_id)
 
-                        purpose = json.dumps(purpose)
-                        slack_wrapper.set_purpose(challenge.channel_id, purpose, is_private=True)
+        # Update channel purpose
+        purpose = dict(ChallengeHandler.CHALL_PURPOSE)
+        purpose['name'] = challenge.name
+        purpose['ctf_id'] = ctf.channel_id
+        purpose['solved'] = solver_list
+        purpose['solve_date'] = chal.solve_date
+        purpose['category'] = chal.category
 
-                        # Announce the CTF channel
-                        help_members = ""
+        purpose = json.dumps(purpose)
+        slack_wrapper.set_purpose(challenge.channel_id, purpose, is_private=True)
 
-                        if additional_solver:
-                            help_members = "(together with {})".format(", ".join(additional_solver))
+        # Announce the CTF channel
+        help_members = ""
 
-                        message = "@here *{}* : {} has solved the \"{}\" challenge {}".format(
-                            challenge.name, get_display_name(member), challenge.name, help_members)
-                        message += "."
+        if additional_solver:
+            help_members = "(together with {})".format(", ".join(additional_solver))
 
-                        slack_wrapper.post_message(ctf.channel_id, message)
+        message = "@here *{}* : {} has solved the \"{}\" challenge {}".format(
+            challenge.name, get_display_name(member), challenge.name, help_members)
+        message += "."
 
-                    break
+        slack_wrapper.post_message(ctf.channel_id, message)
 
 
 class UnsolveCommand(Command):
@@ -782,40 +1026,87 @@ class UnsolveCommand(Command):
         if not challenge:
             raise InvalidCommand("This challenge does not exist.")
 
+        if not challenge.is_solved:
+            raise InvalidCommand("This challenge isn't marked as solve.")
+
+        member = slack_wrapper.get_member(user_id)
+
         # Update database
-        ctfs = pickle.load(open(ChallengeHandler.DB, "rb"))
+        with ctf_transaction(ChallengeHandler.DB) as ctfs:
+            ctf = ctfs[challenge.ctf_channel_id]
+            chal = next(chal for chal in ctf.challenges if chal.channel_id == challenge.channel_id)
+            chal.unmark_as_solved()
 
-        for ctf in ctfs.values():
-            for chal in ctf.challenges:
-                if chal.channel_id == challenge.channel_id:
-                    if challenge.is_solved:
-                        member = slack_wrapper.get_member(user_id)
+        ChallengeHandler.status_boards.mark_dirty(ctf.channel_id)
 
-                        chal.unmark_as_solved()
+        # Update channel purpose
+        purpose = dict(ChallengeHandler.CHALL_PURPOSE)
+        purpose['name'] = challenge.name
+        purpose['ctf_id'] = ctf.channel_id
+        purpose['category'] = challenge.category
 
-                        pickle.dump(ctfs, open(ChallengeHandler.DB, "wb"))
+        purpose = json.dumps(purpose)
+        slack_wrapper.set_purpose(challenge.channel_id, purpose, is_private=True)
 
-                        # Update channel purpose
-                        purpose = dict(ChallengeHandler.CHALL_PURPOSE)
-                        purpose['name'] = challenge.name
-                        purpose['ctf_id'] = ctf.channel_id
-                        purpose['category'] = challenge.category
+        # Announce the CTF channel
+        message = "@here *{}* : {} has reset the solve on the \"{}\" challenge.".format(
+            challenge.name, get_display_name(member), challenge.name)
+        slack_wrapper.post_message(ctf.channel_id, message)
 
-                        purpose = json.dumps(purpose)
-                        slack_wrapper.set_purpose(challenge.channel_id, purpose, is_private=True)
 
-                        # Announce the CTF channel
-                        message = "@here *{}* : {} has reset the solve on the \"{}\" challenge.".format(
-                            challenge.name, get_display_name(member), challenge.name)
-                        slack_wrapper.post_message(ctf.channel_id, message)
+class ArchiveCTFCommand(Command):
+    """Archive the challenge channels for a given CTF."""
 
-                        return
+    # Errors, which mean that the channel doesn't have to be archived (anymore)
+    ARCHIVED_ERRORS = ("already_archived", "channel_not_found")
 
-                    raise InvalidCommand("This challenge isn't marked as solve.")
+    @classmethod
+    def load_checkpoints(cls):
+        """Load the progress of interrupted archive runs (ctf channel id => checkpoint)."""
+        try:
+            with open(ChallengeHandler.ARCHIVE_CHECKPOINTS, "rb") as f:
+                return pickle.load(f)
+        except (IOError, EOFError, pickle.UnpicklingError):
+            return {}
 
+    @classmethod
+    def save_checkpoint(cls, ctf_channel_id, checkpoint):
+        """Store (or remove, if checkpoint is None) the archive progress of a CTF."""
+        checkpoints = cls.load_checkpoints()
 
-class ArchiveCTFCommand(Command):
-    """Archive the challenge channels for a given CTF."""
+        if checkpoint is None:
+            checkpoints.pop(ctf_channel_id, None)
+        else:
+            checkpoints[ctf_channel_id] = checkpoint
+
+        with open(ChallengeHandler.ARCHIVE_CHECKPOINTS, "wb") as f:
+            pickle.dump(checkpoints, f)
+
+    @classmethod
+    def archive_challenge_channels(cls, slack_wrapper, ctf, checkpoint):
+        """
+        Archive the challenge channels of the CTF concurrently, skipping channels
+        which were archived by a previous (interrupted) run.
+        Progress is checkpointed regularly, so an interrupted run can be resumed.
+        Return a list of (challenge, error) tuples for challenges, which couldn't be archived.
+        """
+        pending = [chall for chall in ctf.challenges if chall.channel_id not in checkpoint["archived"]]
+        failed = []
+
+        def archive(challenge):
+            return slack_wrapper.archive_channel(challenge.channel_id)
+
+        for done, (challenge, response) in enumerate(
+                process_concurrently(archive, pending, ChallengeHandler.BULK_WORKERS), 1):
+            if response["ok"] or response.get("error") in cls.ARCHIVED_ERRORS:
+                checkpoint["archived"].add(challenge.channel_id)
+            else:
+                failed.append((challenge, response.get("error")))
+
+            if done % ChallengeHandler.ARCHIVE_CHECKPOINT_INTERVAL == 0:
+                cls.save_checkpoint(ctf.channel_id, checkpoint)
+
+        return failed
 
     @classmethod
     def execute(cls, slack_wrapper, args, timestamp, channel_id, user_id, user_is_admin):
@@ -826,37 +1117,52 @@ class ArchiveCTFCommand(Command):
         if not ctf or ctf.channel_id != channel_id:
             raise InvalidCommand("Archive CTF failed: You are not in a CTF channel.")
 
-        # Post solves if git support is enabled
-        if ST_GIT_SUPPORT:
+        checkpoint = cls.load_checkpoints().get(ctf.channel_id, {"posted": False, "archived": set()})
+
+        # Post solves if git support is enabled (and it wasn't done by an interrupted archive run)
+        if ST_GIT_SUPPORT and not checkpoint["posted"]:
             try:
                 if not no_post:
                     if not ctf.long_name:
                         raise InvalidCommand(
                             "The CTF has no long name set. Please fix the ctf purpose and reload ctf data before archiving this ctf.")
 
-                    solve_tracker_url = post_ctf_data(ctf, ctf.long_name)
+                    pending = post_ctf_data(ctf, ctf.long_name, user_id)
 
-                    message = "Post was successfully uploaded to: {}".format(solve_tracker_url)
+                    message = "Solve post queued for upload ({} pending), you'll get a message when it's done...".format(
+                        pending)
                     slack_wrapper.post_message(channel_id, message)
 
+                    checkpoint["posted"] = True
+
             except Exception as ex:
                 raise InvalidCommand(str(ex))
 
-        # Get list of challenges
-        challenges = get_challenges_for_ctf_id(ChallengeHandler.DB, channel_id)
+        failed = cls.archive_challenge_channels(slack_wrapper, ctf, checkpoint)
+
+        if failed:
+            cls.save_checkpoint(ctf.channel_id, checkpoint)
+
+            errors = ", ".join(sorted(set(error or "unknown" for _, error in failed)))
+            raise InvalidCommand(
+                "Archive CTF interrupted: {} of {} channels couldn't be archived ({}). Run `archivectf` again to resume.".format(
+                    len(failed), len(ctf.challenges), errors))
 
         message = "Archived the following channels :\n"
-        for challenge in challenges:
+        for challenge in ctf.challenges:
             message += "- #{}-{}\n".format(ctf.name, challenge.name)
-            slack_wrapper.archive_channel(challenge.channel_id)
-            remove_challenge_by_channel_id(ChallengeHandler.DB, challenge.channel_id, ctf.channel_id)
 
-        # Remove possible configured reminders for this ctf
-        cleanup_reminders(slack_wrapper, handler_factory, ctf)
+        # Remove pending reminders for this ctf
+        ChallengeHandler.scheduler.cancel_key(ctf.channel_id)
 
-        # Stop tracking the main CTF channel
+        # Stop tracking the main CTF channel (and all its challenges) in one go
         slack_wrapper.set_purpose(channel_id, "")
-        remove_ctf_by_channel_id(ChallengeHandler.DB, ctf.channel_id)
+
+        with ctf_transaction(ChallengeHandler.DB) as ctfs:
+            ctfs.pop(ctf.channel_id, None)
+
+        cls.save_checkpoint(ctf.channel_id, None)
+        ChallengeHandler.status_boards.remove(ctf.channel_id)
 
         # Show confirmation message
         slack_wrapper.post_message(channel_id, message)
@@ -864,13 +1170,6 @@ class ArchiveCTFCommand(Command):
         # If configured to do so, archive the main CTF channel also to cleanup
         if handler_factory.botserver.get_config_option('archive_everything'):
             slack_wrapper.archive_channel(channel_id)
-        else:
-            # Otherwise, just set the ctf to finished
-            if not ctf.finished:
-                ctf.finished = True
-                ctf.finished_on = int(time.time())
-
-
 
 
 class EndCTFCommand(Command):
@@ -881,21 +1180,28 @@ class EndCTFCommand(Command):
 
     @classmethod
     def handle_archive_reminder(cls, slack_wrapper, ctf):
-        """Sets a reminder for admins to archive this ctf in a set time."""
+        """Schedules a reminder for admins to archive this ctf in a set time."""
         reminder_offset = handler_factory.botserver.get_config_option("archive_ctf_reminder_offset")
 
         if not reminder_offset:
             return
 
+        ChallengeHandler.scheduler.schedule("archive_reminder", float(reminder_offset) * 3600, ctf.channel_id,
+                                            {"ctf_id": ctf.channel_id})
+
+    @classmethod
+    def send_archive_reminder(cls, slack_wrapper, data):
+        """Remind the admins to archive a ctf (if it still exists)."""
+        ctf = load_ctfs(ChallengeHandler.DB).get(data["ctf_id"])
         admin_users = handler_factory.botserver.get_config_option("admin_users")
 
-        if not admin_users:
+        if not ctf or not admin_users:
             return
 
         msg = "CTF {} - {} (#{}) should be archived.".format(ctf.name, ctf.long_name, ctf.name)
 
         for admin in admin_users:
-            slack_wrapper.add_reminder_hours(admin, msg, reminder_offset)
+            slack_wrapper.post_message(admin, msg)
 
     @classmethod
     def execute(cls, slack_wrapper, args, timestamp, channel_id, user_id, user_is_admin):
@@ -917,6 +1223,7 @@ class EndCTFCommand(Command):
 
         if ctf:
             ChallengeHandler.update_ctf_purpose(slack_wrapper, ctf)
+            ChallengeHandler.status_boards.mark_dirty(ctf.channel_id)
             cls.handle_archive_reminder(slack_wrapper, ctf)
             slack_wrapper.post_message(channel_id, "CTF *{}* finished...".format(ctf.name))
 
@@ -929,7 +1236,7 @@ class ReloadCommand(Command):
         """Execute the Reload command."""
 
         slack_wrapper.post_message(channel_id, "Updating CTFs and challenges...")
-        ChallengeHandler.update_database_from_slack(slack_wrapper)
+        ChallengeHandler.update_database_from_slack(slack_wrapper, refresh_players=False)
         slack_wrapper.post_message(channel_id, "Update finished...")
 
 
@@ -1005,6 +1312,17 @@ class ChallengeHandler(BaseHandler):
     """
 
     DB = "databases/challenge_handler.bin"
+    ARCHIVE_CHECKPOINTS = "databases/archive_checkpoints.bin"
+    STATUS_MESSAGES = "databases/status_messages.bin"
+    STATUS_BOARDS = "databases/status_boards.bin"
+    SCHEDULER = "databases/scheduler.bin"
+    scheduler = None
+    status_registry = None
+    status_boards = None
+    BULK_WORKERS = 4
+    PROGRESS_UPDATE_INTERVAL = 2
+    ARCHIVE_CHECKPOINT_INTERVAL = 10
+
     CTF_PURPOSE = {
         "ota_bot": "OTABOT",
         "name": "",
@@ -1030,7 +1348,10 @@ class ChallengeHandler(BaseHandler):
             "addctf": CommandDesc(AddCTFCommand, "Adds a new ctf", ["ctf_name", "long_name"], None),
             "addchallenge": CommandDesc(AddChallengeCommand, "Adds a new challenge for current ctf", ["challenge_name"], ["challenge_category"]),
             "workon": CommandDesc(WorkonCommand, "Show that you're working on a challenge", None, ["challenge_name"]),
-            "status": CommandDesc(StatusCommand, "Show the status for all ongoing ctf's", None, ["category"]),
+            "mywork": CommandDesc(ShowWorkCommand, "Show the challenges you're working on in all ctf's", None, None),
+            "who": CommandDesc(WhoCommand, "Show the challenges a user is working on in all ctf's", ["@user"], None),
+            "status": CommandDesc(StatusCommand, "Show the status for all ongoing ctf's (split into pages for big ctfs)", None, ["-v", "--unsolved", "--page <number>", "category|cat:<category>|tag:<tag>"]),
+            "board": CommandDesc(StatusBoardCommand, "Post a pinned status board, which is updated live (or disable it with off)", None, ["off"]),
             "signup": CommandDesc(SignupCommand, "Join a CTF", None, ["ctf_name"], None),
             "solve": CommandDesc(SolveCommand, "Mark a challenge as solved", None, ["challenge_name", "support_member"]),
             "renamechallenge": CommandDesc(RenameChallengeCommand, "Renames a challenge", ["old_challenge_name", "new_challenge_name"], None),
@@ -1078,61 +1399,128 @@ class ChallengeHandler(BaseHandler):
         slack_wrapper.set_purpose(ctf.channel_id, purpose)
 
     @staticmethod
-    def update_database_from_slack(slack_wrapper):
+    def update_database_from_slack(slack_wrapper, refresh_players=True):
         """
         Reload the ctf and challenge information from slack.
+        Channels are processed page by page, challenges seen before their CTF are kept until it shows up.
+
+        While connected, challenge players are kept up to date from membership events. Without
+        refresh_players, the players of known challenges are taken over and only new challenge
+        channels are asked for their members.
         """
         database = {}
-        privchans = slack_wrapper.get_private_channels()
-        pubchans = slack_wrapper.get_public_channels()
+        pending_challenges = {}
+        known_players = {}
 
-        # Find active CTF channels
-        for channel in [*privchans, *pubchans]:
+        if not refresh_players:
             try:
-                purpose = load_json(channel['purpose']['value'])
+                known_players = {challenge.channel_id: challenge.players
+                                 for ctf in load_ctfs(ChallengeHandler.DB).values() for challenge in ctf.challenges}
+            except Exception:
+                log.exception("Couldn't load the current challenge players. Refreshing all...")
+
+        def add_challenge(ctf, challenge):
+            if challenge.channel_id in known_players:
+                challenge.players = set(known_players[challenge.channel_id])
+            else:
+                for member_id in slack_wrapper.iter_channel_members(challenge.channel_id):
+                    if member_id != slack_wrapper.user_id:
+                        challenge.add_player(member_id)
 
-                if not channel['is_archived'] and purpose and "ota_bot" in purpose and purpose["type"] == "CTF":
-                    ctf = CTF(channel['id'], purpose['name'], purpose['long_name'])
+            ctf.add_challenge(challenge)
 
-                    ctf.cred_user = purpose.get("cred_user", "")
-                    ctf.cred_pw = purpose.get("cred_pw", "")
-                    ctf.finished = purpose.get("finished", False)
-                    ctf.finished_on = purpose.get("finished_on", 0)
+        for channels in slack_wrapper.iter_channel_pages(["private_channel", "public_channel"], exclude_archived=True):
+            for channel in channels:
+                try:
+                    purpose = load_json(channel['purpose']['value'])
 
-                    database[ctf.channel_id] = ctf
-            except:
-                pass
+                    if channel['is_archived'] or not purpose or "ota_bot" not in purpose:
+                        continue
 
-        # Find active challenge channels
-        for channel in privchans:
-            try:
-                purpose = load_json(channel['purpose']['value'])
+                    # Find active CTF channels
+                    if purpose["type"] == "CTF":
+                        ctf = CTF(channel['id'], purpose['name'], purpose['long_name'])
 
-                if not channel['is_archived'] and purpose and "ota_bot" in purpose and purpose["type"] == "CHALLENGE":
-                    challenge = Challenge(purpose["ctf_id"], channel['id'], purpose["name"], purpose.get("category"))
-                    ctf_channel_id = purpose["ctf_id"]
-                    solvers = purpose["solved"]
-                    ctf = database.get(ctf_channel_id)
+                        ctf.cred_user = purpose.get("cred_user", "")
+                        ctf.cred_pw = purpose.get("cred_pw", "")
+                        ctf.finished = purpose.get("finished", False)
+                        ctf.finished_on = purpose.get("finished_on", 0)
 
-                    # Mark solved challenges
-                    if solvers:
-                        challenge.mark_as_solved(solvers, purpose.get("solve_date"))
+                        database[ctf.channel_id] = ctf
 
-                    if ctf:
-                        members = slack_wrapper.get_channel_members(channel['id'])
-                        for member_id in members:
-                            if member_id != slack_wrapper.user_id:
-                                challenge.add_player(Player(member_id))
+                        for challenge in pending_challenges.pop(ctf.channel_id, []):
+                            add_challenge(ctf, challenge)
 
-                        ctf.add_challenge(challenge)
-            except:
-                pass
+                    # Find active challenge channels
+                    elif purpose["type"] == "CHALLENGE" and channel.get("is_private"):
+                        challenge = Challenge(purpose["ctf_id"], channel['id'], purpose["name"], purpose.get("category"))
+                        ctf_channel_id = purpose["ctf_id"]
+                        solvers = purpose["solved"]
+                        ctf = database.get(ctf_channel_id)
+
+                        # Mark solved challenges
+                        if solvers:
+                            challenge.mark_as_solved(solvers, purpose.get("solve_date"))
+
+                        if ctf:
+                            add_challenge(ctf, challenge)
+                        else:
+                            pending_challenges.setdefault(ctf_channel_id, []).append(challenge)
+                except:
+                    pass
 
         # Create the database accordingly
-        pickle.dump(database, open(ChallengeHandler.DB, "wb+"))
+        save_ctfs(ChallengeHandler.DB, database)
+
+    @staticmethod
+    def update_challenge_players(slack_wrapper, event):
+        """Add or remove the player of a membership event to/from the challenge of its channel."""
+        user_id = event.get("user")
+
+        if not user_id or user_id == slack_wrapper.user_id:
+            return
+
+        challenge = get_challenge_by_channel_id(ChallengeHandler.DB, event.get("channel"))
+
+        if not challenge:
+            return
+
+        joined = event["type"] == "member_joined_channel"
+
+        if joined == (user_id in challenge.players):
+            return
+
+        with ctf_transaction(ChallengeHandler.DB) as ctfs:
+            ctf = ctfs[challenge.ctf_channel_id]
+            challenge = next(chal for chal in ctf.challenges if chal.channel_id == challenge.channel_id)
+
+            if joined:
+                challenge.add_player(user_id)
+            else:
+                challenge.remove_player(user_id)
+
+            ctf.update_challenge(challenge)
+
+        ChallengeHandler.status_boards.mark_dirty(ctf.channel_id)
 
     def init(self, slack_wrapper):
+        ChallengeHandler.scheduler = Scheduler(ChallengeHandler.SCHEDULER)
+        ChallengeHandler.scheduler.register("archive_reminder", EndCTFCommand.send_archive_reminder)
+        ChallengeHandler.status_registry = StatusRegistry(ChallengeHandler.STATUS_MESSAGES)
+        ChallengeHandler.status_boards = StatusBoards(
+            ChallengeHandler.STATUS_BOARDS,
+            handler_factory.botserver.get_config_option("status_board_interval") or STATUS_BOARD_INTERVAL)
         ChallengeHandler.update_database_from_slack(slack_wrapper)
+        start_publisher(slack_wrapper)
+
+    def tick(self, slack_wrapper):
+        ChallengeHandler.scheduler.run_pending(slack_wrapper)
+        ChallengeHandler.status_boards.flush(
+            slack_wrapper, lambda ctf_channel_id: StatusBoardCommand.render_board(slack_wrapper, ctf_channel_id))
+
+    def process_event(self, slack_wrapper, event):
+        if event.get("type") in ("member_joined_channel", "member_left_channel"):
+            ChallengeHandler.update_challenge_players(slack_wrapper, event)
 
 
 # Register this handler
@@ -6,11 +6,15 @@ The handler factory will then check if the handler can process a command,
 resolve it and execute it
 """
 import shlex
+import time
 
 from unidecode import unidecode
 
 from bottypes.invalid_command import InvalidCommand
 from util.loghandler import log
+from util.profiler import profiler
+from util.slowlog import slow_log
+from util.tracing import tracer
 
 handlers = {}
 botserver = None
@@ -37,6 +41,7 @@ def initialize(slack_wrapper, _botserver):
 
 def process(slack_wrapper, botserver, message, timestamp, channel_id, user_id):
     log.debug("Processing message: %s from %s (%s)", message, channel_id, user_id)
+    start = time.perf_counter()
 
     try:  # Parse command and check for malformed input
         command_line = unidecode(message)
@@ -51,7 +56,45 @@ def process(slack_wrapper, botserver, message, timestamp, channel_id, user_id):
         slack_wrapper.post_message(channel_id, message, timestamp)
         return
 
-    process_command(slack_wrapper, message, args, timestamp, channel_id, user_id)
+    process_command(slack_wrapper, message, args, timestamp, channel_id, user_id,
+                    parse_time=time.perf_counter() - start)
+
+
+def process_event(slack_wrapper, event):
+    """Pass an event from the real-time messaging API to every handler."""
+    for handler_name, handler in handlers.items():
+        try:
+            handler.process_event(slack_wrapper, event)
+        except Exception:
+            log.exception("An error has occured while processing an event in %s", handler_name)
+
+
+def tick(slack_wrapper):
+    """Let every handler do its periodic work."""
+    for handler_name, handler in handlers.items():
+        try:
+            handler.tick(slack_wrapper)
+        except Exception:
+            log.exception("An error has occured while running the periodic work of %s", handler_name)
+
+
+def record_invocation(trace, handler_name, command_name, arg_count, channel_id, parse_time=0):
+    """Add a processed command or reaction to the slow log and log it, if it exceeded the threshold."""
+    entry = slow_log.record(trace, handler_name, command_name, arg_count, channel_id, parse_time)
+
+    if entry["duration"] < slow_log.threshold:
+        return
+
+    phases = entry["phases"]
+
+    log.warning("Slow %s (%s) in %s: %.3fs with %d slack calls "
+                "(parse %.3fs, db %.3fs, api %.3fs, render %.3fs)",
+                command_name, handler_name, channel_id, entry["duration"], entry["slack_calls"],
+                phases["parse"], phases["db"], phases["api"], phases["render"],
+                extra={"command": command_name, "handler": handler_name, "arg_count": arg_count,
+                       "channel": channel_id, "duration": round(entry["duration"], 4),
+                       "slack_calls": entry["slack_calls"],
+                       "phases": {phase: round(value, 4) for phase, value in phases.items()}})
 
 
 def process_reaction(slack_wrapper, reaction, timestamp, channel_id, user_id):
@@ -63,7 +106,11 @@ def process_reaction(slack_wrapper, reaction, timestamp, channel_id, user_id):
 
         for handler_name, handler in handlers.items():
             if handler.can_handle_reaction(reaction):
-                handler.process_reaction(slack_wrapper, reaction, channel_id, timestamp, user_id, user_is_admin)
+                try:
+                    with tracer.trace("reaction {}".format(reaction), channel=channel_id, user=user_id) as trace:
+                        handler.process_reaction(slack_wrapper, reaction, channel_id, timestamp, user_id, user_is_admin)
+                finally:
+                    record_invocation(trace, handler_name, "reaction {}".format(reaction), 0, channel_id)
     except InvalidCommand as e:
         slack_wrapper.post_message(channel_id, e, timestamp)
 
@@ -71,8 +118,26 @@ def process_reaction(slack_wrapper, reaction, timestamp, channel_id, user_id):
         log.exception("An error has occured while processing a command")
 
 
-def process_command(slack_wrapper, message, args, timestamp, channel_id, user_id, admin_override=False):
+def process_command(slack_wrapper, message, args, timestamp, channel_id, user_id, admin_override=False,
+                    parse_time=0):
+    # Only log handler and command name (arguments might contain credentials)
+    name_args = args[:2] if args and args[0].lower() in handlers else args[:1]
+    command_name = " ".join(name_args)
+    start = time.monotonic()
+
+    with tracer.trace(command_name, channel=channel_id, user=user_id) as trace, profiler.profile_command():
+        _process_command(slack_wrapper, message, args, timestamp, channel_id, user_id, admin_override)
+
+    duration = time.monotonic() - start
+    record_invocation(trace, trace.attrs.get("handler", ""), command_name, len(args) - len(name_args), channel_id,
+                      parse_time)
 
+    log.info("Processed command %s in %.3fs", command_name, duration,
+             extra={"command": command_name, "channel": channel_id, "user": user_id,
+                    "duration": round(duration, 4)})
+
+
+def _process_command(slack_wrapper, message, args, timestamp, channel_id, user_id, admin_override):
     try:
         handler_name = args[0].lower()
         processed = False
@@ -96,6 +161,7 @@ def process_command(slack_wrapper, message, args, timestamp, channel_id, user_id
             else:  # Send command to specified handler
                 command = args[1].lower()
                 if handler.can_handle(command, user_is_admin):
+                    tracer.active().attrs["handler"] = handler_name
                     handler.process(slack_wrapper, command, args[2:], timestamp, channel_id, user_id, user_is_admin)
                     processed = True
 
@@ -108,6 +174,7 @@ def process_command(slack_wrapper, message, args, timestamp, channel_id, user_id
                     processed = True
 
                 elif handler.can_handle(command, user_is_admin):  # Send command to handler
+                    tracer.active().attrs["handler"] = handler_name
                     handler.process(slack_wrapper, command,
                                     args[1:], timestamp, channel_id, user_id, user_is_admin)
                     processed = True
@@ -122,7 +189,9 @@ def process_command(slack_wrapper, message, args, timestamp, channel_id, user_id
             slack_wrapper.post_message(target_id, usage_msg)
 
     except InvalidCommand as e:
+        tracer.active().attrs["error"] = "InvalidCommand"
         slack_wrapper.post_message(channel_id, e, timestamp)
 
-    except Exception:
+    except Exception as ex:
+        tracer.active().attrs["error"] = type(ex).__name__
         log.exception("An error has occured while processing a command")
@@ -1,9 +1,8 @@
-import wolframalpha
-
 from bottypes.command import Command
 from bottypes.command_descriptor import CommandDesc
 from handlers import handler_factory
 from handlers.base_handler import BaseHandler
+from util.wolframhelper import ask, configure_cache
 
 
 class AskCommand(Command):
@@ -23,28 +22,7 @@ class AskCommand(Command):
                 else:
                     question = " ".join(args)
 
-                client = wolframalpha.Client(app_id)
-                res = client.query(question)
-
-                answer = ""
-
-                if verbose:
-                    for pod in res.pods:
-                        for subpod in pod.subpods:
-                            if "plaintext" in subpod.keys() and subpod["plaintext"]:
-                                answer += "```\n"
-                                answer += subpod.plaintext[:512] + "\n"
-                                answer += "```\n"
-                                if len(subpod.plaintext) > 512:
-                                    answer += "*shortened*"
-                else:
-                    answer = next(res.results, None)
-
-                    if answer:
-                        if len(answer.text) > 2048:
-                            answer = answer.text[:2048] + "*shortened*"
-                        else:
-                            answer = answer.text
+                answer = ask(app_id, question, verbose)
 
                 slack_wrapper.post_message(channel_id, answer)
             except Exception as ex:
@@ -74,5 +52,9 @@ class WolframHandler(BaseHandler):
             "ask": CommandDesc(AskCommand, "Ask wolfram alpha a question (add -v for verbose answer)", ["question"], None, False),
         }
 
+    def init(self, slack_wrapper):
+        configure_cache(handler_factory.botserver.get_config_option("wolfram_cache_ttl"),
+                        handler_factory.botserver.get_config_option("wolfram_cache_size"))
+
 
 handler_factory.register("wolfram", WolframHandler())
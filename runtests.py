@@ -1,10 +1,37 @@
 #!/usr/bin/env python3
 from unittest import TestCase
 from tests.slackwrapper_mock import SlackWrapperMock
+from tests.fakeslack import FakeSlack
+import json
+import os
+import tempfile
+import threading
+import time
 import unittest
 from util.loghandler import log, logging
 from server.botserver import BotServer
 from bottypes.invalid_command import InvalidCommand
+from bottypes.challenge import Challenge
+from bottypes.ctf import CTF
+from bottypes.player import Player
+from util import serializer, solveposthelper
+from util.util import ctf_transaction, get_challenge_by_channel_id, load_ctfs, save_ctfs
+from handlers.challenge_handler import ChallengeHandler, StatusCommand
+from handlers import challenge_handler, handler_factory
+from util.channeldirectory import ChannelDirectory
+from util.slack_wrapper import SlackWrapper, PAGE_LIMIT
+from util.ratelimiter import MethodRateLimiter
+from util.outbox import Outbox
+from util.scheduler import Scheduler
+from util.statusboard import StatusBoards
+from util.rtmrecorder import RtmRecorder, read_recording
+from util.tracing import Tracer, tracer
+from util.slowlog import SLOW_COMMAND_THRESHOLD, phase_times, slow_log
+from util.profiler import StackSampler
+from util.loghandler import JsonFormatter
+from util.ctf_template_resolver import CompiledTemplate
+from util.wolframhelper import AnswerCache, normalize_question
+from util.solveposthelper import PublishJob, SolvePostPublisher
 
 
 class BotBaseTest(TestCase):
@@ -39,14 +66,17 @@ class BotBaseTest(TestCase):
 
     def exec_command(self, msg, exec_user="normal_user", channel="UNITTESTCHANNELID"):
         """Simulate execution of the specified message as the specified user in the test environment."""
-        testmsg = [{'type': 'message', 'user': exec_user, 'text': msg, 'client_msg_id': '738e4beb-d50e-42a4-a60e-3fafd4bd71da',
-                    'team': 'UNITTESTTEAMID', 'channel': channel, 'event_ts': '1549715670.002000', 'ts': '1549715670.002000'}]
+        self.msg_count = getattr(self, "msg_count", 0) + 1
+        ts = "1549715670.{:06d}".format(self.msg_count)
+        testmsg = [{'type': 'message', 'user': exec_user, 'text': msg, 'client_msg_id': '738e4beb-d50e-42a4-a60e-{:012d}'.format(self.msg_count),
+                    'team': 'UNITTESTTEAMID', 'channel': channel, 'event_ts': ts, 'ts': ts}]
         self.botserver.handle_message(testmsg)
 
-    def exec_reaction(self, reaction, exec_user="normal_user"):
+    def exec_reaction(self, reaction, exec_user="normal_user", ts="1549117537.000500"):
         """Simulate execution of the specified reaction as the specified user in the test environment."""
-        testmsg = [{'type': 'reaction_added', 'user': exec_user, 'item': {'type': 'message', 'channel': 'UNITTESTCHANNELID', 'ts': '1549117537.000500'},
-                    'reaction': reaction, 'item_user': 'UNITTESTUSERID', 'event_ts': '1549715822.000800', 'ts': '1549715822.000800'}]
+        self.msg_count = getattr(self, "msg_count", 0) + 1
+        testmsg = [{'type': 'reaction_added', 'user': exec_user, 'item': {'type': 'message', 'channel': 'UNITTESTCHANNELID', 'ts': ts},
+                    'reaction': reaction, 'item_user': 'UNITTESTUSERID', 'event_ts': '1549715822.{:06d}'.format(self.msg_count), 'ts': '1549715822.000800'}]
 
         self.botserver.handle_message(testmsg)
 
@@ -112,6 +142,18 @@ class TestBotHandler(BotBaseTest):
             "Unknown handler or command"), msg="Version didn't execute properly.")
 
 
+class TestEventDedup(BotBaseTest):
+    def test_duplicate_command(self):
+        testmsg = [{'type': 'message', 'user': 'normal_user', 'text': '!ping', 'client_msg_id': 'DUPLICATE_MSG_ID',
+                    'team': 'UNITTESTTEAMID', 'channel': 'UNITTESTCHANNELID', 'event_ts': '1549715670.002000', 'ts': '1549715670.002000'}]
+
+        self.botserver.handle_message(testmsg)
+        self.botserver.handle_message(list(testmsg))
+
+        self.assertEqual(len(self.botserver.slack_wrapper.message_list), 1, msg="Redelivered command was executed twice.")
+        self.assertEqual(self.botserver.event_dedup.suppressed, 1)
+
+
 class TestAdminHandler(BotBaseTest):
     def test_show_admins(self):
         self.exec_command("!admin show_admins", "admin_user")
@@ -123,6 +165,36 @@ class TestAdminHandler(BotBaseTest):
         self.assertTrue(self.check_for_response("Administrators"),
                         msg="ShowAdmins didn't reply with expected result.")
 
+    def test_outbox(self):
+        self.exec_command("!admin outbox", "admin_user")
+
+        self.assertTrue(self.check_for_response("Queued messages"),
+                        msg="Outbox didn't reply with expected result.")
+
+    def test_trace(self):
+        self.exec_command("!ctf status")
+        self.exec_command("!admin trace last 5", "admin_user")
+
+        self.assertTrue(self.check_for_response("*ctf status*"), msg="Traced command wasn't shown.")
+        self.assertTrue(self.check_for_response("db.load"), msg="Database access wasn't traced.")
+
+    def test_slow(self):
+        self.exec_command("!ctf status")
+        self.exec_command("!admin slow", "admin_user")
+
+        self.assertTrue(self.check_for_response("*ctf status* (ctf)"), msg="Processed command wasn't shown.")
+        self.assertTrue(self.check_for_response("parse"), msg="Phase times weren't shown.")
+
+    def test_slow_threshold(self):
+        self.botserver.config["slow_command_threshold"] = "slow"
+        self.botserver.configure_slow_log()
+
+        self.assertEqual(slow_log.threshold, SLOW_COMMAND_THRESHOLD, msg="Invalid threshold wasn't replaced.")
+
+        self.exec_command("!ping")
+
+        self.assertTrue(self.check_for_response("Pong!"), msg="Command failed with an invalid threshold.")
+
     def test_add_admin(self):
         self.exec_command("!admin add_admin test", "admin_user")
 
@@ -199,6 +271,40 @@ class TestChallengeHandler(BotBaseTest):
         self.assertFalse(self.check_for_response("Unknown handler or command"),
                          msg="Workon command didn't execute properly.")
 
+    def test_membership_events(self):
+        with ctf_transaction(ChallengeHandler.DB) as ctfs:
+            ctfs["UNITTEST_CHANNEL_ID1"].add_challenge(
+                Challenge("UNITTEST_CHANNEL_ID1", "UNITTEST_CHALL_ID", "membership", "misc"))
+
+        self.botserver.handle_message([{"type": "member_joined_channel", "user": "U1", "channel": "UNITTEST_CHALL_ID"},
+                                       {"type": "member_joined_channel", "user": "U2", "channel": "UNITTEST_CHALL_ID"},
+                                       {"type": "member_left_channel", "user": "U1", "channel": "UNITTEST_CHALL_ID"}])
+
+        challenge = get_challenge_by_channel_id(ChallengeHandler.DB, "UNITTEST_CHALL_ID")
+
+        self.assertEqual(challenge.players, {"U2"}, msg="Membership events weren't applied to the challenge players.")
+
+    def test_who(self):
+        with ctf_transaction(ChallengeHandler.DB) as ctfs:
+            ctfs["UNITTEST_CHANNEL_ID1"].add_challenge(
+                Challenge("UNITTEST_CHANNEL_ID1", "UNITTEST_CHALL_ID", "indexed", "misc"))
+
+        # Builds the player index before the player joins
+        self.exec_command("!ctf who <@U2>")
+        self.assertTrue(self.check_for_response("<@U2> isn't working on any challenge."))
+
+        self.botserver.handle_message([{"type": "member_joined_channel", "user": "U2", "channel": "UNITTEST_CHALL_ID"}])
+        self.exec_command("!ctf who <@u2>")
+
+        self.assertTrue(self.check_for_response(" : indexed (misc)"), msg="Joined challenge wasn't shown.")
+
+        self.exec_command("!ctf workon indexed", channel="UNITTEST_CHANNEL_ID1")
+        self.botserver.slack_wrapper.message_list = []
+        self.exec_command("!ctf mywork")
+
+        self.assertTrue(self.check_for_response("*<@normal_user> is working on:*"))
+        self.assertTrue(self.check_for_response(" : indexed (misc)"), msg="Challenge after workon wasn't shown.")
+
     def test_status(self):
         self.exec_command("!ctf status")
 
@@ -211,6 +317,108 @@ class TestChallengeHandler(BotBaseTest):
         self.assertFalse(self.check_for_response("Unknown handler or command"),
                          msg="Status command didn't execute properly.")
 
+    def test_status_refresh(self):
+        self.exec_command("!ctf status -v")
+        self.exec_reaction("arrows_clockwise")
+
+        self.assertEqual(self.botserver.slack_wrapper.updated_messages, [],
+                         msg="Refresh reaction on an unknown message updated it.")
+
+        # the mock posts every message with this timestamp
+        self.exec_reaction("arrows_clockwise", ts="1549715670.002000")
+        self.exec_reaction("arrows_clockwise", ts="1549715670.002000")
+
+        self.assertEqual(len(self.botserver.slack_wrapper.updated_messages), 1,
+                         msg="Status message wasn't refreshed exactly once.")
+
+    def test_reaction_error(self):
+        self.botserver.config["maintenance_mode"] = "1"
+        self.exec_reaction("arrows_clockwise")
+
+        self.assertTrue(self.check_for_response("Down for maintenance"),
+                        msg="Error of a reaction handler wasn't posted.")
+
+    def test_status_pages(self):
+        with ctf_transaction(ChallengeHandler.DB) as ctfs:
+            for number in range(20):
+                ctfs["UNITTEST_CHANNEL_ID1"].add_challenge(
+                    Challenge("UNITTEST_CHANNEL_ID1", "UNITTEST_CHALL_ID{}".format(number), "chall{}".format(number),
+                              "pwn"))
+
+        self.addCleanup(setattr, StatusCommand, "STATUS_MESSAGE_LIMIT", StatusCommand.STATUS_MESSAGE_LIMIT)
+        StatusCommand.STATUS_MESSAGE_LIMIT = 300
+
+        self.exec_command("!ctf status", channel="UNITTEST_CHANNEL_ID1")
+        pages = [msg.message for msg in self.botserver.slack_wrapper.message_list]
+
+        self.assertEqual(len(pages), 1, msg="More than the first status page was posted.")
+        self.assertLessEqual(len(pages[0]), 300 + 60, msg="Status message exceeded the size limit.")
+        self.assertIn("`!ctf status --page 2`", pages[0], msg="First page didn't point to the next page.")
+
+        self.botserver.slack_wrapper.message_list = []
+        self.exec_command("!ctf status --unsolved --page 2", channel="UNITTEST_CHANNEL_ID1")
+
+        self.assertEqual(len(self.botserver.slack_wrapper.message_list), 1)
+        self.assertTrue(self.check_for_response("_Page 2"), msg="Requested status page wasn't posted.")
+        self.assertFalse(self.check_for_response("chall0 "), msg="Status page contained challenges of page 1.")
+
+    def test_status_tag_query(self):
+        challenge = Challenge("UNITTEST_CHANNEL_ID1", "UNITTEST_CHALL_ID", "tagged", "misc")
+        challenge.add_tag("heap")
+
+        with ctf_transaction(ChallengeHandler.DB) as ctfs:
+            ctfs["UNITTEST_CHANNEL_ID1"].add_challenge(challenge)
+            ctfs["UNITTEST_CHANNEL_ID1"].add_challenge(
+                Challenge("UNITTEST_CHANNEL_ID1", "UNITTEST_CHALL_ID2", "untagged", "misc"))
+
+        self.exec_command("!ctf status tag:heap", channel="UNITTEST_CHANNEL_ID1")
+
+        self.assertTrue(self.check_for_response("*tagged* [heap]"), msg="Tagged challenge wasn't shown.")
+        self.assertFalse(self.check_for_response("untagged"), msg="Challenge without the tag was shown.")
+
+    def test_archive_reminder(self):
+        self.botserver.config["archive_ctf_reminder_offset"] = "1"
+        self.exec_command("!ctf endctf", "admin_user", channel="UNITTEST_CHANNEL_ID1")
+
+        self.assertEqual(len(ChallengeHandler.scheduler.pending("UNITTEST_CHANNEL_ID1")), 1,
+                         msg="Archive reminder wasn't scheduled.")
+
+        ChallengeHandler.scheduler.run_pending(self.botserver.slack_wrapper, time.time() + 3600)
+
+        self.assertTrue(self.check_for_response("should be archived"), msg="Archive reminder wasn't sent.")
+
+    def test_status_board(self):
+        self.exec_command("!ctf board", channel="UNITTEST_CHANNEL_ID1")
+
+        self.assertEqual(self.botserver.slack_wrapper.pinned_messages, [("UNITTEST_CHANNEL_ID1", "1549715670.002000")],
+                         msg="Status board wasn't pinned.")
+
+        ChallengeHandler.status_boards.interval = 0
+        self.exec_command("!ctf endctf", "admin_user", channel="UNITTEST_CHANNEL_ID1")
+        handler_factory.tick(self.botserver.slack_wrapper)
+        handler_factory.tick(self.botserver.slack_wrapper)
+
+        updates = self.botserver.slack_wrapper.updated_messages
+        self.assertEqual(len(updates), 1, msg="Status board wasn't edited exactly once after a change.")
+        self.assertIn("(finished)", updates[0][2])
+
+        self.exec_command("!ctf board off", channel="UNITTEST_CHANNEL_ID1")
+
+        self.assertEqual(self.botserver.slack_wrapper.pinned_messages, [], msg="Status board wasn't unpinned.")
+
+    def test_status_board_size(self):
+        with ctf_transaction(ChallengeHandler.DB) as ctfs:
+            for number in range(500):
+                ctfs["UNITTEST_CHANNEL_ID1"].add_challenge(
+                    Challenge("UNITTEST_CHANNEL_ID1", "UNITTEST_CHALL_ID{}".format(number), "chall{}".format(number),
+                              "pwn"))
+
+        self.exec_command("!ctf board", channel="UNITTEST_CHANNEL_ID1")
+        board = self.botserver.slack_wrapper.message_list[-1].message
+
+        self.assertLessEqual(len(board), 4000, msg="Status board exceeded slack's message size limit.")
+        self.assertIn("`!ctf status`", board, msg="Status board didn't point to the full status.")
+
     def test_solve(self):
         self.exec_command("!ctf solve testchall")
 
@@ -227,6 +435,22 @@ class TestChallengeHandler(BotBaseTest):
         self.assertFalse(self.check_for_response("Unknown handler or command"),
                          msg="Solve with supporter didn't execute properly.")
 
+    def test_solve_abbreviated(self):
+        with ctf_transaction(ChallengeHandler.DB) as ctfs:
+            for number, name in enumerate(["web100", "web200"]):
+                ctfs["UNITTEST_CHANNEL_ID1"].add_challenge(
+                    Challenge("UNITTEST_CHANNEL_ID1", "UNITTEST_CHALL_ID{}".format(number), name, "web"))
+
+        self.exec_command("!ctf solve web", channel="UNITTEST_CHANNEL_ID1")
+
+        self.assertTrue(self.check_for_response("Did you mean `web100` or `web200`?"),
+                        msg="Ambiguous name didn't suggest the matching challenges.")
+
+        self.exec_command("!ctf solve web10", channel="UNITTEST_CHANNEL_ID1")
+
+        self.assertTrue(get_challenge_by_channel_id(ChallengeHandler.DB, "UNITTEST_CHALL_ID0").is_solved,
+                        msg="Challenge wasn't solved by a unique prefix of its name.")
+
     def test_rename_challenge_name(self):
         self.exec_command("!ctf renamechallenge testchall test1")
 
@@ -291,6 +515,40 @@ class TestChallengeHandler(BotBaseTest):
         self.assertFalse(self.check_for_response("Unknown handler or command"),
                          msg="RenameCTF didn't execute properly.")
 
+    def test_archivectf(self):
+        self.exec_command("!ctf addctf test_ctf test_ctf")
+        self.exec_command("!ctf archivectf", "admin_user", "UNITTEST_CHANNEL_ID1")
+
+        self.assertTrue(self.check_for_response("Archived the following channels"),
+                        msg="ArchiveCTF didn't execute properly.")
+        self.assertFalse(self.check_for_response("not in a CTF channel"),
+                         msg="ArchiveCTF didn't find the CTF.")
+
+    def test_archivectf_solve_post(self):
+        publisher = SolvePostPublisher(os.path.join(tempfile.mkdtemp(), "queue.bin"))
+        publisher.commit = lambda batch: None
+        publisher.push = lambda: None
+        publisher.slack_wrapper = self.botserver.slack_wrapper
+
+        for module, name, value in ((solveposthelper, "_publisher", publisher),
+                                    (solveposthelper, "ST_GIT_SUPPORT", True),
+                                    (solveposthelper, "ST_GIT_CONFIG", {"git_baseurl": "https://example.org"}),
+                                    (challenge_handler, "ST_GIT_SUPPORT", True)):
+            self.addCleanup(setattr, module, name, getattr(module, name))
+            setattr(module, name, value)
+
+        self.botserver.config["archive_everything"] = "1"
+        self.exec_command("!ctf addctf test_ctf test_ctf")
+        self.exec_command("!ctf archivectf", "admin_user", "UNITTEST_CHANNEL_ID1")
+
+        self.assertIn("UNITTEST_CHANNEL_ID1", self.botserver.slack_wrapper.archived_channels)
+
+        publisher.process_batch(list(publisher.jobs))
+        notices = [msg for msg in self.botserver.slack_wrapper.message_list if "successfully uploaded" in msg.message]
+
+        self.assertEqual([msg.channel for msg in notices], ["admin_user"],
+                         msg="Upload notice wasn't sent to the user, who archived the CTF.")
+
     def test_roll(self):
         self.exec_command("!ctf roll")
 
@@ -300,13 +558,529 @@ class TestChallengeHandler(BotBaseTest):
                          msg="RenameCTF didn't execute properly.")
 
 
+class TestWolframHelper(TestCase):
+    def test_normalize_question(self):
+        self.assertEqual(normalize_question("  10 Inches  in CM? "), "10 inches in cm")
+
+    def test_answer_cache(self):
+        cache = AnswerCache(ttl=60, max_size=1)
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return "answer"
+
+        self.assertEqual(cache.get_or_compute(("q", False), compute), "answer")
+        self.assertEqual(cache.get_or_compute(("q", False), compute), "answer")
+        self.assertEqual(len(calls), 1, msg="Cached answer wasn't reused.")
+
+        cache.get_or_compute(("q", True), compute)
+        cache.get_or_compute(("q", False), compute)
+        self.assertEqual(len(calls), 3, msg="Cache didn't respect its size bound.")
+
+
+class TestSolvePostPublisher(TestCase):
+    def setUp(self):
+        self.queue_file = os.path.join(tempfile.mkdtemp(), "queue.bin")
+        self.publisher = self.create_publisher()
+        self.commits = []
+        self.pushes = []
+        self.push_failures = 1
+
+    def create_publisher(self):
+        publisher = SolvePostPublisher(self.queue_file)
+        publisher.commit = lambda batch: self.commits.append([job.ctf_name for job in batch])
+        publisher.push = self.push
+
+        return publisher
+
+    def push(self):
+        self.pushes.append(1)
+
+        if self.push_failures:
+            self.push_failures -= 1
+            raise Exception("remote unavailable")
+
+    def test_retry_failed_push(self):
+        self.publisher.enqueue(PublishJob("ctf1", "U1", []))
+        self.publisher.enqueue(PublishJob("ctf2", "U2", []))
+
+        self.assertFalse(self.publisher.process_batch(list(self.publisher.jobs)))
+        self.assertEqual(self.commits, [["ctf1", "ctf2"]], msg="Pending posts weren't batched into one commit.")
+        self.assertGreater(self.publisher.retry_at, 0, msg="Failed push wasn't scheduled for a retry.")
+
+        # The failed jobs survive a restart and are only pushed again
+        self.publisher = self.create_publisher()
+        self.assertEqual(self.publisher.pending(), 2, msg="Failed jobs were dropped from the queue.")
+
+        self.assertTrue(self.publisher.process_batch(list(self.publisher.jobs)))
+        self.assertEqual(self.commits, [["ctf1", "ctf2"]], msg="Committed jobs were committed again.")
+        self.assertEqual(len(self.pushes), 2)
+        self.assertEqual(self.create_publisher().pending(), 0, msg="Pushed jobs weren't removed from the queue.")
+
+
+class TestStatusBoards(TestCase):
+    def test_rejected_edit(self):
+        class RejectingSlack:
+            def update_message(self, channel_id, msg_timestamp, text):
+                return {"ok": False, "error": "msg_too_long"}
+
+        boards = StatusBoards(interval=0)
+        boards.add("UNITTEST_CHANNEL_ID1", "1549715670.002000")
+        boards.mark_dirty("UNITTEST_CHANNEL_ID1")
+        boards.flush(RejectingSlack(), lambda ctf_channel_id: "x" * 5000)
+
+        self.assertIsNone(boards.get("UNITTEST_CHANNEL_ID1"), msg="Rejected status board is still edited.")
+
+
+class TestCtfTemplateResolver(TestCase):
+    def test_render(self):
+        template = CompiledTemplate("**{name}** ({category}) {unknown}")
+
+        self.assertEqual(template.render({"name": "{category}", "category": "pwn"}), "**{category}** (pwn) {unknown}",
+                         msg="Template didn't render placeholders in a single pass.")
+
+
+class TestSerializer(TestCase):
+    def test_roundtrip(self):
+        ctf = CTF("CTFID", "testctf", "Test CTF")
+        challenge = Challenge("CTFID", "CHALLID", "pwn1", "pwn")
+        challenge.add_player("U1")
+        challenge.add_tag("heap")
+        ctf.add_challenge(challenge)
+
+        loaded = serializer.loads(serializer.dumps({ctf.channel_id: ctf}))["CTFID"]
+
+        self.assertEqual(loaded.long_name, "Test CTF")
+        self.assertEqual(loaded.challenges[0].players, {"U1"})
+        self.assertEqual(loaded.challenges[0].tags, {"heap"})
+
+    def test_legacy_migration(self):
+        legacy_state = {"channel_id": "CHALLID", "ctf_channel_id": "CTFID", "name": "pwn1", "category": "pwn",
+                        "players": {"U1": Player("U1")}, "is_solved": False, "solver": None, "solve_date": 0,
+                        "tags": ["heap", "uaf"]}
+
+        challenge = Challenge.__new__(Challenge)
+        challenge.__setstate__(legacy_state)
+
+        self.assertEqual(challenge.players, {"U1"}, msg="Legacy player dict wasn't migrated.")
+        self.assertEqual(challenge.tags, {"heap", "uaf"}, msg="Legacy tag list wasn't migrated.")
+
+
+class TestCtfDatabase(TestCase):
+    def setUp(self):
+        self.database = os.path.join(tempfile.mkdtemp(), "ctfs.bin")
+        save_ctfs(self.database, {"CTFID": CTF("CTFID", "testctf", "Test CTF")})
+
+    def test_failed_save(self):
+        def fail(ctfs, database):
+            raise IOError("disk full")
+
+        self.addCleanup(setattr, serializer, "dump", serializer.dump)
+        serializer.dump = fail
+
+        ctfs = load_ctfs(self.database)
+        ctfs["CTFID"].name = "renamed"
+
+        with self.assertRaises(IOError):
+            save_ctfs(self.database, ctfs)
+
+        self.assertEqual(load_ctfs(self.database)["CTFID"].name, "testctf", msg="Unsaved change was kept in memory.")
+
+    def test_failed_transaction(self):
+        with self.assertRaises(InvalidCommand):
+            with ctf_transaction(self.database) as ctfs:
+                ctfs["CTFID"].name = "renamed"
+                raise InvalidCommand("failed")
+
+        self.assertEqual(load_ctfs(self.database)["CTFID"].name, "testctf", msg="Failed change was kept in memory.")
+
+
+class TestChallengeIndex(TestCase):
+    def test_updates(self):
+        ctf = CTF("CTFID", "testctf", "Test CTF")
+        web = Challenge("CTFID", "CHALL1", "web1", "web")
+        pwn = Challenge("CTFID", "CHALL2", "pwn1", "pwn")
+        ctf.add_challenge(web)
+
+        self.assertEqual(ctf.challenges_in_category("web"), [web])
+
+        # Changes after the index was built
+        ctf.add_challenge(pwn)
+        pwn.add_tag("heap")
+        ctf.update_challenge(pwn)
+
+        self.assertEqual(ctf.challenges_with_tag("heap"), [pwn])
+
+        pwn.remove_tag("heap")
+        ctf.update_challenge(pwn)
+        ctf.remove_challenge("CHALL1")
+
+        self.assertEqual(ctf.challenges_with_tag("heap"), [])
+        self.assertEqual(ctf.challenges_in_category("web"), [])
+        self.assertEqual(ctf.index.categories(), ["pwn"])
+
+        loaded = serializer.loads(serializer.dumps({ctf.channel_id: ctf}))["CTFID"]
+
+        self.assertEqual(len(ctf.__getstate__()), len(CTF.STATE_SLOTS), msg="Challenge index was persisted.")
+        self.assertEqual(loaded.challenges_in_category("pwn")[0].name, "pwn1")
+
+    def test_match(self):
+        ctf = CTF("CTFID", "testctf", "Test CTF")
+
+        for number, name in enumerate(["web100", "crypto-warmup", "babyheap"]):
+            ctf.add_challenge(Challenge("CTFID", "CHALL{}".format(number), name, ""))
+
+        self.assertEqual(ctf.index.match("web10")[0].name, "web100", msg="Unique prefix wasn't matched.")
+        self.assertEqual(ctf.index.match("warmup")[0].name, "crypto-warmup", msg="Unique substring wasn't matched.")
+        self.assertEqual(ctf.index.match("babyhep"), (None, ["babyheap"]), msg="Similar name wasn't suggested.")
+
+        ctf.challenges[0].name = "web300"
+        ctf.update_challenge(ctf.challenges[0])
+
+        self.assertEqual(ctf.index.match("web10"), (None, ["web300"]), msg="Renamed challenge wasn't reindexed.")
+
+
+class TestChannelDirectory(TestCase):
+    def setUp(self):
+        self.directory = ChannelDirectory()
+        self.directory.load([{"id": "C1", "name": "testctf", "purpose": {"value": ""}}])
+
+    def test_rename_event(self):
+        self.directory.handle_event({"type": "channel_rename", "channel": {"id": "C1", "name": "newctf"}})
+
+        self.assertIsNone(self.directory.get_by_name("testctf"), msg="Old channel name wasn't removed from the index.")
+        self.assertEqual(self.directory.get_by_name("newctf")["id"], "C1")
+
+    def test_purpose_event(self):
+        self.directory.handle_event({"type": "message", "subtype": "channel_purpose", "channel": "C1",
+                                     "purpose": "{\"ota_bot\": \"OTABOT\"}"})
+
+        self.assertEqual(self.directory.get_info("C1")["purpose"]["value"], "{\"ota_bot\": \"OTABOT\"}")
+
+    def test_created_channel_needs_info(self):
+        self.directory.handle_event({"type": "channel_created", "channel": {"id": "C2", "name": "pwn"}})
+
+        self.assertEqual(self.directory.get_by_name("pwn")["id"], "C2")
+        self.assertIsNone(self.directory.get_info("C2"), msg="Incomplete channel data was used as channel info.")
+
+
+class PagedClientMock:
+    """Slack client mock, which answers conversations.members in pages of two members."""
+
+    def __init__(self, members):
+        self.members = members
+        self.calls = []
+
+    def api_call(self, method, **kwargs):
+        self.calls.append((method, kwargs))
+        start = int(kwargs.get("cursor") or 0)
+        next_cursor = str(start + 2) if start + 2 < len(self.members) else ""
+
+        return {"ok": True, "members": self.members[start:start + 2], "response_metadata": {"next_cursor": next_cursor}}
+
+
+class TestSlackWrapperPagination(TestCase):
+    def setUp(self):
+        self.slack_wrapper = SlackWrapper.__new__(SlackWrapper)
+        self.slack_wrapper.rate_limiter = MethodRateLimiter()
+        self.slack_wrapper.channel_directory = ChannelDirectory()
+        self.slack_wrapper.client = PagedClientMock(["U{}".format(i) for i in range(5)])
+
+    def test_channel_members(self):
+        members = self.slack_wrapper.get_channel_members("C1")
+
+        self.assertEqual(members, ["U0", "U1", "U2", "U3", "U4"])
+        self.assertEqual(len(self.slack_wrapper.client.calls), 3, msg="Members weren't fetched page by page.")
+        self.assertTrue(all(kwargs["limit"] == PAGE_LIMIT for _, kwargs in self.slack_wrapper.client.calls),
+                        msg="Pages weren't requested with the maximum page size.")
+
+    def test_failed_page(self):
+        self.slack_wrapper.client.api_call = lambda method, **kwargs: {"ok": False, "error": "channel_not_found"}
+
+        self.assertEqual(self.slack_wrapper.get_channel_members("C1"), [])
+
+
+class TestMethodRateLimiter(TestCase):
+    def test_channel_methods(self):
+        limiter = MethodRateLimiter()
+
+        self.assertIsNot(limiter.get("chat.postMessage", "C1"), limiter.get("chat.postMessage", "C2"),
+                         msg="Messages to different channels share a rate limit.")
+        self.assertIs(limiter.get("users.info", "C1"), limiter.get("users.info", "C2"),
+                      msg="Tier limited method was limited per channel.")
+
+
+class TestFakeSlack(TestCase):
+    def setUp(self):
+        self.fake_slack = FakeSlack(page_size=2).start()
+        self.fake_slack.add_users(4)
+        self.slack_wrapper = SlackWrapper("xoxb-test", self.fake_slack.api_url)
+
+    def tearDown(self):
+        self.slack_wrapper.close()
+        self.fake_slack.stop()
+
+    def test_connect_and_paginate(self):
+        self.assertTrue(self.slack_wrapper.connected)
+        self.assertEqual(self.slack_wrapper.username, "otabot")
+
+        self.assertEqual(len(self.slack_wrapper.get_members()["members"]), 5)
+        self.assertEqual(self.fake_slack.calls["users.list"], 3, msg="Members weren't fetched page by page.")
+
+    def test_ratelimit_retry(self):
+        self.fake_slack.ratelimit_rate = 1.0
+        self.fake_slack.retry_after = 0
+
+        result = self.slack_wrapper.api_call("users.info", user="U00000001")
+
+        self.assertEqual(result["error"], "ratelimited")
+        self.assertEqual(self.fake_slack.ratelimited["users.info"], 3, msg="Rate limited call wasn't retried.")
+
+    def test_rtm_events(self):
+        channel_id = self.slack_wrapper.create_channel("test", True)["channel"]["id"]
+        self.fake_slack.post_user_message(channel_id, "U00000001", "!ping")
+
+        events = []
+        for _ in range(20):
+            events.extend(self.slack_wrapper.read())
+            if any(event.get("text") == "!ping" for event in events):
+                break
+            time.sleep(0.05)
+
+        self.assertIn("group_joined", [event["type"] for event in events])
+        self.assertTrue(any(event.get("text") == "!ping" for event in events), msg="Posted message wasn't emitted.")
+
+
+class TestOutbox(TestCase):
+    def setUp(self):
+        self.posts = []
+        self.outbox = Outbox(self.send, interval=0.2)
+
+    def send(self, channel_id, text, thread_ts, parse):
+        self.posts.append((channel_id, text))
+
+        return {"ok": True, "channel": channel_id, "ts": str(len(self.posts))}
+
+    def test_coalesce(self):
+        for i in range(3):
+            self.outbox.enqueue("C1", "message {}".format(i))
+        self.outbox.enqueue("C2", "other channel")
+
+        self.outbox.start()
+        self.outbox.stop()
+        self.outbox.join(5)
+
+        self.assertEqual(self.posts, [("C1", "message 0\nmessage 1\nmessage 2"), ("C2", "other channel")],
+                         msg="Consecutive messages to the same channel weren't merged.")
+        self.assertEqual(self.outbox.stats()["coalesced"], 2)
+
+    def test_send_waits_for_result(self):
+        self.outbox.start()
+
+        result = self.outbox.send("C1", "first")
+        self.outbox.enqueue("C1", "second")
+        self.outbox.stop()
+        self.outbox.join(5)
+
+        self.assertEqual(result["ts"], "1", msg="send didn't return the api result of its own message.")
+        self.assertEqual(len(self.posts), 2, msg="Message sent with send was merged.")
+
+    def test_retry_doesnt_block_other_channels(self):
+        failures = {"C1": 1}
+
+        def send(channel_id, text, thread_ts, parse):
+            if failures.get(channel_id):
+                failures[channel_id] -= 1
+                return {"ok": False, "error": "internal_error"}
+
+            return self.send(channel_id, text, thread_ts, parse)
+
+        self.outbox.send_func = send
+        self.outbox.enqueue("C1", "retried")
+        self.outbox.enqueue("C2", "other channel")
+        self.outbox.start()
+        self.outbox.stop()
+        self.outbox.join(5)
+
+        self.assertEqual(self.posts, [("C2", "other channel"), ("C1", "retried")],
+                         msg="Failed post held up the other channels.")
+        self.assertEqual(self.outbox.stats()["failed"], 0)
+
+    def test_send_timeout(self):
+        self.outbox.send_func = lambda channel_id, text, thread_ts, parse: {"ok": False, "error": "internal_error"}
+        self.outbox.start()
+
+        self.assertEqual(self.outbox.send("C1", "slow", timeout=0.1)["error"], "timeout")
+
+
+class TestScheduler(TestCase):
+    def setUp(self):
+        self.runs = []
+        self.scheduler = Scheduler()
+        self.scheduler.register("test", lambda slack_wrapper, data: self.runs.append(data))
+
+    def test_run_in_order(self):
+        self.scheduler.schedule("test", 20, "CTF1", "second")
+        self.scheduler.schedule("test", 10, "CTF2", "first")
+        self.scheduler.schedule("test", 3600, "CTF1", "later")
+
+        self.scheduler.run_pending(None, time.time() + 30)
+
+        self.assertEqual(self.runs, ["first", "second"], msg="Due jobs didn't run in order of their due time.")
+        self.assertEqual([job.data for job in self.scheduler.pending()], ["later"])
+
+    def test_cancel_key(self):
+        self.scheduler.schedule("test", 10, "CTF1", "cancelled")
+        self.scheduler.schedule("test", 10, "CTF2", "kept")
+
+        self.assertEqual(self.scheduler.cancel_key("CTF1"), 1)
+
+        self.scheduler.run_pending(None, time.time() + 30)
+
+        self.assertEqual(self.runs, ["kept"], msg="Cancelled job was run.")
+
+
+class TestLogHandler(TestCase):
+    def test_json_format(self):
+        record = logging.LogRecord("log", logging.INFO, __file__, 1, "Processed command %s", ("ctf status",), None)
+        record.command = "ctf status"
+        record.duration = 0.25
+
+        entry = json.loads(JsonFormatter().format(record))
+
+        self.assertEqual(entry["message"], "Processed command ctf status")
+        self.assertEqual(entry["command"], "ctf status")
+        self.assertEqual(entry["duration"], 0.25)
+        self.assertNotIn("channel", entry, msg="Missing structured field was added.")
+
+
+class TestTracing(TestCase):
+    def test_nested_spans(self):
+        tracer = Tracer()
+
+        with tracer.span("outside"):
+            pass
+
+        with tracer.trace("ctf solve"):
+            with tracer.span("SlackWrapper.get_member", "slack"):
+                with tracer.span("slack.api users.info", "http"):
+                    pass
+
+        self.assertEqual(len(tracer.last(10)), 1, msg="Span outside of a trace was recorded.")
+
+        trace = tracer.last(1)[0]
+
+        self.assertEqual([span.name for span in trace.walk()], ["SlackWrapper.get_member", "slack.api users.info"])
+        self.assertTrue(trace.duration >= trace.children[0].duration)
+
+    def test_outbox_spans(self):
+        def send(channel_id, text, thread_ts, parse):
+            with tracer.span("slack.api chat.postMessage", "http"):
+                return {"ok": True, "ts": "1"}
+
+        outbox = Outbox(send, interval=0)
+        outbox.start()
+
+        with tracer.trace("ctf solve") as trace:
+            outbox.send("C1", "solved")
+
+        outbox.stop()
+        outbox.join(5)
+
+        self.assertIn("slack.api chat.postMessage", [span.name for span in trace.walk()],
+                      msg="Message posted by the outbox wasn't recorded in the trace.")
+
+    def test_phase_times(self):
+        tracer = Tracer()
+
+        with tracer.trace("ctf status") as trace:
+            with tracer.span("db.load", "db"):
+                pass
+
+            with tracer.span("Outbox.send", "http") as send:
+                with tracer.span("slack.api chat.postMessage", "http"):
+                    time.sleep(0.01)
+
+            with tracer.span("Outbox.enqueue", "outbox") as enqueue:
+                pass
+
+        # Posted by the outbox after the trace has finished
+        with tracer.attach(enqueue):
+            with tracer.span("slack.api chat.postMessage", "http"):
+                pass
+
+        phases, slack_calls = phase_times(trace)
+
+        self.assertEqual(slack_calls, 2, msg="Sent and queued messages weren't counted once each.")
+        self.assertEqual(phases["api"], send.duration, msg="Waiting for the outbox wasn't counted as api time.")
+
+
+class TestStackSampler(TestCase):
+    def test_sample(self):
+        sampler = StackSampler()
+        sampler.sample()
+        sampler.sample()
+
+        thread_name = threading.current_thread().name
+        stacks = [stack for stack in sampler.stacks if stack.startswith(thread_name + ";")]
+
+        self.assertEqual(sampler.samples, 2)
+        self.assertEqual(len(stacks), 1, msg="Stack of the sampling thread wasn't counted once.")
+        self.assertIn("test_sample (runtests.py:", stacks[0].split(";")[-2])
+
+        function, self_samples, total_samples = sampler.top_functions(thread_name, 1)[0]
+
+        self.assertTrue(function.startswith("sample (profiler.py:"))
+        self.assertEqual((self_samples, total_samples), (2, 2))
+
+
+class TestRtmRecorder(TestCase):
+    def test_roundtrip(self):
+        with tempfile.TemporaryDirectory() as workdir:
+            filename = os.path.join(workdir, "rtm.jsonl.gz")
+
+            recorder = RtmRecorder(filename)
+            recorder.write_connect("UBOT", "otabot")
+            recorder.write([{"type": "message", "text": "!ctf status"}])
+            recorder.close()
+
+            # A restarted bot appends to the recording
+            recorder = RtmRecorder(filename)
+            recorder.write([{"type": "reaction_added"}])
+            recorder.close()
+
+            entries = list(read_recording(filename))
+
+        self.assertEqual(entries[0]["connect"]["bot_id"], "UBOT")
+        self.assertEqual([entry["events"][0]["type"] for entry in entries[1:]], ["message", "reaction_added"])
+
+
 def run_tests():
     # borrowed from gef test suite (https://github.com/hugsy/gef/blob/dev/tests/runtests.py)
     test_instances = [
         TestSyscallsHandler,
         TestBotHandler,
+        TestEventDedup,
         TestAdminHandler,
-        TestChallengeHandler
+        TestChallengeHandler,
+        TestWolframHelper,
+        TestSolvePostPublisher,
+        TestStatusBoards,
+        TestCtfTemplateResolver,
+        TestSerializer,
+        TestCtfDatabase,
+        TestChallengeIndex,
+        TestChannelDirectory,
+        TestSlackWrapperPagination,
+        TestMethodRateLimiter,
+        TestFakeSlack,
+        TestOutbox,
+        TestScheduler,
+        TestLogHandler,
+        TestTracing,
+        TestStackSampler,
+        TestRtmRecorder
     ]
 
     # don't show bot debug messages for running tests
@@ -8,8 +8,11 @@ from slackclient.server import SlackConnectionError
 from bottypes.invalid_console_command import InvalidConsoleCommand
 from handlers import *
 from handlers import handler_factory
-from util.loghandler import log
+from util.eventdedup import EventDeduplicator
+from util.loghandler import LOG_BACKUP_COUNT, LOG_MAX_BYTES, configure_logging, log
+from util.rtmrecorder import RtmRecorder
 from util.slack_wrapper import SlackWrapper
+from util.slowlog import SLOW_COMMAND_THRESHOLD, slow_log
 from util.util import get_display_name, resolve_user_by_user_id
 
 
@@ -29,6 +32,11 @@ class BotServer(threading.Thread):
         self.bot_at = ""
         self.slack_wrapper = None
         self.read_websocket_delay = 1
+        self.log_config = None
+        self.rtm_recorder = None
+
+        # Kept across reconnects, since slack might deliver recent events again
+        self.event_dedup = EventDeduplicator()
 
     def lock(self):
         """Acquire global lock for working with global (not thread-safe) data."""
@@ -50,6 +58,48 @@ class BotServer(threading.Thread):
             self.config = json.load(f)
         self.release()
 
+        self.configure_logging()
+        self.configure_recording()
+        self.configure_slow_log()
+
+    def configure_recording(self):
+        """Start or stop recording the RTM events to the file configured in rtm_record_file."""
+        record_file = self.get_config_option("rtm_record_file") or None
+
+        if self.rtm_recorder and self.rtm_recorder.filename != record_file:
+            log.info("Stopped recording RTM events to %s", self.rtm_recorder.filename)
+            self.rtm_recorder.close()
+            self.rtm_recorder = None
+
+        if record_file and not self.rtm_recorder:
+            log.info("Recording RTM events to %s", record_file)
+            self.rtm_recorder = RtmRecorder(record_file)
+
+    def configure_logging(self):
+        """Apply the logging options of the configuration (if they changed)."""
+        log_config = (self.get_config_option("log_level") or "DEBUG",
+                      self.get_config_option("log_format") or "text",
+                      self.get_config_option("log_max_bytes") or LOG_MAX_BYTES,
+                      self.get_config_option("log_backup_count") or LOG_BACKUP_COUNT,
+                      self.get_config_option("log_rotate_when") or None)
+
+        if log_config != self.log_config:
+            configure_logging(*log_config)
+            self.log_config = log_config
+
+    def configure_slow_log(self):
+        """Apply the slow_command_threshold option of the configuration (invalid values keep the default)."""
+        threshold = self.get_config_option("slow_command_threshold")
+
+        try:
+            slow_log.threshold = float(threshold) if threshold not in (None, "") else SLOW_COMMAND_THRESHOLD
+
+            if slow_log.threshold < 0:
+                raise ValueError("negative threshold")
+        except (TypeError, ValueError):
+            log.warning("Invalid slow_command_threshold %r, using %ss", threshold, SLOW_COMMAND_THRESHOLD)
+            slow_log.threshold = SLOW_COMMAND_THRESHOLD
+
     def get_config_option(self, option):
         """Get configuration option."""
         self.lock()
@@ -142,6 +192,21 @@ class BotServer(threading.Thread):
         handler_factory.initialize(self.slack_wrapper, self)
 
     def handle_message(self, message):
+        events = self.event_dedup.filter(message)
+
+        if len(events) != len(message):
+            log.info("Suppressed %d duplicate event(s) (%d in total)",
+                     len(message) - len(events), self.event_dedup.suppressed)
+
+            if not events:
+                return
+
+            message = events
+
+        for event in message:
+            self.slack_wrapper.update_from_event(event)
+            handler_factory.process_event(self.slack_wrapper, event)
+
         reaction, channel, time_stamp, reaction_user = self.parse_slack_reaction(message)
 
         if reaction and not self.bot_id == reaction_user:
@@ -162,19 +227,33 @@ class BotServer(threading.Thread):
         while self.running:
             try:
                 self.load_config()
-                self.slack_wrapper = SlackWrapper(self.get_config_option("api_key"))
+
+                # Let the outbox of the previous connection post its remaining messages
+                if self.slack_wrapper:
+                    self.slack_wrapper.close()
+
+                self.slack_wrapper = SlackWrapper(self.get_config_option("api_key"),
+                                                  self.get_config_option("slack_api_url") or None)
 
                 if self.slack_wrapper.connected:
                     log.info("Connection successful...")
                     self.init_bot_data()
 
+                    if self.rtm_recorder:
+                        self.rtm_recorder.write_connect(self.bot_id, self.bot_name)
+
                     # Main loop
                     log.info("Bot is running...")
                     while self.running:
                         message = self.slack_wrapper.read()
                         if message:
+                            if self.rtm_recorder:
+                                self.rtm_recorder.write(message)
+
                             self.handle_message(message)
 
+                        handler_factory.tick(self.slack_wrapper)
+
                         time.sleep(self.read_websocket_delay)
 
                 else:
@@ -191,4 +270,7 @@ class BotServer(threading.Thread):
                 log.exception("Unhandled error. Try reconnect...")
                 time.sleep(5)
 
+        if self.rtm_recorder:
+            self.rtm_recorder.close()
+
         log.info("Shutdown complete...")
@@ -0,0 +1,734 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the slack web api and the real-time messaging api.
+
+Implements the conversations.*, users.*, chat.*, reactions.*, reminders.* and pins.*
+methods used by the bot on in-memory state, plus a websocket endpoint, which emits
+RTM events for the changes. Latency, rate limit errors (HTTP 429) and the maximum
+page size of paginated methods can be configured to measure the real client offline.
+
+Point the bot at it with the "slack_api_url" config option (f.e. "http://127.0.0.1:8765/api").
+
+Usage: python3 -m tests.fakeslack [port] [users] [latency]
+"""
+import base64
+import collections
+import hashlib
+import json
+import queue
+import random
+import select
+import socketserver
+import struct
+import sys
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+BOT_ID = "UBOTFAKE1"
+BOT_NAME = "otabot"
+TEAM = {"id": "TFAKE0001", "name": "Fake Team", "domain": "fake"}
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+DEFAULT_PAGE_SIZE = 100
+
+
+class SlackApiError(Exception):
+    """Error answer of an api method (f.e. channel_not_found)."""
+
+    def __init__(self, error):
+        super().__init__(error)
+        self.error = error
+
+
+def parse_bool(value):
+    return str(value).lower() in ("1", "true")
+
+
+def parse_list(value):
+    return [item for item in (value or "").split(",") if item]
+
+
+class FakeSlack:
+    """
+    In-memory slack workspace answering api calls and broadcasting RTM events.
+
+    latency : Seconds to wait before answering an api call
+    ratelimit_rate : Fraction of api calls (0..1), which are answered with HTTP 429
+    retry_after : Retry-After header sent with rate limit errors
+    page_size : Maximum page size of paginated methods (smaller limits are respected)
+    autocreate : Create unknown channels, when they are used (f.e. for replaying recorded events)
+    """
+
+    def __init__(self, latency=0.0, ratelimit_rate=0.0, retry_after=1, page_size=DEFAULT_PAGE_SIZE, seed=None,
+                 autocreate=False):
+        self.latency = latency
+        self.ratelimit_rate = ratelimit_rate
+        self.retry_after = retry_after
+        self.page_size = page_size
+        self.autocreate = autocreate
+        self.random = random.Random(seed)
+
+        self.lock = threading.RLock()
+        self.users = collections.OrderedDict()
+        self.channels = collections.OrderedDict()
+        self.messages = collections.defaultdict(list)
+        self.pins = collections.defaultdict(set)
+        self.reminders = collections.OrderedDict()
+        self.calls = collections.Counter()
+        self.ratelimited = collections.Counter()
+        self.sockets = []
+        self.last_ts = 0
+        self.id_counter = 0
+
+        self.httpd = None
+        self.thread = None
+
+        self.add_user(BOT_ID, BOT_NAME, is_bot=True)
+
+        self.methods = {
+            "rtm.start": self.rtm_start,
+            "rtm.connect": self.rtm_connect,
+            "users.list": self.users_list,
+            "users.info": self.users_info,
+            "conversations.list": self.conversations_list,
+            "conversations.info": self.conversations_info,
+            "conversations.members": self.conversations_members,
+            "conversations.create": self.conversations_create,
+            "conversations.invite": self.conversations_invite,
+            "conversations.kick": self.conversations_kick,
+            "conversations.rename": self.conversations_rename,
+            "conversations.setPurpose": self.conversations_set_purpose,
+            "conversations.setTopic": self.conversations_set_topic,
+            "conversations.archive": self.conversations_archive,
+            "conversations.history": self.conversations_history,
+            "chat.postMessage": self.chat_post_message,
+            "chat.update": self.chat_update,
+            "chat.delete": self.chat_delete,
+            "reactions.add": self.reactions_add,
+            "reactions.remove": self.reactions_remove,
+            "pins.add": self.pins_add,
+            "pins.remove": self.pins_remove,
+            "reminders.add": self.reminders_add,
+            "reminders.list": self.reminders_list,
+            "reminders.delete": self.reminders_delete,
+        }
+
+        # Legacy methods still used by the bot
+        for prefix in ("channels", "groups"):
+            self.methods[prefix + ".rename"] = self.conversations_rename
+            self.methods[prefix + ".setTopic"] = self.conversations_set_topic
+            self.methods[prefix + ".archive"] = self.conversations_archive
+            self.methods[prefix + ".history"] = self.conversations_history
+
+    # Server
+
+    def start(self, host="127.0.0.1", port=0):
+        """Start serving in a background thread (port 0 picks a free port)."""
+        self.httpd = FakeSlackHTTPServer((host, port), FakeSlackRequestHandler, self)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+        return self
+
+    def stop(self):
+        with self.lock:
+            for event_queue in self.sockets:
+                event_queue.put(None)
+
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+
+    @property
+    def address(self):
+        host, port = self.httpd.server_address[:2]
+        return "{}:{}".format(host, port)
+
+    @property
+    def api_url(self):
+        """Base url for api calls (value for the slack_api_url config option)."""
+        return "http://{}/api".format(self.address)
+
+    @property
+    def ws_url(self):
+        return "ws://{}/rtm".format(self.address)
+
+    # State helpers
+
+    def next_ts(self):
+        """Return a unique, increasing message timestamp."""
+        with self.lock:
+            self.last_ts = max(self.last_ts + 0.000001, time.time())
+            return "{:.6f}".format(self.last_ts)
+
+    def next_id(self, prefix):
+        with self.lock:
+            self.id_counter += 1
+            return "{}FAKE{:05d}".format(prefix, self.id_counter)
+
+    def add_user(self, user_id, name, is_bot=False, is_admin=False):
+        user = {
+            "id": user_id,
+            "team_id": TEAM["id"],
+            "name": name,
+            "deleted": False,
+            "real_name": name,
+            "tz": "Europe/Berlin",
+            "is_admin": is_admin,
+            "is_bot": is_bot,
+            "profile": {"real_name": name, "display_name": name, "email": ""}
+        }
+
+        with self.lock:
+            self.users[user_id] = user
+
+        return user
+
+    def add_users(self, count):
+        """Add count synthetic users and return their ids."""
+        return [self.add_user("U{:08d}".format(number), "user{}".format(number))["id"] for number in range(count)]
+
+    def add_channel(self, name, is_private=False, members=None, purpose="", creator=BOT_ID, channel_id=None):
+        channel = {
+            "id": channel_id or self.next_id("G" if is_private else "C"),
+            "name": name,
+            "is_channel": not is_private,
+            "is_group": is_private,
+            "is_private": is_private,
+            "is_archived": False,
+            "created": int(time.time()),
+            "creator": creator,
+            "purpose": {"value": purpose, "creator": creator, "last_set": 0},
+            "topic": {"value": "", "creator": "", "last_set": 0},
+            "members": list(members or [creator])
+        }
+
+        with self.lock:
+            self.channels[channel["id"]] = channel
+
+        return channel
+
+    def get_channel(self, channel_id):
+        channel = self.channels.get(channel_id)
+
+        if not channel and self.autocreate and channel_id[:1] in ("C", "G"):
+            channel = self.add_channel(channel_id.lower(), channel_id.startswith("G"), channel_id=channel_id)
+
+        if not channel:
+            raise SlackApiError("channel_not_found")
+
+        return channel
+
+    def get_message(self, channel_id, ts):
+        for message in self.messages.get(channel_id, ()):
+            if message["ts"] == ts:
+                return message
+
+        raise SlackApiError("message_not_found")
+
+    def channel_info(self, channel):
+        """Return the api representation of a channel (without its member list)."""
+        info = {key: value for key, value in channel.items() if key != "members"}
+        info["num_members"] = len(channel["members"])
+
+        return info
+
+    def paginate(self, items, params):
+        """Return a page of items and the cursor of the next page."""
+        limit = min(int(params.get("limit") or self.page_size), self.page_size)
+        offset = int(params.get("cursor") or 0)
+        page = items[offset:offset + limit]
+
+        next_cursor = str(offset + limit) if offset + limit < len(items) else ""
+
+        return page, {"next_cursor": next_cursor}
+
+    # RTM
+
+    def register_socket(self):
+        event_queue = queue.Queue()
+
+        with self.lock:
+            self.sockets.append(event_queue)
+
+        return event_queue
+
+    def unregister_socket(self, event_queue):
+        with self.lock:
+            if event_queue in self.sockets:
+                self.sockets.remove(event_queue)
+
+    def push_event(self, event):
+        """Send an event to all connected RTM clients."""
+        event.setdefault("event_ts", self.next_ts())
+
+        with self.lock:
+            for event_queue in self.sockets:
+                event_queue.put(event)
+
+    def post_user_message(self, channel_id, user_id, text, thread_ts=None):
+        """Post a message as a user (f.e. a bot command) and return its timestamp."""
+        with self.lock:
+            message = self.store_message(channel_id, user_id, text, thread_ts)
+
+        return message["ts"]
+
+    def store_message(self, channel_id, user_id, text, thread_ts=None, **fields):
+        message = dict(fields, type="message", user=user_id, text=text, ts=self.next_ts())
+
+        if thread_ts:
+            message["thread_ts"] = thread_ts
+
+        self.messages[channel_id].append(message)
+
+        self.push_event(dict(message, channel=channel_id, client_msg_id=self.next_id("M")))
+
+        return message
+
+    def login_data(self, full):
+        data = {
+            "ok": True,
+            "url": self.ws_url,
+            "self": {"id": BOT_ID, "name": BOT_NAME},
+            "team": TEAM
+        }
+
+        if full:
+            data["users"] = list(self.users.values())
+            data["channels"] = [self.channel_info(channel) for channel in self.channels.values()
+                                if not channel["is_private"]]
+            data["groups"] = [self.channel_info(channel) for channel in self.channels.values()
+                              if channel["is_private"] and BOT_ID in channel["members"]]
+            data["ims"] = []
+
+        return data
+
+    # Api
+
+    def handle_api_call(self, method, params):
+        """Answer an api call. Return (http status, response, headers)."""
+        self.calls[method] += 1
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        if self.ratelimit_rate and self.random.random() < self.ratelimit_rate:
+            self.ratelimited[method] += 1
+            return 429, {"ok": False, "error": "ratelimited"}, {"Retry-After": str(self.retry_after)}
+
+        func = self.methods.get(method)
+
+        if not func:
+            return 200, {"ok": False, "error": "unknown_method"}, {}
+
+        try:
+            with self.lock:
+                response = func(params)
+        except SlackApiError as error:
+            return 200, {"ok": False, "error": error.error}, {}
+        except (KeyError, ValueError):
+            return 200, {"ok": False, "error": "invalid_arguments"}, {}
+
+        response["ok"] = True
+
+        return 200, response, {}
+
+    def rtm_start(self, params):
+        return self.login_data(True)
+
+    def rtm_connect(self, params):
+        return self.login_data(False)
+
+    def users_list(self, params):
+        members, metadata = self.paginate(list(self.users.values()), params)
+
+        return {"members": members, "response_metadata": metadata}
+
+    def users_info(self, params):
+        user = self.users.get(params["user"])
+
+        if not user:
+            raise SlackApiError("user_not_found")
+
+        return {"user": user}
+
+    def conversations_list(self, params):
+        types = parse_list(params.get("types")) or ["public_channel"]
+        exclude_archived = parse_bool(params.get("exclude_archived"))
+
+        channels = [self.channel_info(channel) for channel in self.channels.values()
+                    if ("private_channel" if channel["is_private"] else "public_channel") in types
+                    and not (exclude_archived and channel["is_archived"])
+                    and (not channel["is_private"] or BOT_ID in channel["members"])]
+
+        page, metadata = self.paginate(channels, params)
+
+        return {"channels": page, "response_metadata": metadata}
+
+    def conversations_info(self, params):
+        return {"channel": self.channel_info(self.get_channel(params["channel"]))}
+
+    def conversations_members(self, params):
+        members, metadata = self.paginate(self.get_channel(params["channel"])["members"], params)
+
+        return {"members": members, "response_metadata": metadata}
+
+    def conversations_create(self, params):
+        name = params["name"]
+
+        if any(channel["name"] == name for channel in self.channels.values()):
+            raise SlackApiError("name_taken")
+
+        channel = self.add_channel(name, parse_bool(params.get("is_private")))
+
+        self.push_event({"type": "group_joined" if channel["is_private"] else "channel_created",
+                         "channel": self.channel_info(channel)})
+
+        return {"channel": self.channel_info(channel)}
+
+    def conversations_invite(self, params):
+        channel = self.get_channel(params["channel"])
+
+        for user_id in parse_list(params.get("users")):
+            if user_id not in self.users:
+                raise SlackApiError("user_not_found")
+
+            if user_id not in channel["members"]:
+                channel["members"].append(user_id)
+                self.push_event({"type": "member_joined_channel", "user": user_id, "channel": channel["id"],
+                                 "channel_type": "G" if channel["is_private"] else "C"})
+
+        return {"channel": self.channel_info(channel)}
+
+    def conversations_kick(self, params):
+        channel = self.get_channel(params["channel"])
+
+        if params["user"] not in channel["members"]:
+            raise SlackApiError("not_in_channel")
+
+        channel["members"].remove(params["user"])
+        self.push_event({"type": "member_left_channel", "user": params["user"], "channel": channel["id"],
+                         "channel_type": "G" if channel["is_private"] else "C"})
+
+        return {}
+
+    def conversations_rename(self, params):
+        channel = self.get_channel(params["channel"])
+        channel["name"] = params["name"]
+
+        self.push_event({"type": "group_rename" if channel["is_private"] else "channel_rename",
+                         "channel": {"id": channel["id"], "name": channel["name"], "created": channel["created"]}})
+
+        return {"channel": self.channel_info(channel)}
+
+    def conversations_set_purpose(self, params):
+        channel = self.get_channel(params["channel"])
+        channel["purpose"] = {"value": params["purpose"], "creator": BOT_ID, "last_set": int(time.time())}
+
+        self.store_message(channel["id"], BOT_ID, "set the channel purpose: {}".format(params["purpose"]),
+                           subtype="group_purpose" if channel["is_private"] else "channel_purpose",
+                           purpose=params["purpose"])
+
+        return {"purpose": params["purpose"]}
+
+    def conversations_set_topic(self, params):
+        channel = self.get_channel(params["channel"])
+        channel["topic"] = {"value": params["topic"], "creator": BOT_ID, "last_set": int(time.time())}
+
+        return {"topic": params["topic"]}
+
+    def conversations_archive(self, params):
+        channel = self.get_channel(params["channel"])
+
+        if channel["is_archived"]:
+            raise SlackApiError("already_archived")
+
+        channel["is_archived"] = True
+
+        self.push_event({"type": "group_archive" if channel["is_private"] else "channel_archive",
+                         "channel": channel["id"], "user": BOT_ID})
+
+        return {}
+
+    def conversations_history(self, params):
+        messages = list(reversed(self.messages.get(self.get_channel(params["channel"])["id"], [])))
+        latest = params.get("latest")
+        inclusive = parse_bool(params.get("inclusive"))
+
+        if latest:
+            messages = [msg for msg in messages if float(msg["ts"]) < float(latest)
+                        or (inclusive and msg["ts"] == latest)]
+
+        count = int(params.get("limit") or params.get("count") or 100)
+
+        return {"messages": messages[:count], "has_more": len(messages) > count}
+
+    def chat_post_message(self, params):
+        channel_id = params["channel"]
+
+        # Messages to a user id are direct messages
+        if channel_id in self.users:
+            channel_id = "D" + channel_id[1:]
+        else:
+            self.get_channel(channel_id)
+
+        message = self.store_message(channel_id, BOT_ID, params.get("text", ""), params.get("thread_ts"))
+
+        return {"channel": channel_id, "ts": message["ts"], "message": message}
+
+    def chat_update(self, params):
+        message = self.get_message(params["channel"], params["ts"])
+        message["text"] = params.get("text", "")
+
+        self.push_event({"type": "message", "subtype": "message_changed", "channel": params["channel"],
+                         "message": dict(message), "ts": self.next_ts()})
+
+        return {"channel": params["channel"], "ts": message["ts"], "text": message["text"]}
+
+    def chat_delete(self, params):
+        message = self.get_message(params["channel"], params["ts"])
+        self.messages[params["channel"]].remove(message)
+
+        self.push_event({"type": "message", "subtype": "message_deleted", "channel": params["channel"],
+                         "deleted_ts": message["ts"], "previous_message": message, "ts": self.next_ts()})
+
+        return {"channel": params["channel"], "ts": message["ts"]}
+
+    def reactions_add(self, params):
+        message = self.get_message(params["channel"], params["timestamp"])
+        reactions = message.setdefault("reactions", {})
+
+        if BOT_ID in reactions.get(params["name"], []):
+            raise SlackApiError("already_reacted")
+
+        reactions.setdefault(params["name"], []).append(BOT_ID)
+
+        self.push_event({"type": "reaction_added", "user": BOT_ID, "reaction": params["name"],
+                         "item": {"type": "message", "channel": params["channel"], "ts": message["ts"]}})
+
+        return {}
+
+    def reactions_remove(self, params):
+        message = self.get_message(params["channel"], params["timestamp"])
+        users = message.get("reactions", {}).get(params["name"], [])
+
+        if BOT_ID not in users:
+            raise SlackApiError("no_reaction")
+
+        users.remove(BOT_ID)
+
+        self.push_event({"type": "reaction_removed", "user": BOT_ID, "reaction": params["name"],
+                         "item": {"type": "message", "channel": params["channel"], "ts": message["ts"]}})
+
+        return {}
+
+    def pins_add(self, params):
+        self.get_message(params["channel"], params["timestamp"])
+
+        if params["timestamp"] in self.pins[params["channel"]]:
+            raise SlackApiError("already_pinned")
+
+        self.pins[params["channel"]].add(params["timestamp"])
+
+        return {}
+
+    def pins_remove(self, params):
+        if params["timestamp"] not in self.pins[params["channel"]]:
+            raise SlackApiError("no_pin")
+
+        self.pins[params["channel"]].discard(params["timestamp"])
+
+        return {}
+
+    def reminders_add(self, params):
+        reminder = {
+            "id": self.next_id("Rm"),
+            "creator": BOT_ID,
+            "user": params.get("user", BOT_ID),
+            "text": params["text"],
+            "recurring": False,
+            "time": int(time.time()),
+            "complete_ts": 0
+        }
+
+        self.reminders[reminder["id"]] = reminder
+
+        return {"reminder": reminder}
+
+    def reminders_list(self, params):
+        return {"reminders": list(self.reminders.values())}
+
+    def reminders_delete(self, params):
+        if not self.reminders.pop(params["reminder"], None):
+            raise SlackApiError("not_found")
+
+        return {}
+
+
+class FakeSlackHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, server_address, handler_class, fake_slack):
+        super().__init__(server_address, handler_class)
+        self.fake_slack = fake_slack
+
+
+class FakeSlackRequestHandler(BaseHTTPRequestHandler):
+    """Serves api calls (POST /api/<method>) and the RTM websocket (GET /rtm)."""
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, response, headers):
+        body = json.dumps(response).encode()
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+
+        for header, value in headers.items():
+            self.send_header(header, value)
+
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        path = urllib.parse.urlparse(self.path).path
+
+        if not path.startswith("/api/"):
+            self.send_error(404)
+            return
+
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0)).decode()
+        params = {key: values[-1] for key, values in urllib.parse.parse_qs(body).items()}
+
+        status, response, headers = self.server.fake_slack.handle_api_call(path[len("/api/"):], params)
+
+        self.send_json(status, response, headers)
+
+    def do_GET(self):
+        if urllib.parse.urlparse(self.path).path != "/rtm" or "Sec-WebSocket-Key" not in self.headers:
+            self.send_error(404)
+            return
+
+        accept = base64.b64encode(hashlib.sha1((self.headers["Sec-WebSocket-Key"] +
+                                                WEBSOCKET_GUID).encode()).digest()).decode()
+
+        self.send_response(101, "Switching Protocols")
+        self.send_header("Upgrade", "websocket")
+        self.send_header("Connection", "Upgrade")
+        self.send_header("Sec-WebSocket-Accept", accept)
+        self.end_headers()
+        self.wfile.flush()
+
+        fake_slack = self.server.fake_slack
+        event_queue = fake_slack.register_socket()
+
+        try:
+            self.send_frame(0x1, json.dumps({"type": "hello"}).encode())
+            self.serve_websocket(event_queue)
+        except (OSError, ConnectionError):
+            pass
+        finally:
+            fake_slack.unregister_socket(event_queue)
+            self.close_connection = True
+
+    def serve_websocket(self, event_queue):
+        while True:
+            try:
+                event = event_queue.get(timeout=0.05)
+            except queue.Empty:
+                event = False
+
+            if event is None:
+                self.send_frame(0x8, b"")
+                return
+
+            if event:
+                self.send_frame(0x1, json.dumps(event).encode())
+
+            readable, _, _ = select.select([self.connection], [], [], 0)
+
+            if readable:
+                opcode, payload = self.read_frame()
+
+                if opcode is None or opcode == 0x8:
+                    return
+
+                if opcode == 0x9:
+                    self.send_frame(0xA, payload)
+                elif opcode == 0x1:
+                    # Messages sent by the client (f.e. typing indicators) are acknowledged like slack does
+                    message = json.loads(payload.decode() or "{}")
+
+                    if "id" in message:
+                        self.send_frame(0x1, json.dumps({"ok": True, "reply_to": message["id"]}).encode())
+
+    def send_frame(self, opcode, payload):
+        header = bytes([0x80 | opcode])
+
+        if len(payload) < 126:
+            header += bytes([len(payload)])
+        elif len(payload) < 65536:
+            header += bytes([126]) + struct.pack("!H", len(payload))
+        else:
+            header += bytes([127]) + struct.pack("!Q", len(payload))
+
+        self.connection.sendall(header + payload)
+
+    def read_exact(self, size):
+        data = b""
+
+        while len(data) < size:
+            chunk = self.rfile.read(size - len(data))
+
+            if not chunk:
+                raise ConnectionError("websocket closed")
+
+            data += chunk
+
+        return data
+
+    def read_frame(self):
+        """Read a (masked) client frame and return its opcode and payload."""
+        try:
+            first, second = self.read_exact(2)
+        except ConnectionError:
+            return None, None
+
+        length = second & 0x7F
+
+        if length == 126:
+            length = struct.unpack("!H", self.read_exact(2))[0]
+        elif length == 127:
+            length = struct.unpack("!Q", self.read_exact(8))[0]
+
+        mask = self.read_exact(4) if second & 0x80 else b"\0\0\0\0"
+        payload = bytes(byte ^ mask[i % 4] for i, byte in enumerate(self.read_exact(length)))
+
+        return first & 0x0F, payload
+
+
+def main():
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8765
+    users = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    latency = float(sys.argv[3]) if len(sys.argv) > 3 else 0.0
+
+    fake_slack = FakeSlack(latency=latency)
+    fake_slack.add_users(users)
+    fake_slack.start(port=port)
+
+    print("Fake slack listening on {} (set slack_api_url to this url)".format(fake_slack.api_url))
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        fake_slack.stop()
+
+
+if __name__ == "__main__":
+    main()
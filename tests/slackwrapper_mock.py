@@ -20,6 +20,9 @@ class SlackWrapperMock:
         self.connected = True
 
         self.message_list = []
+        self.archived_channels = []
+        self.updated_messages = []
+        self.pinned_messages = []
 
         # create default slack responses (these responses can be swapped for more specific unit tests in the unit test itself)
         self.create_channel_private_response = self.read_test_file(
@@ -46,6 +49,9 @@ class SlackWrapperMock:
         """Read from the real-time messaging API."""
         return "mocked response"
 
+    def update_from_event(self, event):
+        pass
+
     def invite_user(self, user, channel, is_private=False):
         # TODO: Add test response for invite_user
         return None
@@ -94,9 +100,27 @@ class SlackWrapperMock:
         """
         self.push_message(channel_id, str(text))
 
+    def send_message(self, channel_id, text, timestamp="", parse="full"):
+        """Post a message in a given channel and return the api result."""
+        self.push_message(channel_id, str(text))
+
+        return {"ok": True, "channel": channel_id, "ts": "1549715670.002000"}
+
+    def get_outbox_stats(self):
+        return {"depth": 0, "channels": {}, "retrying": 0, "sent": len(self.message_list), "coalesced": 0, "failed": 0,
+                "avg_latency": 0, "max_latency": 0}
+
     def post_message_with_react(self, channel_id, text, reaction, parse="full"):
         """Post a message in a given channel and add the specified reaction to it."""
-        self.push_message(channel_id, text)
+        return self.send_message(channel_id, text, parse=parse)
+
+    def pin_message(self, channel_id, timestamp):
+        self.pinned_messages.append((channel_id, timestamp))
+        return {"ok": True}
+
+    def unpin_message(self, channel_id, timestamp):
+        self.pinned_messages.remove((channel_id, timestamp))
+        return {"ok": True}
 
     def get_message(self, channel_id, timestamp):
         """Retrieve a message from the channel with the specified timestamp."""
@@ -105,8 +129,7 @@ class SlackWrapperMock:
 
     def update_message(self, channel_id, msg_timestamp, text, parse="full"):
         """Update a message, identified by the specified timestamp with a new text."""
-        # TODO: Add test response for update_message
-        pass
+        self.updated_messages.append((channel_id, msg_timestamp, text))
 
     def get_public_channels(self):
         """Fetch all public channels."""
@@ -116,6 +139,24 @@ class SlackWrapperMock:
         """Fetch all private channels in which the user participates."""
         return json.loads(self.get_private_channels_response)
 
+    def iter_channel_pages(self, types, exclude_archived=False):
+        """Yield the channels of the given types page by page."""
+        types = [types] if type(types) != list else types
+
+        for channel_type in types:
+            if channel_type == "private_channel":
+                yield self.get_private_channels()["groups"]
+            elif channel_type == "public_channel":
+                yield self.get_public_channels()["channels"]
+
+    def iter_channel_members(self, channel_id):
+        return iter([])
+
+    def archive_channel(self, channel_id):
+        """Archive a channel"""
+        self.archived_channels.append(channel_id)
+        return {"ok": True}
+
     def archive_private_channel(self, channel_id):
         """Archive a private channel"""
         # TODO: The git handler must be mocked before testing archive command to avoid uploading test cases
@@ -0,0 +1,107 @@
+"""Cache of channel metadata, which is kept current from RTM events."""
+import json
+import threading
+
+
+class ChannelDirectory:
+    """
+    Keeps channel metadata (as returned by conversations.info) by channel id
+    and an index from channel name to channel id.
+    """
+
+    # RTM events, which carry the complete (or at least the new) channel object
+    CHANNEL_UPDATE_EVENTS = ("channel_created", "channel_joined", "channel_rename", "group_joined", "group_rename")
+    # RTM events, which only carry the channel id
+    CHANNEL_ARCHIVE_EVENTS = ("channel_archive", "group_archive")
+    CHANNEL_UNARCHIVE_EVENTS = ("channel_unarchive", "group_unarchive")
+    CHANNEL_REMOVE_EVENTS = ("channel_deleted", "group_deleted", "group_left")
+    PURPOSE_SUBTYPES = ("channel_purpose", "group_purpose")
+
+    def __init__(self):
+        self.channels = {}
+        self.name_index = {}
+        self.loaded = False
+        self.lock = threading.RLock()
+
+    def load(self, channels):
+        """Fill the directory from a complete channel listing."""
+        with self.lock:
+            for channel in channels:
+                self.update(channel)
+
+            self.loaded = True
+
+    def get(self, channel_id):
+        """Return the cached metadata for a channel id or None if it's unknown."""
+        with self.lock:
+            return self.channels.get(channel_id)
+
+    def get_info(self, channel_id):
+        """
+        Return the cached metadata for a channel id, if it's complete enough to replace
+        a conversations.info call (channels only seen in events might miss their purpose).
+        """
+        with self.lock:
+            cached = self.channels.get(channel_id)
+
+            return cached if cached and "purpose" in cached else None
+
+    def get_by_name(self, name):
+        """Return the cached metadata for a channel name or None if it's unknown."""
+        with self.lock:
+            channel_id = self.name_index.get(name)
+
+            return self.channels.get(channel_id) if channel_id else None
+
+    def update(self, channel):
+        """Add or update the metadata of a channel (unknown fields of a known channel are kept)."""
+        with self.lock:
+            cached = self.channels.setdefault(channel["id"], {"id": channel["id"]})
+            old_name = cached.get("name")
+
+            cached.update(channel)
+
+            if old_name and old_name != cached.get("name") and self.name_index.get(old_name) == channel["id"]:
+                del self.name_index[old_name]
+
+            if cached.get("name"):
+                self.name_index[cached["name"]] = channel["id"]
+
+    def remove(self, channel_id):
+        with self.lock:
+            cached = self.channels.pop(channel_id, None)
+
+            if cached and self.name_index.get(cached.get("name")) == channel_id:
+                del self.name_index[cached["name"]]
+
+    def rename(self, channel_id, name):
+        self.update({"id": channel_id, "name": name})
+
+    def set_archived(self, channel_id, is_archived=True):
+        with self.lock:
+            if channel_id in self.channels:
+                self.channels[channel_id]["is_archived"] = is_archived
+
+    def set_purpose(self, channel_id, purpose):
+        """Update the cached purpose of a channel (purpose may be a string or a json object)."""
+        if not isinstance(purpose, str):
+            purpose = json.dumps(purpose)
+
+        with self.lock:
+            if channel_id in self.channels:
+                self.channels[channel_id].setdefault("purpose", {})["value"] = purpose
+
+    def handle_event(self, event):
+        """Apply an RTM event to the directory."""
+        event_type = event.get("type")
+
+        if event_type in self.CHANNEL_UPDATE_EVENTS:
+            self.update(event["channel"])
+        elif event_type in self.CHANNEL_ARCHIVE_EVENTS:
+            self.set_archived(event["channel"])
+        elif event_type in self.CHANNEL_UNARCHIVE_EVENTS:
+            self.set_archived(event["channel"], False)
+        elif event_type in self.CHANNEL_REMOVE_EVENTS:
+            self.remove(event["channel"])
+        elif event_type == "message" and event.get("subtype") in self.PURPOSE_SUBTYPES and "purpose" in event:
+            self.set_purpose(event["channel"], event["purpose"])
@@ -1,37 +1,100 @@
 """Module for resolving ctf data to SolveTracker templates."""
+import os
+import re
+import threading
 import time
 import json
 
+PLACEHOLDER_PATTERN = re.compile(r"\{(\w+)\}")
 
-def resolve_ctf_template(ctf, title, template_file, solves_template_file):
-    """Resolves the placeholder in the ctf template with the specified ctf data."""
-    with open(template_file, "r") as f:
-        template_data = f.read()
 
-    with open(solves_template_file, "r") as f:
-        solve_template_data = f.read()
+class CompiledTemplate:
+    """
+    A template, which has been split into literal text and placeholders once,
+    so it can be rendered in a single pass.
+    """
 
-    challenge_data = []
+    def __init__(self, template_data):
+        self.segments = []
 
-    for challenge in filter(lambda c: c.is_solved, ctf.challenges):
-        chall_value = solve_template_data
+        pos = 0
+        for match in PLACEHOLDER_PATTERN.finditer(template_data):
+            self.segments.append((template_data[pos:match.start()], match.group(1)))
+            pos = match.end()
+
+        self.segments.append((template_data[pos:], None))
+
+    def render_into(self, parts, values):
+        """Append the rendered template to the list parts. Unknown placeholders are kept as they are."""
+        for literal, placeholder in self.segments:
+            if literal:
+                parts.append(literal)
+
+            if placeholder is not None:
+                value = values.get(placeholder)
+                parts.append(value if value is not None else "{" + placeholder + "}")
+
+    def render(self, values):
+        """Return the rendered template."""
+        parts = []
+        self.render_into(parts, values)
+
+        return "".join(parts)
+
+
+_template_cache = {}
+_template_cache_lock = threading.Lock()
 
-        chall_value = chall_value.replace("{name}", challenge.name)
-        chall_value = chall_value.replace("{solver}", ", ".join(challenge.solver))
-        chall_value = chall_value.replace("{solve_date}", time.ctime(challenge.solve_date))
-        chall_value = chall_value.replace("{category}", challenge.category if challenge.category else "")
 
-        chall_value = chall_value.replace("{name_with_category}", "{}{}".format(
-            challenge.name, " ({})".format(challenge.category) if challenge.category else ""))
+def load_template(template_file):
+    """Return the compiled template for a file. Templates are only read again, if the file was modified."""
+    mtime = os.stat(template_file).st_mtime_ns
 
-        challenge_data.append(chall_value)
+    with _template_cache_lock:
+        cached = _template_cache.get(template_file)
 
-    template_data = template_data.replace("{title}", title)
-    template_data = template_data.replace("{name}", ctf.name)
-    template_data = template_data.replace("{date_now}", time.ctime(time.time()))
-    template_data = template_data.replace("{challenges}", "".join(challenge_data))
+        if cached and cached[0] == mtime:
+            return cached[1]
 
-    return template_data
+    with open(template_file, "r") as f:
+        template = CompiledTemplate(f.read())
+
+    with _template_cache_lock:
+        _template_cache[template_file] = (mtime, template)
+
+    return template
+
+
+def resolve_ctf_template(ctf, title, template_file, solves_template_file):
+    """Resolves the placeholder in the ctf template with the specified ctf data."""
+    template = load_template(template_file)
+    solve_template = load_template(solves_template_file)
+
+    challenge_parts = []
+    solve_dates = {}
+
+    for challenge in filter(lambda c: c.is_solved, ctf.challenges):
+        solve_date = solve_dates.get(challenge.solve_date)
+
+        if solve_date is None:
+            solve_date = solve_dates[challenge.solve_date] = time.ctime(challenge.solve_date)
+
+        category = challenge.category if challenge.category else ""
+
+        solve_template.render_into(challenge_parts, {
+            "name": challenge.name,
+            "solver": ", ".join(challenge.solver),
+            "solve_date": solve_date,
+            "category": category,
+            "name_with_category": "{} ({})".format(challenge.name, category) if category else challenge.name
+        })
+
+    return template.render({
+        "title": title,
+        "name": ctf.name,
+        "date_now": time.ctime(time.time()),
+        "challenges": "".join(challenge_parts)
+    })
 
 
 def resolve_stats_template(ctf):
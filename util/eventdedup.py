@@ -0,0 +1,74 @@
+"""Suppression of RTM events, which slack delivers more than once (f.e. after a reconnect)."""
+import collections
+import time
+
+DEDUP_CACHE_SIZE = 2000     # number of event keys to remember
+DEDUP_WINDOW = 600          # seconds, in which a repeated event counts as duplicate
+
+
+def event_key(event):
+    """
+    Return the key identifying an event or None, if it can't be identified.
+    Messages are identified by their client_msg_id (or channel and timestamp), other events
+    by their type, channel, user and event timestamp.
+    """
+    event_type = event.get("type")
+
+    if event_type == "message":
+        if event.get("client_msg_id"):
+            return ("message", event["client_msg_id"])
+
+        if event.get("ts"):
+            return ("message", event.get("channel"), event["ts"], event.get("subtype"))
+
+        return None
+
+    if event.get("event_ts"):
+        item = event.get("item") if isinstance(event.get("item"), dict) else {}
+        channel = event.get("channel") if isinstance(event.get("channel"), str) else item.get("channel")
+
+        return (event_type, channel, event.get("user"), event.get("reaction"), event["event_ts"])
+
+    return None
+
+
+class EventDeduplicator:
+    """Bounded, time-windowed set of the keys of recently seen events."""
+
+    def __init__(self, max_size=DEDUP_CACHE_SIZE, window=DEDUP_WINDOW):
+        self.max_size = max_size
+        self.window = window
+        self.seen = collections.OrderedDict()
+        self.suppressed = 0
+        self.suppressed_by_type = collections.Counter()
+
+    def is_duplicate(self, event):
+        """Check if the event was already seen (and remember it otherwise)."""
+        key = event_key(event)
+
+        if key is None:
+            return False
+
+        now = time.monotonic()
+
+        # Forget expired keys (the oldest keys are always at the front)
+        while self.seen:
+            oldest_key, seen_at = next(iter(self.seen.items()))
+
+            if now - seen_at <= self.window and len(self.seen) < self.max_size:
+                break
+
+            del self.seen[oldest_key]
+
+        if key in self.seen:
+            self.suppressed += 1
+            self.suppressed_by_type[event.get("type")] += 1
+            return True
+
+        self.seen[key] = now
+
+        return False
+
+    def filter(self, events):
+        """Return the events, which weren't seen before."""
+        return [event for event in events if not self.is_duplicate(event)]
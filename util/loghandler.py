@@ -1,33 +1,131 @@
 #!/usr/bin/python
+"""
+Logging setup of the bot.
+
+Records are put into a queue by the logging call and formatted/written by a
+background listener, so console and file I/O don't block the bot thread.
+"""
+import atexit
+import json
 import logging
+import logging.handlers
 import os
+import queue
 
 CONSOLELOGLEVEL = logging.DEBUG
 LOGDIR = "logs"
 LOGPREFIX = "bot"
 
-# Someone fix this ;)
-# Didn't get 'log' available for other modules...
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+
+# Fields, which can be passed with `extra` and are included in structured log lines
+STRUCTURED_FIELDS = ("command", "handler", "arg_count", "channel", "user", "duration", "slack_calls", "phases")
 
 log = logging.getLogger("log")
 
 log.setLevel(logging.DEBUG)
 
-# Error log file
-if not os.path.exists(LOGDIR):
-    os.makedirs(LOGDIR)
 
-elog = logging.FileHandler(os.path.join(LOGDIR, "{}_error.log".format(LOGPREFIX)))
-elog.setLevel(logging.ERROR)
+class JsonFormatter(logging.Formatter):
+    """Format records as JSON lines (including the structured fields passed with `extra`)."""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "module": record.module,
+            "message": record.getMessage()
+        }
+
+        for field in STRUCTURED_FIELDS:
+            if hasattr(record, field):
+                entry[field] = getattr(record, field)
+
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+
+        return json.dumps(entry)
+
+
+def create_formatter(log_format):
+    if log_format == "json":
+        return JsonFormatter()
+
+    return logging.Formatter("%(asctime)s - %(module)-20s - %(message)s")
+
+
+def create_file_handler(filename, max_bytes, backup_count, rotate_when):
+    """Create a file handler rotating by time (if rotate_when is set) or by size."""
+    if rotate_when:
+        return logging.handlers.TimedRotatingFileHandler(filename, when=rotate_when, backupCount=backup_count)
+
+    return logging.handlers.RotatingFileHandler(filename, maxBytes=max_bytes, backupCount=backup_count)
+
+
+_listener = None
+
+
+def configure_logging(level=logging.DEBUG, log_format="text", max_bytes=LOG_MAX_BYTES,
+                      backup_count=LOG_BACKUP_COUNT, rotate_when=None):
+    """
+    (Re)configure the bot logger.
+
+    level : Level of the logger (name or number)
+    log_format : "text" or "json" (JSON lines with structured fields)
+    max_bytes, backup_count : Size-based rotation of the log files
+    rotate_when : Time-based rotation instead (f.e. "midnight", see TimedRotatingFileHandler)
+    """
+    global _listener
+
+    if not os.path.exists(LOGDIR):
+        os.makedirs(LOGDIR)
+
+    formatter = create_formatter(log_format)
+
+    # Error log file
+    elog = create_file_handler(os.path.join(LOGDIR, "{}_error.log".format(LOGPREFIX)),
+                               max_bytes, backup_count, rotate_when)
+    elog.setLevel(logging.ERROR)
+    elog.setFormatter(formatter)
+
+    # Console logging
+    clog = logging.StreamHandler()
+    clog.setLevel(CONSOLELOGLEVEL)
+    clog.setFormatter(formatter)
+
+    handlers = [elog, clog]
+
+    # The structured log contains everything the logger lets through
+    if log_format == "json":
+        jlog = create_file_handler(os.path.join(LOGDIR, "{}.jsonl".format(LOGPREFIX)),
+                                   max_bytes, backup_count, rotate_when)
+        jlog.setFormatter(formatter)
+        handlers.append(jlog)
+
+    if _listener:
+        _listener.stop()
+
+        for handler in _listener.handlers:
+            handler.close()
+
+    for handler in list(log.handlers):
+        log.removeHandler(handler)
+
+    log_queue = queue.Queue()
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+    log.addHandler(logging.handlers.QueueHandler(log_queue))
+    log.setLevel(level if isinstance(level, int) else str(level).upper())
 
-# Console logging
-clog = logging.StreamHandler()
-clog.setLevel(CONSOLELOGLEVEL)
 
-formatter = logging.Formatter("%(asctime)s - %(module)-20s - %(message)s")
+def stop_logging():
+    """Write all queued records and stop the background listener."""
+    if _listener:
+        _listener.stop()
 
-clog.setFormatter(formatter)
-elog.setFormatter(formatter)
 
-log.addHandler(elog)
-log.addHandler(clog)
+configure_logging()
+atexit.register(stop_logging)
@@ -0,0 +1,240 @@
+"""Outbound message queue, which paces and coalesces messages per channel."""
+import collections
+import threading
+import time
+
+from util.loghandler import log
+from util.tracing import tracer
+
+MESSAGE_INTERVAL = 1.0      # seconds between two posts to the same channel
+COALESCE_WINDOW = 2.0       # messages queued within this time after the first one are merged
+MAX_MESSAGE_LENGTH = 4000   # merged messages don't grow beyond this length
+SEND_RETRIES = 3
+SEND_BACKOFF = 1.0          # seconds, doubled on every failed attempt
+SEND_TIMEOUT = 30.0         # seconds, send() waits for a message to be posted
+
+# Errors, which won't go away by retrying
+PERMANENT_ERRORS = ("channel_not_found", "not_in_channel", "is_archived", "msg_too_long", "no_text",
+                    "invalid_auth", "not_authed", "account_inactive", "restricted_action")
+
+
+class OutboxMessage:
+    """A message waiting in the outbox."""
+
+    def __init__(self, channel_id, text, thread_ts="", parse="full", coalesce=True):
+        self.channel_id = channel_id
+        self.text = text
+        self.thread_ts = thread_ts
+        self.parse = parse
+        self.coalesce = coalesce
+        self.enqueued = time.monotonic()
+        self.attempts = 0
+        self.result = None
+        self.done = threading.Event()
+        self.trace = tracer.active()   # span, which queued the message (its post is recorded below it)
+
+    def can_merge(self, other):
+        """Check, if other can be appended to this message."""
+        return (self.coalesce and other.coalesce and self.thread_ts == other.thread_ts and self.parse == other.parse
+                and other.enqueued - self.enqueued <= COALESCE_WINDOW)
+
+
+class Outbox(threading.Thread):
+    """
+    Background worker, which posts queued messages.
+    Every channel has its own queue and is paced to one post per MESSAGE_INTERVAL.
+    Consecutive messages to the same channel are merged into one post.
+    Failed posts are retried after a backoff, without holding up the other channels.
+    """
+
+    def __init__(self, send_func, interval=MESSAGE_INTERVAL):
+        """
+        send_func : Function (channel_id, text, thread_ts, parse) posting a message and returning the api result
+        """
+        threading.Thread.__init__(self, daemon=True)
+        self.send_func = send_func
+        self.interval = interval
+        self.queues = collections.OrderedDict()
+        self.retrying = collections.OrderedDict()   # channel id -> batch waiting for another attempt
+        self.next_send = {}
+        self.condition = threading.Condition()
+        self.running = True
+        self.sending = 0
+
+        self.sent = 0
+        self.coalesced = 0
+        self.failed = 0
+        self.latencies = collections.deque(maxlen=100)
+
+    def _queue(self, message):
+        with self.condition:
+            self.queues.setdefault(message.channel_id, collections.deque()).append(message)
+            self.condition.notify()
+
+    def enqueue(self, channel_id, text, thread_ts="", parse="full", coalesce=True):
+        """Queue a message and return it (its done event is set, when it was posted)."""
+        # The message is posted after the span has finished (its post is recorded below the span)
+        with tracer.span("Outbox.enqueue", "outbox", channel=channel_id):
+            message = OutboxMessage(channel_id, str(text), thread_ts, parse, coalesce)
+            self._queue(message)
+
+        return message
+
+    def send(self, channel_id, text, thread_ts="", parse="full", timeout=SEND_TIMEOUT):
+        """
+        Queue a message (without merging it) and wait until it was posted. Return the api result.
+        If the message wasn't posted within the timeout, it stays queued and a timeout error is returned.
+        """
+        if not self.is_alive():
+            return self.send_func(channel_id, str(text), thread_ts, parse)
+
+        # Waiting for the pacing of the channel is part of the api call for the caller
+        with tracer.span("Outbox.send", "http", channel=channel_id):
+            message = OutboxMessage(channel_id, str(text), thread_ts, parse, coalesce=False)
+            self._queue(message)
+
+            if not message.done.wait(timeout):
+                log.warning("Posting to %s didn't finish within %.1fs", channel_id, timeout)
+                return {"ok": False, "error": "timeout"}
+
+        return message.result
+
+    def stop(self):
+        """Stop the worker, after all queued messages were posted."""
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+
+    def flush(self, timeout=None):
+        """Wait until all queued messages were posted. Return False, if the timeout expired before."""
+        with self.condition:
+            return self.condition.wait_for(lambda: not self.queues and not self.retrying and not self.sending,
+                                           timeout)
+
+    def depth(self):
+        """Return the number of queued messages (including messages waiting for a retry)."""
+        with self.condition:
+            return (sum(len(queue) for queue in self.queues.values()) +
+                    sum(len(batch) for batch in self.retrying.values()))
+
+    def stats(self):
+        """Return a dictionary describing the state of the outbox."""
+        with self.condition:
+            latencies = list(self.latencies)
+
+            return {
+                "depth": (sum(len(queue) for queue in self.queues.values()) +
+                          sum(len(batch) for batch in self.retrying.values())),
+                "channels": {channel_id: len(queue) for channel_id, queue in self.queues.items()},
+                "retrying": len(self.retrying),
+                "sent": self.sent,
+                "coalesced": self.coalesced,
+                "failed": self.failed,
+                "avg_latency": sum(latencies) / len(latencies) if latencies else 0,
+                "max_latency": max(latencies) if latencies else 0
+            }
+
+    def next_batch(self):
+        """
+        Return the channel and the list of messages, which should be posted next, or the time to wait
+        until one channel may be posted to again (must be called with the condition held).
+        """
+        now = time.monotonic()
+        wait = None
+
+        # Failed batches are retried before newer messages to the same channel
+        channels = list(self.retrying) + [channel_id for channel_id in self.queues if channel_id not in self.retrying]
+
+        for channel_id in channels:
+            ready = self.next_send.get(channel_id, 0)
+
+            if ready > now:
+                wait = min(wait, ready - now) if wait is not None else ready - now
+                continue
+
+            if channel_id in self.retrying:
+                return self.retrying.pop(channel_id), None
+
+            queue = self.queues[channel_id]
+            batch = [queue.popleft()]
+            length = len(batch[0].text)
+
+            while queue and batch[0].can_merge(queue[0]) and length + len(queue[0].text) < MAX_MESSAGE_LENGTH:
+                length += len(queue[0].text) + 1
+                batch.append(queue.popleft())
+
+            if not queue:
+                del self.queues[channel_id]
+
+            return batch, None
+
+        return None, wait
+
+    def deliver(self, batch):
+        """Post a batch of messages as one message. Return the api result (or None, if the call failed)."""
+        first = batch[0]
+        first.attempts += 1
+
+        try:
+            with tracer.attach(first.trace):
+                result = self.send_func(first.channel_id, "\n".join(message.text for message in batch),
+                                        first.thread_ts, first.parse)
+
+            if not result.get("ok"):
+                log.warning("Posting to %s failed (attempt %d/%d): %s",
+                            first.channel_id, first.attempts, SEND_RETRIES, result.get("error"))
+
+            return result
+        except Exception as ex:
+            log.warning("Posting to %s failed (attempt %d/%d): %s", first.channel_id, first.attempts, SEND_RETRIES, ex)
+
+        return None
+
+    def run(self):
+        while True:
+            with self.condition:
+                batch, wait = self.next_batch()
+
+                while not batch:
+                    if not self.running and not self.queues and not self.retrying:
+                        return
+
+                    self.condition.wait(wait)
+                    batch, wait = self.next_batch()
+
+                self.sending += 1
+
+            result = self.deliver(batch)
+            now = time.monotonic()
+            channel_id = batch[0].channel_id
+            attempts = batch[0].attempts
+
+            with self.condition:
+                self.sending -= 1
+
+                # Temporary failures are retried later, the worker carries on with the other channels
+                if (not result or not (result.get("ok") or result.get("error") in PERMANENT_ERRORS)) and \
+                        attempts < SEND_RETRIES:
+                    self.retrying[channel_id] = batch
+                    self.next_send[channel_id] = now + SEND_BACKOFF * 2 ** (attempts - 1)
+                    self.condition.notify_all()
+                    continue
+
+                self.next_send[channel_id] = now + self.interval
+
+                if result and result.get("ok"):
+                    self.sent += 1
+                    self.coalesced += len(batch) - 1
+                else:
+                    self.failed += len(batch)
+                    log.error("Dropping %d message(s) to %s: %s", len(batch), channel_id,
+                              result.get("error") if result else "no response")
+
+                for message in batch:
+                    self.latencies.append(now - message.enqueued)
+
+                self.condition.notify_all()
+
+            for message in batch:
+                message.result = result
+                message.done.set()
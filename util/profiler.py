@@ -0,0 +1,203 @@
+"""
+Low-overhead profiling of the running bot.
+
+A sampling thread takes stack snapshots of all threads (sys._current_frames) at a fixed
+interval and counts them as collapsed stacks ("thread;outer;...;inner count"), which can
+be fed to flamegraph.pl or speedscope. Optionally, every processed command is additionally
+profiled with cProfile.
+"""
+import collections
+import cProfile
+import os
+import pstats
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from util.loghandler import LOGDIR, log
+
+SAMPLE_INTERVAL = 0.01      # seconds between two stack snapshots
+MAX_DURATION = 3600         # seconds, after which sampling stops by itself
+MAX_STACK_DEPTH = 64
+SUMMARY_SIZE = 10           # number of functions in the summary
+
+
+def frame_name(code):
+    return "{} ({}:{})".format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno)
+
+
+class StackSampler(threading.Thread):
+    """Thread counting the stacks of all other threads every interval seconds."""
+
+    def __init__(self, interval=SAMPLE_INTERVAL, max_duration=MAX_DURATION):
+        threading.Thread.__init__(self, name="StackSampler", daemon=True)
+        self.interval = interval
+        self.max_duration = max_duration
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self.stopped = threading.Event()
+
+    def sample(self):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == self.ident:
+                continue
+
+            stack = []
+
+            while frame and len(stack) < MAX_STACK_DEPTH:
+                stack.append(frame_name(frame.f_code))
+                frame = frame.f_back
+
+            stack.append(names.get(thread_id, str(thread_id)))
+            self.stacks[";".join(reversed(stack))] += 1
+
+        self.samples += 1
+
+    def run(self):
+        deadline = time.monotonic() + self.max_duration
+
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+            if time.monotonic() > deadline:
+                log.warning("Profiler reached its maximum duration, stopped sampling")
+                return
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def write_collapsed(self, filename):
+        with open(filename, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write("{} {}\n".format(stack, count))
+
+    def top_functions(self, thread_name, count):
+        """Return (function, self samples, total samples) of the busiest functions of a thread."""
+        self_samples = collections.Counter()
+        total_samples = collections.Counter()
+
+        for stack, samples in self.stacks.items():
+            frames = stack.split(";")
+
+            if frames[0] != thread_name:
+                continue
+
+            self_samples[frames[-1]] += samples
+
+            for function in set(frames[1:]):
+                total_samples[function] += samples
+
+        return [(function, samples, total_samples[function]) for function, samples in self_samples.most_common(count)]
+
+
+class ProfileSession:
+    """A running profile, started by an admin."""
+
+    def __init__(self, user_id, thread_name, use_cprofile):
+        self.user_id = user_id
+        self.thread_name = thread_name
+        self.started = time.time()
+        self.sampler = StackSampler()
+        self.stats = None
+        self.commands = 0
+        self.lock = threading.Lock()
+        self.use_cprofile = use_cprofile
+
+    def add_profile(self, profile):
+        with self.lock:
+            if self.stats is None:
+                self.stats = pstats.Stats(profile)
+            else:
+                self.stats.add(profile)
+
+            self.commands += 1
+
+
+class Profiler:
+    """Starts and stops profile sessions and profiles commands, while cProfile capture is enabled."""
+
+    def __init__(self):
+        self.session = None
+        self.local = threading.local()
+
+    @property
+    def running(self):
+        return self.session is not None
+
+    def start(self, user_id, use_cprofile=False):
+        """Start sampling the stacks (and profiling commands with cProfile, if enabled)."""
+        if self.session:
+            raise RuntimeError("The profiler is already running")
+
+        self.session = ProfileSession(user_id, threading.current_thread().name, use_cprofile)
+        self.session.sampler.start()
+
+        log.info("Profiler started by %s (cProfile: %s)", user_id, use_cprofile)
+
+    def stop(self):
+        """Stop the running session, write its results to the log directory and return a summary."""
+        session = self.session
+
+        if not session:
+            raise RuntimeError("The profiler isn't running")
+
+        self.session = None
+        session.sampler.stop()
+
+        prefix = os.path.join(LOGDIR, "profile_{}".format(time.strftime("%Y%m%d-%H%M%S",
+                                                                          time.localtime(session.started))))
+        session.sampler.write_collapsed(prefix + ".collapsed")
+
+        summary = "Profile of {:.1f}s ({} samples every {:.0f}ms)\n".format(
+            time.time() - session.started, session.sampler.samples, session.sampler.interval * 1000)
+        summary += "Collapsed stacks: `{}.collapsed`\n".format(prefix)
+        summary += "Top functions of the bot thread (self / total):\n"
+
+        samples = max(session.sampler.samples, 1)
+
+        for function, self_samples, total_samples in session.sampler.top_functions(session.thread_name, SUMMARY_SIZE):
+            summary += "\t{:5.1%} / {:5.1%}  {}\n".format(self_samples / samples, total_samples / samples, function)
+
+        if session.stats:
+            session.stats.dump_stats(prefix + ".pstats")
+
+            summary += "cProfile of {} commands: `{}.pstats`\n".format(session.commands, prefix)
+            summary += "Top functions by own time (calls, own / cumulative seconds):\n"
+
+            top = sorted(session.stats.stats.items(), key=lambda item: -item[1][2])[:SUMMARY_SIZE]
+
+            for (filename, line, function), (_, calls, own_time, cumulative_time, _) in top:
+                summary += "\t{} x{} : {:.3f}s / {:.3f}s\n".format(
+                    "{} ({}:{})".format(function, os.path.basename(filename), line), calls, own_time, cumulative_time)
+
+        log.info("Profiler stopped, results written to %s.*", prefix)
+
+        return summary
+
+    @contextmanager
+    def profile_command(self):
+        """Profile a command with cProfile, if the running session captures commands."""
+        session = self.session
+
+        # Nested commands (f.e. `!admin as`) are part of the outer profile
+        if not session or not session.use_cprofile or getattr(self.local, "active", False):
+            yield
+            return
+
+        profile = cProfile.Profile()
+        self.local.active = True
+        profile.enable()
+
+        try:
+            yield
+        finally:
+            profile.disable()
+            self.local.active = False
+            session.add_profile(profile)
+
+
+profiler = Profiler()
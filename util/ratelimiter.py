@@ -0,0 +1,118 @@
+"""Token bucket rate limiting for calls to the slack api."""
+import threading
+import time
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket.
+    Allows bursts of up to `burst` calls and refills `rate` calls per `per` seconds.
+    """
+
+    def __init__(self, rate, per=60.0, burst=None):
+        self.capacity = float(burst or rate)
+        self.fill_rate = rate / per
+        self.tokens = self.capacity
+        self.last_update = time.monotonic()
+        self.blocked_until = 0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_update) * self.fill_rate)
+        self.last_update = now
+
+    def acquire(self):
+        """Block until a call is allowed."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+
+                if now < self.blocked_until:
+                    wait = self.blocked_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                else:
+                    wait = (1 - self.tokens) / self.fill_rate
+
+            time.sleep(wait)
+
+    def block(self, seconds):
+        """Don't allow any calls for the specified time (f.e. after slack answered with HTTP 429)."""
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.tokens = 0
+
+
+class MethodRateLimiter:
+    """
+    Keeps a separate rate limiter for every api method, according to its rate limit tier.
+    Posting methods are limited per channel instead (like slack does), so busy channels
+    don't slow down the messages of other channels.
+    """
+
+    # Requests per minute for slack rate limit tiers (https://api.slack.com/docs/rate-limits)
+    TIERS = {1: 1, 2: 20, 3: 50, 4: 100}
+    DEFAULT_TIER = 3
+
+    METHOD_TIERS = {
+        "conversations.archive": 2,
+        "conversations.create": 2,
+        "conversations.list": 2,
+        "conversations.rename": 2,
+        "conversations.setPurpose": 2,
+        "conversations.setTopic": 2,
+        "groups.archive": 2,
+        "groups.rename": 2,
+        "channels.archive": 2,
+        "channels.rename": 2,
+        "reminders.add": 2,
+        "reminders.delete": 2,
+        "reminders.list": 2,
+        "users.list": 2,
+        "conversations.members": 4,
+        "users.info": 4,
+    }
+
+    # Methods limited per channel: about one call per second, with bursts for a message and its reactions
+    CHANNEL_METHODS = {"chat.postMessage", "chat.update", "chat.delete", "reactions.add", "reactions.remove",
+                       "pins.add", "pins.remove"}
+    CHANNEL_RATE = 60
+    CHANNEL_BURST = 10
+
+    def __init__(self):
+        self.limiters = {}
+        self.lock = threading.Lock()
+
+    def get(self, method, channel=None):
+        key = (method, channel) if method in self.CHANNEL_METHODS else method
+
+        with self.lock:
+            limiter = self.limiters.get(key)
+
+            if not limiter:
+                if method in self.CHANNEL_METHODS:
+                    limiter = RateLimiter(self.CHANNEL_RATE, burst=self.CHANNEL_BURST)
+                else:
+                    limiter = RateLimiter(self.TIERS[self.METHOD_TIERS.get(method, self.DEFAULT_TIER)])
+
+                self.limiters[key] = limiter
+
+            return limiter
+
+    def acquire(self, method, channel=None):
+        self.get(method, channel).acquire()
+
+    def block(self, method, seconds, channel=None):
+        self.get(method, channel).block(seconds)
+
+
+class UnlimitedRateLimiter:
+    """Drop-in replacement for MethodRateLimiter, which lets every call pass (f.e. for a local slack server)."""
+
+    def acquire(self, method, channel=None):
+        pass
+
+    def block(self, method, seconds, channel=None):
+        pass
@@ -0,0 +1,51 @@
+"""Recording of the raw RTM event stream (for replaying the load of a real ctf, see benchmarks/replay_rtm.py)."""
+import gzip
+import json
+import time
+
+from util.loghandler import log
+
+RECORD_FLUSH_INTERVAL = 5   # seconds, after which buffered batches are written to the file
+
+
+class RtmRecorder:
+    """
+    Appends the batches returned by rtm_read to a gzip compressed JSON lines file.
+    Every line is either {"time": ..., "events": [...]} or {"time": ..., "connect": {...}}
+    (written after every (re)connect with the id and name of the bot user).
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = gzip.open(filename, "at", encoding="utf-8")
+        self.last_flush = time.monotonic()
+        self.batches = 0
+
+    def write_line(self, entry):
+        try:
+            self.file.write(json.dumps(entry) + "\n")
+
+            if time.monotonic() - self.last_flush >= RECORD_FLUSH_INTERVAL:
+                self.file.flush()
+                self.last_flush = time.monotonic()
+        except (IOError, ValueError):
+            log.exception("RtmRecorder::write_line()")
+
+    def write_connect(self, bot_id, bot_name):
+        self.write_line({"time": time.time(), "connect": {"bot_id": bot_id, "bot_name": bot_name}})
+
+    def write(self, events):
+        """Record a batch of events."""
+        self.batches += 1
+        self.write_line({"time": time.time(), "events": events})
+
+    def close(self):
+        self.file.close()
+
+
+def read_recording(filename):
+    """Yield the entries of a recording."""
+    with gzip.open(filename, "rt", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
@@ -0,0 +1,170 @@
+"""Persistent scheduler for delayed jobs (like archive reminders)."""
+import heapq
+import pickle
+import threading
+import time
+import uuid
+
+from util.loghandler import log
+
+
+class Job:
+    """A scheduled job."""
+
+    __slots__ = ("job_id", "due", "kind", "key", "data")
+
+    def __init__(self, job_id, due, kind, key, data):
+        """
+        job_id : Unique id of the job
+        due : Unix timestamp, when the job should run
+        kind : Name of the registered function, which runs the job
+        key : Key for cancelling related jobs (f.e. the channel id of a CTF)
+        data : Argument for the job function
+        """
+        self.job_id = job_id
+        self.due = due
+        self.kind = kind
+        self.key = key
+        self.data = data
+
+    def __getstate__(self):
+        return (self.job_id, self.due, self.kind, self.key, self.data)
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+
+class Scheduler:
+    """
+    Runs jobs, when they are due. Jobs are kept in a heap ordered by due time, so
+    scheduling and cancelling are O(log n). Cancelled jobs are only removed from the
+    heap lazily, when they reach its top (or when more than half of the heap is cancelled).
+    """
+
+    def __init__(self, filename=None):
+        self.filename = filename
+        self.lock = threading.RLock()
+        self.handlers = {}
+        self.jobs = {}
+        self.keys = {}
+        self.heap = []
+
+        for job in self.load():
+            self._add(job)
+
+    def load(self):
+        """Load the pending jobs from the scheduler file."""
+        if self.filename:
+            try:
+                with open(self.filename, "rb") as f:
+                    return pickle.load(f)
+            except (IOError, EOFError, pickle.UnpicklingError):
+                pass
+
+        return []
+
+    def save(self):
+        """Persist the pending jobs (must be called with the lock held)."""
+        if not self.filename:
+            return
+
+        try:
+            with open(self.filename, "wb") as f:
+                pickle.dump(list(self.jobs.values()), f, protocol=pickle.HIGHEST_PROTOCOL)
+        except IOError:
+            log.exception("Scheduler::save()")
+
+    def register(self, kind, func):
+        """Register the function running jobs of a kind (called with slack_wrapper and the job data)."""
+        self.handlers[kind] = func
+
+    def _add(self, job):
+        self.jobs[job.job_id] = job
+        self.keys.setdefault(job.key, set()).add(job.job_id)
+        heapq.heappush(self.heap, (job.due, job.job_id))
+
+    def _remove(self, job_id):
+        job = self.jobs.pop(job_id, None)
+
+        if job:
+            key_jobs = self.keys.get(job.key)
+            key_jobs.discard(job_id)
+
+            if not key_jobs:
+                del self.keys[job.key]
+
+        # Rebuild the heap, if it's mostly made of cancelled jobs
+        if len(self.heap) > 2 * len(self.jobs) + 16:
+            self.heap = [(due, job_id) for due, job_id in self.heap if job_id in self.jobs]
+            heapq.heapify(self.heap)
+
+        return job
+
+    def schedule(self, kind, delay, key=None, data=None):
+        """Schedule a job to run in delay seconds and return its id."""
+        with self.lock:
+            job = Job(uuid.uuid4().hex, time.time() + delay, kind, key, data)
+
+            self._add(job)
+            self.save()
+
+            return job.job_id
+
+    def cancel(self, job_id):
+        """Cancel a job. Return True, if it was pending."""
+        with self.lock:
+            job = self._remove(job_id)
+            self.save()
+
+            return job is not None
+
+    def cancel_key(self, key):
+        """Cancel all jobs with the specified key and return their number."""
+        with self.lock:
+            job_ids = list(self.keys.get(key, ()))
+
+            for job_id in job_ids:
+                self._remove(job_id)
+
+            if job_ids:
+                self.save()
+
+            return len(job_ids)
+
+    def pending(self, key=None):
+        """Return the pending jobs (with the specified key) ordered by due time."""
+        with self.lock:
+            jobs = self.jobs.values() if key is None else [self.jobs[job_id] for job_id in self.keys.get(key, ())]
+
+            return sorted(jobs, key=lambda job: job.due)
+
+    def pop_due(self, now=None):
+        """Remove and return all jobs, which are due."""
+        now = now if now is not None else time.time()
+        due = []
+
+        with self.lock:
+            while self.heap and self.heap[0][0] <= now:
+                _, job_id = heapq.heappop(self.heap)
+
+                if job_id in self.jobs:
+                    due.append(self._remove(job_id))
+
+            if due:
+                self.save()
+
+        return due
+
+    def run_pending(self, slack_wrapper, now=None):
+        """Run all due jobs."""
+        for job in self.pop_due(now):
+            func = self.handlers.get(job.kind)
+
+            if not func:
+                log.error("No handler registered for scheduled job %s (%s)", job.job_id, job.kind)
+                continue
+
+            try:
+                func(slack_wrapper, job.data)
+            except Exception:
+                log.exception("Scheduled job %s (%s) failed", job.job_id, job.kind)
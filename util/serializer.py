@@ -0,0 +1,62 @@
+"""
+Versioned serialization for the challenge database.
+
+A database file starts with a magic header and a format version, followed by the
+CTF dictionary pickled with the highest available protocol. Files without the
+header were written by older versions (plain pickle with the default protocol)
+and are migrated when loaded: the bottypes restore themselves from their old
+__dict__ state.
+"""
+import os
+import pickle
+import struct
+
+DB_MAGIC = b"OTADB"
+DB_VERSION = 1
+
+HEADER = struct.Struct("!5sH")
+
+
+class UnsupportedDatabaseVersion(Exception):
+    """Raised, if a database was written by a newer version of the bot."""
+
+    pass
+
+
+def dumps(ctfs):
+    """Serialize the CTF dictionary into the current database format."""
+    return HEADER.pack(DB_MAGIC, DB_VERSION) + pickle.dumps(ctfs, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def loads(data):
+    """Deserialize a CTF dictionary from the current or the legacy database format."""
+    if data[:len(DB_MAGIC)] != DB_MAGIC:
+        # Legacy database (plain pickle)
+        return pickle.loads(data)
+
+    _, version = HEADER.unpack_from(data)
+
+    if version > DB_VERSION:
+        raise UnsupportedDatabaseVersion("Database format version {} isn't supported (max. {})".format(
+            version, DB_VERSION))
+
+    return pickle.loads(data[HEADER.size:])
+
+
+def load(filename):
+    """Load a CTF dictionary from a database file."""
+    with open(filename, "rb") as f:
+        return loads(f.read())
+
+
+def dump(ctfs, filename):
+    """
+    Write a CTF dictionary to a database file.
+    The data is written to a temporary file first, so a crash can't leave a truncated database behind.
+    """
+    tmp_filename = "{}.tmp".format(filename)
+
+    with open(tmp_filename, "wb") as f:
+        f.write(dumps(ctfs))
+
+    os.replace(tmp_filename, filename)
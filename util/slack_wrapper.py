@@ -1,23 +1,67 @@
 import json
 import time
 
+import requests
 from slackclient import SlackClient
+from slackclient.slackrequest import SlackRequest
+from util.channeldirectory import ChannelDirectory
+from util.loghandler import log
+from util.outbox import Outbox
+from util.ratelimiter import MethodRateLimiter
+from util.tracing import trace_methods, tracer
 from util.util import load_json
 
+RATELIMIT_RETRIES = 3
+PAGE_LIMIT = 1000       # Maximum page size for cursor-paginated api methods
+MEMBER_CACHE_TTL = 300  # seconds, for which the member list is reused
 
+
+class BaseUrlSlackRequest(SlackRequest):
+    """Sends api calls to another base url than slack.com (f.e. a local slack server for testing)."""
+
+    def __init__(self, base_url, proxies=None):
+        super().__init__(proxies=proxies)
+        self.base_url = base_url.rstrip("/")
+
+    def post_http_request(self, token, api_method, post_data, files=None, timeout=None, domain=None):
+        if post_data is not None and "token" in post_data:
+            token = post_data["token"]
+
+        headers = {
+            "user-agent": self.get_user_agent(),
+            "Authorization": "Bearer {}".format(token)
+        }
+
+        return requests.post("{}/{}".format(self.base_url, api_method), headers=headers, data=post_data,
+                             files=files, timeout=timeout, proxies=self.proxies)
+
+
+@trace_methods("SlackWrapper", "slack", exclude=("read", "read_plain_websocket", "update_from_event", "api_call"))
 class SlackWrapper:
     """
     Slack API wrapper
     """
 
-    def __init__(self, api_key):
+    def __init__(self, api_key, base_url=None):
         """
         SlackWrapper constructor.
         Connect to the real-time messaging API and
         load the bot's login data.
+        base_url replaces https://slack.com/api for all api calls.
         """
         self.api_key = api_key
+        self.base_url = base_url
+        self.rate_limiter = MethodRateLimiter()
+        self.channel_directory = ChannelDirectory()
+        self.outbox = Outbox(self._post_message)
+        self.outbox.start()
+        self.member_cache = None
+        self.member_cache_time = 0
         self.client = SlackClient(self.api_key)
+
+        if base_url:
+            self.client.server.api_requester = BaseUrlSlackRequest(base_url)
+
         self.connected = self.client.rtm_connect(auto_reconnect=True)
         self.server = None
         self.username = None
@@ -30,8 +74,95 @@ class SlackWrapper:
 
     def read(self):
         """Read from the real-time messaging API."""
+        if self.server.ws_url.startswith("ws://"):
+            return self.read_plain_websocket()
+
         return self.client.rtm_read()
 
+    def read_plain_websocket(self):
+        """
+        Read all available events from an unencrypted websocket (of a local slack server).
+        slackclient only expects the "no data" error of tls sockets and would drop the events read before it.
+        """
+        events = []
+
+        while True:
+            try:
+                data = self.server.websocket.recv()
+            except BlockingIOError:
+                return events
+
+            events.extend(json.loads(line) for line in data.split("\n") if line)
+
+    def update_from_event(self, event):
+        """Keep cached slack data current with an event from the real-time messaging API."""
+        self.channel_directory.handle_event(event)
+
+        if event.get("type") in ("team_join", "user_change"):
+            self.member_cache = None
+
+    def api_call(self, method, **kwargs):
+        """
+        Call the given slack api method, respecting its rate limit.
+        If slack answers with a rate limit error, wait for the requested
+        time and retry the call.
+        """
+        channel = kwargs.get("channel")
+
+        for _ in range(RATELIMIT_RETRIES):
+            self.rate_limiter.acquire(method, channel)
+
+            with tracer.span("slack.api {}".format(method), "http") as span:
+                result = self.client.api_call(method, **kwargs)
+
+                if span and not result.get("ok"):
+                    span.attrs["error"] = result.get("error")
+
+            if result.get("error") != "ratelimited":
+                return result
+
+            headers = result.get("headers", {})
+            retry_after = int(headers.get("Retry-After", headers.get("retry-after", 1)))
+
+            log.warning("Rate limited on %s. Retrying in %d seconds...", method, retry_after)
+            self.rate_limiter.block(method, retry_after, channel)
+
+        return result
+
+    def paginate(self, method, **kwargs):
+        """
+        Yield the responses for all pages of a cursor-paginated api method, requesting
+        the maximum page size. Stops after the first failed page.
+        """
+        cursor = None
+
+        while True:
+            response = self.api_call(method, limit=PAGE_LIMIT, cursor=cursor, **kwargs)
+
+            yield response
+
+            if not response.get("ok"):
+                return
+
+            cursor = response.get("response_metadata", {}).get("next_cursor")
+
+            if not cursor:
+                return
+
+    def iter_pages(self, method, key, **kwargs):
+        """Yield the list of items (response[key]) of every page of a cursor-paginated api method."""
+        for response in self.paginate(method, **kwargs):
+            if not response["ok"]:
+                log.warning("Fetching %s failed: %s", method, response.get("error"))
+                return
+
+            yield response[key]
+
+    def iter_items(self, method, key, **kwargs):
+        """Yield the items of all pages of a cursor-paginated api method."""
+        for page in self.iter_pages(method, key, **kwargs):
+            yield from page
+
     def invite_user(self, users, channel, is_private=False):
         """
         Invite the given user(s) to the given channel.
@@ -39,7 +170,7 @@ class SlackWrapper:
 
         users = [users] if not type(users) == list else users
         api_call = "conversations.invite"
-        return self.client.api_call(api_call, channel=channel, users=users)
+        return self.api_call(api_call, channel=channel, users=users)
 
     def set_purpose(self, channel, purpose, is_private=False):
         """
@@ -47,32 +178,61 @@ class SlackWrapper:
         """
 
         api_call = "conversations.setPurpose"
-        return self.client.api_call(api_call, purpose=purpose, channel=channel)
+        result = self.api_call(api_call, purpose=purpose, channel=channel)
+
+        if result["ok"]:
+            self.channel_directory.set_purpose(channel, purpose)
+
+        return result
 
     def set_topic(self, channel, topic, is_private=False):
         """Set the topic of a given channel."""
 
         api_call = "groups.setTopic" if is_private else "channels.setTopic"
-        return self.client.api_call(api_call, topic=topic, channel=channel)
+        return self.api_call(api_call, topic=topic, channel=channel)
 
     def get_members(self):
         """
         Return a list of all members.
+        The list is reused for MEMBER_CACHE_TTL seconds (or until a member joins or changes).
         """
-        return self.client.api_call("users.list", presence=True)
+        if self.member_cache and time.monotonic() - self.member_cache_time < MEMBER_CACHE_TTL:
+            return self.member_cache
+
+        members = []
+
+        for response in self.paginate("users.list", presence=True):
+            if not response["ok"]:
+                return response
+
+            members.extend(response["members"])
+
+        self.member_cache = {"ok": True, "members": members}
+        self.member_cache_time = time.monotonic()
+
+        return self.member_cache
+
+    def iter_members(self):
+        """Yield all members, fetching them page by page."""
+        return self.iter_items("users.list", "members", presence=True)
 
     def get_member(self, user_id):
         """
         Return a member for a given user_id.
         """
-        return self.client.api_call("users.info", user=user_id)
+        return self.api_call("users.info", user=user_id)
 
     def create_channel(self, name, is_private=False):
         """
         Create a channel with a given name.
         """
         api_call = "conversations.create"
-        return self.client.api_call(api_call, name=name, is_private=is_private)
+        result = self.api_call(api_call, name=name, is_private=is_private)
+
+        if result["ok"]:
+            self.channel_directory.update(result["channel"])
+
+        return result
 
     def rename_channel(self, channel_id, new_name, is_private=False):
         """
@@ -80,25 +240,38 @@ class SlackWrapper:
         """
         api_call = "groups.rename" if is_private else "channels.rename"
 
-        return self.client.api_call(api_call, channel=channel_id, name=new_name, validate=False)
+        result = self.api_call(api_call, channel=channel_id, name=new_name, validate=False)
+
+        if result["ok"]:
+            self.channel_directory.rename(channel_id, new_name)
+
+        return result
 
     def get_channel_info(self, channel_id, is_private=False):
         """
         Return the channel info of a given channel ID.
+        Served from the channel directory, if the channel is known.
         """
+        cached = self.channel_directory.get_info(channel_id)
+
+        if cached:
+            return {"ok": True, "channel": cached}
 
         api_call = "conversations.info"
-        return self.client.api_call(api_call, channel=channel_id)
-
-    def get_channel_members(self, channel_id, next_cursor=None):
-        """Recursively fetch members of the given channel, until none remain to be fetched"""
-        response = self.client.api_call("conversations.members", channel=channel_id, cursor=next_cursor)
-        members = response['members']
-        next_cursor = response['response_metadata']['next_cursor']
-        if not next_cursor:
-            return members
-        else:
-            return members + self.get_channel_members(channel_id, next_cursor)
+        result = self.api_call(api_call, channel=channel_id)
+
+        if result["ok"]:
+            self.channel_directory.update(result["channel"])
+
+        return result
+
+    def iter_channel_members(self, channel_id):
+        """Yield the members of the given channel, fetching them page by page."""
+        return self.iter_items("conversations.members", "members", channel=channel_id)
+
+    def get_channel_members(self, channel_id):
+        """Fetch all members of the given channel."""
+        return list(self.iter_channel_members(channel_id))
 
     def update_channel_purpose_name(self, channel_id, new_name, is_private=False):
         """
@@ -114,52 +287,87 @@ class SlackWrapper:
 
             self.set_purpose(channel_id, json.dumps(purpose), is_private)
 
+    def close(self):
+        """Stop the outbox, after it has posted all queued messages."""
+        self.outbox.stop()
+
+    def _post_message(self, channel_id, text, timestamp="", parse="full"):
+        return self.api_call("chat.postMessage", channel=channel_id,
+                             text=text, as_user=True, parse=parse, thread_ts=timestamp)
+
     def post_message(self, channel_id, text, timestamp="", parse="full"):
         """
         Post a message in a given channel.
         channel_id can also be a user_id for private messages.
         Add timestamp for replying to a specific message.
+        The message is queued in the outbox and might be merged with other messages to the same channel.
         """
-        self.client.api_call("chat.postMessage", channel=channel_id,
-                             text=text, as_user=True, parse=parse, thread_ts=timestamp)
+        self.outbox.enqueue(channel_id, text, timestamp, parse)
+
+    def send_message(self, channel_id, text, timestamp="", parse="full"):
+        """Post a message in a given channel and wait for the api result (f.e. to get its timestamp)."""
+        return self.outbox.send(channel_id, text, timestamp, parse)
+
+    def get_outbox_stats(self):
+        """Return queue depth, send counters and latency of the outbox."""
+        return self.outbox.stats()
 
     def post_message_with_react(self, channel_id, text, reaction, parse="full"):
-        """Post a message in a given channel and add the specified reaction to it."""
-        result = self.client.api_call("chat.postMessage", channel=channel_id, text=text,
-                                      as_user=True, parse=parse)
+        """Post a message in a given channel and add the specified reaction to it. Return the api result."""
+        result = self.send_message(channel_id, text, parse=parse)
 
         if result["ok"]:
-            self.client.api_call("reactions.add", channel=channel_id, name=reaction, timestamp=result["ts"])
+            self.api_call("reactions.add", channel=channel_id, name=reaction, timestamp=result["ts"])
+
+        return result
+
+    def pin_message(self, channel_id, timestamp):
+        """Pin a message, identified by the specified timestamp, to the channel."""
+        return self.api_call("pins.add", channel=channel_id, timestamp=timestamp)
+
+    def unpin_message(self, channel_id, timestamp):
+        """Remove a pinned message, identified by the specified timestamp, from the channel."""
+        return self.api_call("pins.remove", channel=channel_id, timestamp=timestamp)
 
     def get_message(self, channel_id, timestamp):
         """Retrieve a message from the channel with the specified timestamp."""
-        return self.client.api_call("channels.history", channel=channel_id, latest=timestamp, count=1, inclusive=True)
+        return self.api_call("channels.history", channel=channel_id, latest=timestamp, count=1, inclusive=True)
 
     def update_message(self, channel_id, msg_timestamp, text, parse="full"):
         """Update a message, identified by the specified timestamp with a new text."""
-        self.client.api_call("chat.update", channel=channel_id, text=text, ts=msg_timestamp, as_user=True, parse=parse)
-
-    def get_channels(self, types, next_cursor=None):
-        """Recursively fetch channels, until there are no more to be fetched."""
-        types = [types] if type(types) != list else types
-        response = self.client.api_call("conversations.list", types=types, cursor=next_cursor)
-        channels = response['channels']
-        next_cursor = response['response_metadata']['next_cursor']
-        if not next_cursor:
-            return channels
-        else:
-            return channels + self.get_channels(types, next_cursor)
+        return self.api_call("chat.update", channel=channel_id, text=text, ts=msg_timestamp, as_user=True, parse=parse)
+
+    def iter_channel_pages(self, types, exclude_archived=False):
+        """
+        Yield the channels of the given types page by page (archived channels can be filtered by slack).
+        Every page also updates the channel directory.
+        """
+        types = ",".join([types] if type(types) != list else types)
+
+        for channels in self.iter_pages("conversations.list", "channels", types=types,
+                                        exclude_archived=exclude_archived):
+            for channel in channels:
+                self.channel_directory.update(channel)
+
+            yield channels
+
+    def get_channels(self, types, exclude_archived=False):
+        """Fetch all channels of the given types."""
+        return [channel for page in self.iter_channel_pages(types, exclude_archived) for channel in page]
 
     def get_all_channels(self):
         """Fetch all channels."""
-        return self.get_channels(["public_channel", "private_channel"])
+        channels = self.get_channels(["public_channel", "private_channel"])
+        self.channel_directory.loaded = True
+
+        return channels
 
     def get_channel_by_name(self, name):
-        """Fetch a channel with a given name."""
-        channels = self.get_all_channels()
-        for channel in channels:
-            if channel['name'] == name:
-                return channel
+        """Fetch a channel with a given name (channels are only listed once, afterwards the directory is used)."""
+        if not self.channel_directory.loaded:
+            self.get_all_channels()
+
+        return self.channel_directory.get_by_name(name)
 
     def get_public_channels(self):
         """Fetch all public channels."""
@@ -171,32 +379,48 @@ class SlackWrapper:
 
     def archive_channel(self, channel_id):
         """Archive a channel"""
-        return self.client.api_call("conversations.archive", channel=channel_id)
+        result = self.api_call("conversations.archive", channel=channel_id)
+
+        if result["ok"]:
+            self.channel_directory.set_archived(channel_id)
+
+        return result
 
     def archive_private_channel(self, channel_id):
         """Archive a private channel"""
-        return self.client.api_call("groups.archive", channel=channel_id)
+        result = self.api_call("groups.archive", channel=channel_id)
+
+        if result["ok"]:
+            self.channel_directory.set_archived(channel_id)
+
+        return result
 
     def archive_public_channel(self, channel_id):
         """Archive a public channel"""
-        return self.client.api_call("channels.archive", channel=channel_id)
+        result = self.api_call("channels.archive", channel=channel_id)
+
+        if result["ok"]:
+            self.channel_directory.set_archived(channel_id)
+
+        return result
 
     def add_reminder_hours(self, user, msg, offset):
         """Add a reminder with a given text for the specified user."""
-        return self.client.api_call("reminders.add", text=msg, time="in {} hours".format(offset), user=user)
+        return self.api_call("reminders.add", text=msg, time="in {} hours".format(offset), user=user)
 
     def get_reminders(self):
         """Retrieve all reminders created by the bot."""
-        return self.client.api_call("reminders.list")
+        return self.api_call("reminders.list")
+
+    def iter_reminders(self):
+        """Yield all reminders created by the bot (reminders.list currently answers with a single page)."""
+        return self.iter_items("reminders.list", "reminders")
 
     def remove_reminder(self, reminder_id):
-        return self.client.api_call("reminders.delete", reminder=reminder_id)
+        return self.api_call("reminders.delete", reminder=reminder_id)
 
     def remove_reminders_by_text(self, text):
         """Remove all reminders that contain the specified text."""
-        reminders = self.get_reminders()
-
-        if reminders and "reminders" in reminders:
-            for reminder in reminders["reminders"]:
-                if text in reminder["text"]:
-                    self.remove_reminder(reminder["id"])
+        for reminder in self.iter_reminders():
+            if text in reminder["text"]:
+                self.remove_reminder(reminder["id"])
@@ -0,0 +1,108 @@
+"""
+Detection of slow commands and reactions.
+
+Every processed command and reaction is measured by its trace (see util/tracing.py) and split
+into phases: parsing of the message, database access, slack api (and other http) calls and
+the remaining time spent in the handler itself (building and rendering the response).
+Waiting for the outbox to post a message counts as api time, messages queued for the outbox
+count as one slack call each.
+The slowest invocations are kept in a bounded heap (shown by `!admin slow`).
+"""
+import heapq
+import itertools
+import threading
+import time
+
+SLOW_LOG_SIZE = 20              # number of slowest invocations to keep
+SLOW_COMMAND_THRESHOLD = 2.0    # seconds, after which an invocation is logged as slow
+
+
+def _measure(span, totals):
+    """Add the time and slack calls of the children of a span to totals."""
+    end = span.start + span.duration
+
+    for child in span.children:
+        # Spans recorded after their parent has finished (posts of the outbox) didn't take time of the trace
+        if child.start > end or child.duration is None:
+            continue
+
+        if child.kind == "outbox":
+            totals["slack_calls"] += 1
+            continue
+
+        if child.name.startswith("slack.api"):
+            totals["slack_calls"] += 1
+
+        if child.kind in ("db", "http"):
+            # Nested spans are part of this span's time, only their calls are counted
+            totals[child.kind] += child.duration
+            totals["slack_calls"] += sum(1 for span in child.walk() if span.name.startswith("slack.api"))
+        else:
+            _measure(child, totals)
+
+
+def phase_times(trace, parse_time=0):
+    """Return the time spent per phase of a trace and the number of slack api calls made."""
+    totals = {"db": 0, "http": 0, "slack_calls": 0}
+    _measure(trace, totals)
+
+    # Calls of worker threads overlap, so they can add up to more than the whole trace
+    phases = {
+        "parse": parse_time,
+        "db": totals["db"],
+        "api": totals["http"],
+        "render": max(0, trace.duration - totals["db"] - totals["http"])
+    }
+
+    return phases, totals["slack_calls"]
+
+
+class SlowLog:
+    """Keeps the slowest invocations since the start of the bot (or the last reset)."""
+
+    def __init__(self, size=SLOW_LOG_SIZE):
+        self.size = size
+        self.threshold = SLOW_COMMAND_THRESHOLD
+        self.heap = []
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+
+    def record(self, trace, handler, command, arg_count, channel_id, parse_time=0):
+        """Measure a finished trace, remember it, if it's one of the slowest, and return the entry."""
+        phases, slack_calls = phase_times(trace, parse_time)
+
+        entry = {
+            "time": time.time(),
+            "handler": handler,
+            "command": command,
+            "arg_count": arg_count,
+            "channel": channel_id,
+            "duration": parse_time + trace.duration,
+            "slack_calls": slack_calls,
+            "phases": phases,
+            "error": trace.attrs.get("error")
+        }
+
+        with self.lock:
+            item = (entry["duration"], next(self.counter), entry)
+
+            if len(self.heap) < self.size:
+                heapq.heappush(self.heap, item)
+            else:
+                heapq.heappushpop(self.heap, item)
+
+        return entry
+
+    def slowest(self, count=None):
+        """Return the remembered invocations, slowest first."""
+        with self.lock:
+            items = sorted(self.heap, reverse=True)
+
+        return [entry for _, _, entry in items[:count]]
+
+    def reset(self):
+        with self.lock:
+            self.heap = []
+
+
+slow_log = SlowLog()
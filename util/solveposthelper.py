@@ -1,6 +1,9 @@
 """Helper module for uploading solve status posts to SolveTracker repository."""
 import json
 import datetime
+import pickle
+import threading
+import time
 from util.githandler import GitHandler
 from util.ctf_template_resolver import resolve_ctf_template, resolve_stats_template
 from util.loghandler import log
@@ -9,33 +12,206 @@ from bottypes.invalid_command import InvalidCommand
 ST_GIT_CONFIG = {}
 ST_GIT_SUPPORT = False
 
+ST_QUEUE_FILE = "databases/solvetracker_queue.bin"
+ST_PUSH_BACKOFF = 5         # seconds, doubled on every failed attempt
+ST_PUSH_BACKOFF_MAX = 300
+
+
+class PublishJob:
+    """A solve post, which is waiting to be uploaded to the SolveTracker repository."""
+
+    def __init__(self, ctf_name, user_id, files):
+        """
+        ctf_name : The name of the CTF the post belongs to
+        user_id : The slack id of the user, who is notified about the upload (the CTF channel
+                  is archived right after queuing the post, so the notice is sent as direct message)
+        files : List of (filename, data) tuples to be added to the repository
+        """
+        self.ctf_name = ctf_name
+        self.user_id = user_id
+        self.files = files
+        self.committed = False      # the files are committed locally, but maybe not pushed yet
+        self.notified = False       # the user was already told about a failed upload
+
+
+class SolvePostPublisher(threading.Thread):
+    """
+    Background worker, which uploads queued solve posts to the SolveTracker repository.
+    All posts, which are pending when the worker wakes up, are batched into one commit and push.
+    The queue is persisted, so pending posts survive a restart of the bot. Posts are only dropped
+    from the queue after they were pushed, failed uploads are retried with a capped backoff.
+    """
+
+    def __init__(self, queue_file):
+        threading.Thread.__init__(self, daemon=True)
+        self.queue_file = queue_file
+        self.condition = threading.Condition()
+        self.slack_wrapper = None
+        self.jobs = self.load_jobs()
+        self.backoff = ST_PUSH_BACKOFF
+        self.retry_at = 0
+
+    def load_jobs(self):
+        """Load pending jobs from the queue file."""
+        try:
+            with open(self.queue_file, "rb") as f:
+                return pickle.load(f)
+        except (IOError, EOFError, pickle.UnpicklingError):
+            return []
+
+    def save_jobs(self):
+        """Persist pending jobs (must be called with the condition held)."""
+        with open(self.queue_file, "wb") as f:
+            pickle.dump(self.jobs, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def enqueue(self, job):
+        """Add a job to the queue and wake up the worker."""
+        with self.condition:
+            self.jobs.append(job)
+            self.save_jobs()
+            self.condition.notify()
+
+    def pending(self):
+        with self.condition:
+            return len(self.jobs)
+
+    def notify_users(self, batch, message):
+        if not self.slack_wrapper:
+            return
+
+        for job in batch:
+            try:
+                self.slack_wrapper.post_message(job.user_id, message.format(
+                    ctf=job.ctf_name, url=ST_GIT_CONFIG.get("git_baseurl")))
+            except Exception:
+                log.exception("SolvePostPublisher::notify_users()")
+
+    def commit(self, batch):
+        """Add the files of all jobs in batch to the repository and commit them."""
+        git = GitHandler(ST_GIT_CONFIG.get("git_repopath"))
+
+        for job in batch:
+            for filename, data in job.files:
+                git.add_file(data, filename)
+
+        git.commit("Solve post from {}".format(", ".join(job.ctf_name for job in batch)))
+
+    def push(self):
+        """Push the current commit."""
+        git = GitHandler(ST_GIT_CONFIG.get("git_repopath"))
+
+        git.push(ST_GIT_CONFIG.get("git_repouser"), ST_GIT_CONFIG.get("git_repopass"),
+                 ST_GIT_CONFIG.get("git_remoteuri"), ST_GIT_CONFIG.get("git_branch"))
+
+    def publish(self, batch):
+        """Commit the jobs of a batch, which weren't committed yet, and push them."""
+        uncommitted = [job for job in batch if not job.committed]
+
+        # Jobs are only committed once, retries just have to push again
+        if uncommitted:
+            self.commit(uncommitted)
+
+            with self.condition:
+                for job in uncommitted:
+                    job.committed = True
+
+                self.save_jobs()
+
+        self.push()
+
+    def process_batch(self, batch):
+        """
+        Try to publish a batch. Published jobs are dropped from the queue, failed ones
+        are kept and retried after the current backoff.
+        Return True, if the batch was published.
+        """
+        try:
+            self.publish(batch)
+        except Exception as ex:
+            log.warning("Publishing solve posts failed (retrying in %ds): %s", self.backoff, ex)
+
+            self.notify_users([job for job in batch if not job.notified],
+                                 "Uploading the solve post for *{ctf}* failed, it will be retried. "
+                                 "Please check the logfiles...")
+
+            with self.condition:
+                for job in batch:
+                    job.notified = True
+
+                self.retry_at = time.monotonic() + self.backoff
+                self.save_jobs()
+
+            self.backoff = min(self.backoff * 2, ST_PUSH_BACKOFF_MAX)
+            return False
+
+        self.notify_users(batch, "Solve post for *{ctf}* was successfully uploaded to: {url}")
+
+        with self.condition:
+            self.jobs = [job for job in self.jobs if job not in batch]
+            self.save_jobs()
+
+        self.backoff = ST_PUSH_BACKOFF
+        self.retry_at = 0
+        return True
+
+    def run(self):
+        while True:
+            with self.condition:
+                # Wait for jobs and the end of the backoff after a failed attempt
+                while not self.jobs or time.monotonic() < self.retry_at:
+                    self.condition.wait(self.retry_at - time.monotonic() if self.jobs else None)
+
+                batch = list(self.jobs)
+
+            log.info("Publishing %d solve post(s)...", len(batch))
+
+            self.process_batch(batch)
+
+
+_publisher = None
+
+
+def start_publisher(slack_wrapper):
+    """Start the background publisher (or update the slack connection used for notifications)."""
+    global _publisher
 
-def post_ctf_data(ctf, title):
-    """Create a post and a statistic file and upload it to the configured SolveTracker repository."""
     if not ST_GIT_SUPPORT:
-        raise Exception("Sorry, but the SolveTracker support isn't configured...")
+        return
 
-    try:
-        now = datetime.datetime.now()
+    if not _publisher:
+        _publisher = SolvePostPublisher(ST_QUEUE_FILE)
+        _publisher.slack_wrapper = slack_wrapper
+        _publisher.start()
+    else:
+        _publisher.slack_wrapper = slack_wrapper
 
-        post_data = resolve_ctf_template(ctf, title, "./templates/post_ctf_template",
-                                         "./templates/post_challenge_template")
-        post_filename = "_posts/{}-{}-{}-{}.md".format(now.year, now.month, now.day, ctf.name)
 
-        stat_data = resolve_stats_template(ctf)
-        stat_filename = "_stats/{}.json".format(ctf.name)
+def build_ctf_post(ctf, title):
+    """Create the post and statistic files for the specified ctf as a list of (filename, data) tuples."""
+    now = datetime.datetime.now()
 
-        git = GitHandler(ST_GIT_CONFIG.get("git_repopath"))
+    post_data = resolve_ctf_template(ctf, title, "./templates/post_ctf_template",
+                                     "./templates/post_challenge_template")
+    post_filename = "_posts/{}-{}-{}-{}.md".format(now.year, now.month, now.day, ctf.name)
 
-        git.add_file(post_data, post_filename)
-        git.add_file(stat_data, stat_filename)
+    stat_data = resolve_stats_template(ctf)
+    stat_filename = "_stats/{}.json".format(ctf.name)
 
-        git.commit("Solve post from {}".format(ctf.name))
+    return [(post_filename, post_data), (stat_filename, stat_data)]
 
-        git.push(ST_GIT_CONFIG.get("git_repouser"), ST_GIT_CONFIG.get("git_repopass"),
-                 ST_GIT_CONFIG.get("git_remoteuri"), ST_GIT_CONFIG.get("git_branch"))
 
-        return ST_GIT_CONFIG.get("git_baseurl")
+def post_ctf_data(ctf, title, user_id):
+    """
+    Create a post and a statistic file and queue it for uploading to the configured SolveTracker repository.
+    The specified user will be notified, when the upload has finished.
+    """
+    if not ST_GIT_SUPPORT or not _publisher:
+        raise Exception("Sorry, but the SolveTracker support isn't configured...")
+
+    try:
+        _publisher.enqueue(PublishJob(ctf.name, user_id, build_ctf_post(ctf, title)))
+
+        return _publisher.pending()
 
     except InvalidCommand as invalid_cmd:
         # Just pass invalid commands on
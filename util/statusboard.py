@@ -0,0 +1,109 @@
+"""Live status boards: pinned status messages, which are edited whenever the state of their CTF changes."""
+import pickle
+import threading
+import time
+
+from util.loghandler import log
+
+STATUS_BOARD_INTERVAL = 30      # seconds, minimum time between two edits of a board
+
+# chat.update errors, after which a board can't be edited anymore (or editing it again won't help)
+BOARD_GONE_ERRORS = ("message_not_found", "channel_not_found", "is_archived", "cant_update_message", "msg_too_long")
+
+
+class StatusBoards:
+    """
+    Keeps the timestamp of the live status board of every CTF (by CTF channel id).
+    Changes only mark a board as dirty, flush edits dirty boards at most once per interval.
+    """
+
+    def __init__(self, filename=None, interval=STATUS_BOARD_INTERVAL):
+        self.filename = filename
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.boards = self.load()
+        self.dirty = set()
+        self.last_edit = {}
+
+    def load(self):
+        """Load the boards from their file."""
+        if self.filename:
+            try:
+                with open(self.filename, "rb") as f:
+                    return pickle.load(f)
+            except (IOError, EOFError, pickle.UnpicklingError):
+                pass
+
+        return {}
+
+    def save(self):
+        """Persist the boards (must be called with the lock held)."""
+        if not self.filename:
+            return
+
+        try:
+            with open(self.filename, "wb") as f:
+                pickle.dump(self.boards, f, protocol=pickle.HIGHEST_PROTOCOL)
+        except IOError:
+            log.exception("StatusBoards::save()")
+
+    def get(self, ctf_channel_id):
+        """Return the timestamp of the board of a CTF or None, if it has no board."""
+        with self.lock:
+            return self.boards.get(ctf_channel_id)
+
+    def add(self, ctf_channel_id, ts):
+        with self.lock:
+            self.boards[ctf_channel_id] = ts
+            self.last_edit[ctf_channel_id] = time.monotonic()
+            self.save()
+
+    def remove(self, ctf_channel_id):
+        """Forget the board of a CTF and return its timestamp."""
+        with self.lock:
+            ts = self.boards.pop(ctf_channel_id, None)
+            self.dirty.discard(ctf_channel_id)
+            self.last_edit.pop(ctf_channel_id, None)
+
+            if ts:
+                self.save()
+
+            return ts
+
+    def mark_dirty(self, ctf_channel_id):
+        """Schedule an edit of the board of a CTF (if it has one)."""
+        with self.lock:
+            if ctf_channel_id in self.boards:
+                self.dirty.add(ctf_channel_id)
+
+    def due(self):
+        """Return (ctf channel id, timestamp) for all dirty boards, which may be edited now, and mark them clean."""
+        now = time.monotonic()
+
+        with self.lock:
+            due = [ctf_channel_id for ctf_channel_id in self.dirty
+                   if now - self.last_edit.get(ctf_channel_id, 0) >= self.interval]
+
+            for ctf_channel_id in due:
+                self.dirty.discard(ctf_channel_id)
+                self.last_edit[ctf_channel_id] = now
+
+            return [(ctf_channel_id, self.boards[ctf_channel_id]) for ctf_channel_id in due]
+
+    def flush(self, slack_wrapper, render_func):
+        """
+        Edit all due boards.
+        render_func : Function returning the board text for a CTF channel id (or None, if the CTF is gone)
+        """
+        for ctf_channel_id, ts in self.due():
+            text = render_func(ctf_channel_id)
+
+            if text is None:
+                self.remove(ctf_channel_id)
+                continue
+
+            result = slack_wrapper.update_message(ctf_channel_id, ts, text)
+
+            if result and not result["ok"] and result.get("error") in BOARD_GONE_ERRORS:
+                log.info("Status board of %s can't be edited anymore (%s)", ctf_channel_id, result.get("error"))
+                self.remove(ctf_channel_id)
@@ -0,0 +1,97 @@
+"""Registry of the status messages posted by the bot, so they can be refreshed without reading them back."""
+import collections
+import pickle
+import threading
+import time
+
+from util.loghandler import log
+
+STATUS_REGISTRY_SIZE = 200      # status messages to remember (the oldest ones are forgotten first)
+STATUS_REFRESH_DEBOUNCE = 5     # seconds, in which further refresh requests for a message are ignored
+
+
+class StatusMessage:
+    """A status message posted by the bot."""
+
+    __slots__ = ("channel_id", "ts", "verbose", "category", "last_refresh", "page", "unsolved_only")
+
+    def __init__(self, channel_id, ts, verbose, category="", page=1, unsolved_only=False):
+        self.channel_id = channel_id
+        self.ts = ts
+        self.verbose = verbose
+        self.category = category
+        self.last_refresh = 0
+        self.page = page
+        self.unsolved_only = unsolved_only
+
+    def __getstate__(self):
+        return (self.channel_id, self.ts, self.verbose, self.category, self.page, self.unsolved_only)
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+
+class StatusRegistry:
+    """Bounded registry of status messages by (channel id, timestamp)."""
+
+    def __init__(self, filename=None, max_size=STATUS_REGISTRY_SIZE, debounce=STATUS_REFRESH_DEBOUNCE):
+        self.filename = filename
+        self.max_size = max_size
+        self.debounce = debounce
+        self.lock = threading.Lock()
+        self.messages = self.load()
+
+    def load(self):
+        """Load the registry from its file."""
+        if self.filename:
+            try:
+                with open(self.filename, "rb") as f:
+                    return pickle.load(f)
+            except (IOError, EOFError, pickle.UnpicklingError):
+                pass
+
+        return collections.OrderedDict()
+
+    def save(self):
+        """Persist the registry (must be called with the lock held)."""
+        if not self.filename:
+            return
+
+        try:
+            with open(self.filename, "wb") as f:
+                pickle.dump(self.messages, f, protocol=pickle.HIGHEST_PROTOCOL)
+        except IOError:
+            log.exception("StatusRegistry::save()")
+
+    def register(self, channel_id, ts, verbose, category="", page=1, unsolved_only=False):
+        """Remember a posted status message (or one page of a status spanning multiple messages)."""
+        with self.lock:
+            self.messages[(channel_id, ts)] = StatusMessage(channel_id, ts, verbose, category, page, unsolved_only)
+            self.messages.move_to_end((channel_id, ts))
+
+            while len(self.messages) > self.max_size:
+                self.messages.popitem(last=False)
+
+            self.save()
+
+    def get(self, channel_id, ts):
+        """Return the registered status message or None, if the message isn't a known status message."""
+        with self.lock:
+            return self.messages.get((channel_id, ts))
+
+    def acquire_refresh(self, channel_id, ts):
+        """
+        Return the registered status message, if it should be refreshed now.
+        Return None for unknown messages and for messages, which were refreshed within the debounce time.
+        """
+        now = time.monotonic()
+
+        with self.lock:
+            message = self.messages.get((channel_id, ts))
+
+            if not message or now - message.last_refresh < self.debounce:
+                return None
+
+            message.last_refresh = now
+
+            return message
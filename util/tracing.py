@@ -0,0 +1,181 @@
+"""
+Lightweight span tracing of processed commands.
+
+Every command is traced as a root span with child spans for slack wrapper methods,
+slack api calls, database access and other http requests. Finished traces are kept
+in a ring buffer (shown by `!admin trace`) and can be exported as JSON.
+Spans are recorded on the thread, which started the trace (and on worker threads
+attached to it); outside of a trace, opening a span only costs a thread-local lookup.
+"""
+import collections
+import functools
+import inspect
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+TRACE_BUFFER_SIZE = 200     # number of finished traces to keep
+
+
+class Span:
+    """A timed operation with its child operations."""
+
+    __slots__ = ("name", "kind", "start", "duration", "attrs", "children")
+
+    def __init__(self, name, kind, attrs):
+        self.name = name
+        self.kind = kind
+        self.start = time.time()
+        self.duration = None
+        self.attrs = attrs
+        self.children = []
+
+    def walk(self):
+        """Yield all spans below this span (depth first)."""
+        for child in self.children:
+            yield child
+            yield from child.walk()
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "kind": self.kind,
+            "start": self.start,
+            "duration": self.duration,
+            "attrs": self.attrs,
+            "children": [child.to_dict() for child in self.children]
+        }
+
+
+class Tracer:
+    """Records spans per thread and keeps the finished traces in a ring buffer."""
+
+    def __init__(self, buffer_size=TRACE_BUFFER_SIZE):
+        self.traces = collections.deque(maxlen=buffer_size)
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    def _stack(self):
+        stack = getattr(self.local, "stack", None)
+
+        if stack is None:
+            stack = self.local.stack = []
+
+        return stack
+
+    @contextmanager
+    def _record(self, stack, span):
+        if stack:
+            stack[-1].children.append(span)
+
+        stack.append(span)
+        start = time.perf_counter()
+
+        try:
+            yield span
+        except Exception as ex:
+            span.attrs["error"] = type(ex).__name__
+            raise
+        finally:
+            span.duration = time.perf_counter() - start
+            stack.pop()
+
+            if not stack:
+                with self.lock:
+                    self.traces.append(span)
+
+    def trace(self, name, kind="command", **attrs):
+        """Start a trace (or a child span, if a trace is already active on this thread)."""
+        return self._record(self._stack(), Span(name, kind, attrs))
+
+    @contextmanager
+    def span(self, name, kind="internal", **attrs):
+        """Record a child span of the active trace (does nothing, if no trace is active)."""
+        stack = self._stack()
+
+        if not stack:
+            yield None
+            return
+
+        with self._record(stack, Span(name, kind, attrs)) as span:
+            yield span
+
+    @contextmanager
+    def attach(self, span):
+        """Record the spans of this thread (f.e. a worker thread) as children of a span of another thread."""
+        if span is None:
+            yield
+            return
+
+        stack = self._stack()
+        stack.append(span)
+
+        try:
+            yield
+        finally:
+            stack.pop()
+
+    def active(self):
+        """Return the innermost active span of this thread (or None)."""
+        stack = self._stack()
+
+        return stack[-1] if stack else None
+
+    def last(self, count):
+        """Return the last count finished traces (newest first)."""
+        with self.lock:
+            return list(self.traces)[-count:][::-1]
+
+    def export(self, filename):
+        """Write all buffered traces to a JSON file and return their number."""
+        with self.lock:
+            traces = [trace.to_dict() for trace in self.traces]
+
+        with open(filename, "w") as f:
+            json.dump(traces, f, indent=2)
+
+        return len(traces)
+
+
+tracer = Tracer()
+
+
+def traced(name, kind="internal"):
+    """Decorator recording every call of a function as a span."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with tracer.span(name, kind):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def trace_methods(prefix, kind, exclude=()):
+    """Class decorator recording calls of all public methods (except generators) as spans."""
+    def decorate(cls):
+        for name, func in list(vars(cls).items()):
+            if (name.startswith("_") or name in exclude or not inspect.isfunction(func)
+                    or inspect.isgeneratorfunction(func)):
+                continue
+
+            setattr(cls, name, traced("{}.{}".format(prefix, name), kind)(func))
+
+        return cls
+
+    return decorate
+
+
+def summarize(span):
+    """Return (name, calls, total duration) of the child spans of a trace, grouped by name, slowest first."""
+    groups = collections.OrderedDict()
+
+    for child in span.walk():
+        calls, total = groups.get(child.name, (0, 0))
+        # Spans of the outbox might still be running after their trace has finished
+        groups[child.name] = (calls + 1, total + (child.duration or 0))
+
+    return sorted(((name, calls, total) for name, (calls, total) in groups.items()), key=lambda group: -group[2])
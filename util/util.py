@@ -1,8 +1,13 @@
 import json
-import pickle
+import os
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
 
 from bottypes.invalid_command import InvalidCommand
+from util import serializer
+from util.tracing import tracer
 
 #######
 # Helper functions
@@ -42,11 +47,143 @@ def transliterate(string):
     return ''.join([mapping[c] if c in mapping else c for c in string])
 
 
+def process_concurrently(func, items, max_workers=4):
+    """
+    Call func for every item using a pool of worker threads.
+    Yield (item, result) tuples in the order the calls complete.
+    Spans recorded by the workers are added to the active trace of the calling thread.
+    """
+    parent = tracer.active()
+
+    def call(item):
+        with tracer.attach(parent):
+            return func(item)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(call, item): item for item in items}
+
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+
+def chunk_text(sections, limit):
+    """
+    Pack text sections into chunks of at most limit characters and yield them (stripped).
+    A section is only split (at line boundaries), if it doesn't fit into a chunk of its own.
+    """
+    chunk = ""
+
+    for section in sections:
+        if len(chunk) + len(section) <= limit:
+            chunk += section
+            continue
+
+        if chunk.strip():
+            yield chunk.strip()
+
+        chunk = ""
+
+        for line in section.splitlines(keepends=True):
+            if len(chunk) + len(line) > limit:
+                if chunk.strip():
+                    yield chunk.strip()
+
+                chunk = ""
+
+            # Lines longer than a chunk are cut
+            while len(line) > limit:
+                yield line[:limit]
+                line = line[limit:]
+
+            chunk += line
+
+    if chunk.strip():
+        yield chunk.strip()
+
+
 #######
 # Database manipulation
 #######
 
 
+# database -> (file signature, CTF dictionary)
+_ctf_cache = {}
+_ctf_cache_lock = threading.Lock()
+
+
+def _file_signature(database):
+    stat = os.stat(database)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def load_ctfs(database):
+    """
+    Load the dictionary of all CTF objects (by channel ID) from the database.
+    The loaded state is kept in memory and only read again, if the file was changed by someone else.
+    The dictionary (and every CTF and Challenge in it) is shared by all callers and threads, so it
+    must only be modified inside ctf_transaction (or directly before save_ctfs), otherwise a failed
+    update stays in the in-memory state.
+    """
+    with tracer.span("db.load", "db") as span:
+        signature = _file_signature(database)
+
+        with _ctf_cache_lock:
+            cached = _ctf_cache.get(database)
+
+            if cached and cached[0] == signature:
+                return cached[1]
+
+        if span:
+            span.attrs["cache"] = "miss"
+
+        ctfs = serializer.load(database)
+
+        with _ctf_cache_lock:
+            _ctf_cache[database] = (signature, ctfs)
+
+        return ctfs
+
+
+def save_ctfs(database, ctfs):
+    """
+    Persist the dictionary of all CTF objects to the database.
+    If writing fails, the in-memory state is dropped, so the next load reads the file again.
+    """
+    with tracer.span("db.save", "db"):
+        try:
+            serializer.dump(ctfs, database)
+        except Exception:
+            invalidate_ctfs(database)
+            raise
+
+        with _ctf_cache_lock:
+            _ctf_cache[database] = (_file_signature(database), ctfs)
+
+
+def invalidate_ctfs(database):
+    """Drop the in-memory state of the database, so it's loaded from the file again."""
+    with _ctf_cache_lock:
+        _ctf_cache.pop(database, None)
+
+
+@contextmanager
+def ctf_transaction(database):
+    """
+    Load the database once, yield the CTF dictionary for modification and
+    persist it once afterwards. Nothing is written, if an exception occurs
+    (and partial modifications are dropped from the in-memory state).
+    """
+    ctfs = load_ctfs(database)
+
+    try:
+        yield ctfs
+    except Exception:
+        invalidate_ctfs(database)
+        raise
+
+    save_ctfs(database, ctfs)
+
+
 def get_ctf_by_channel_id(database, channel_id, include_challenges=True):
     """
     Fetch a CTF object (CTF, Challenge) in the database with a given channel ID.
@@ -54,7 +191,7 @@ def get_ctf_by_channel_id(database, channel_id, include_challenges=True):
     Challenge objects.
     Return the matching CTF object if found, or None otherwise.
     """
-    ctfs = pickle.load(open(database, "rb"))
+    ctfs = load_ctfs(database)
     for c_id, ctf in ctfs.items():
         if c_id == channel_id:
             return ctf
@@ -72,20 +209,13 @@ def update_ctf(database, channel_id, update_func):
     Fetch a CTF object in the database with a given channel ID,
     and apply update_func on it. Saves the ctf database afterwards.
     """
-    with open(database, "rb") as f:
-        ctfs = pickle.load(f)
-
-    ctf = ctfs.get(channel_id)
-
-    if ctf:
-        update_func(ctf)
+    with ctf_transaction(database) as ctfs:
+        ctf = ctfs.get(channel_id)
 
-        with open(database, "wb") as f:
-            pickle.dump(ctfs, f)
+        if ctf:
+            update_func(ctf)
 
-        return ctf
-
-    return None
+    return ctf
 
 
 def get_ctf_by_name(database, name):
@@ -93,7 +223,7 @@ def get_ctf_by_name(database, name):
     Fetch a CTF object in the database with a given name.
     Return the matching CTF object if found, or None otherwise.
     """
-    ctfs = pickle.load(open(database, "rb"))
+    ctfs = load_ctfs(database)
     for ctf in ctfs.values():
         if ctf.name == name:
             return ctf
@@ -107,24 +237,44 @@ def get_challenge_by_name(database, challenge_name, ctf_channel_id):
     ID.
     Return the matching Challenge object if found, or None otherwise.
     """
-    ctfs = pickle.load(open(database, "rb"))
+    ctfs = load_ctfs(database)
 
     if ctf_channel_id not in ctfs:
         raise InvalidCommand("Could not find corresponding ctf channel. Try reloading ctf data.")
 
-    for challenge in ctfs[ctf_channel_id].challenges:
-        if challenge.name == challenge_name:
-            return challenge
+    return ctfs[ctf_channel_id].index.named(challenge_name)
 
-    return None
+
+def find_challenge_by_name(database, challenge_name, ctf_channel_id):
+    """
+    Fetch a Challenge object in the database by its name, a unique prefix or a
+    unique part of its name and a given ctf channel ID.
+    Raise InvalidCommand (suggesting similar challenge names), if no challenge matches.
+    """
+    ctfs = load_ctfs(database)
+
+    if ctf_channel_id not in ctfs:
+        raise InvalidCommand("Could not find corresponding ctf channel. Try reloading ctf data.")
+
+    challenge, suggestions = ctfs[ctf_channel_id].index.match(challenge_name)
+
+    if challenge:
+        return challenge
+
+    message = "Challenge `{}` not found.".format(challenge_name)
+
+    if suggestions:
+        message += " Did you mean {}?".format(" or ".join("`{}`".format(name) for name in suggestions))
+
+    raise InvalidCommand(message)
 
 
 def get_challenge_from_args_or_channel(database, args, channel_id):
     """
     Helper method for getting a Challenge either from arguments or current channel.
     Return the corresponding Challenge if called from a challenge channel.
-    Return the Challenge corresponding to the first argument if called from the
-    CTF channel.
+    Return the Challenge corresponding to the first argument (which can be
+    abbreviated) if called from the CTF channel.
     Return None if no Challenge can be found.
     """
 
@@ -138,7 +288,7 @@ def get_challenge_from_args_or_channel(database, args, channel_id):
         # Assume user is in the ctf channel
         try:
             challenge_name = args[0].lower().strip("*")
-            challenge = get_challenge_by_name(database, challenge_name, channel_id)
+            challenge = find_challenge_by_name(database, challenge_name, channel_id)
         except IndexError:
             challenge = None
 
@@ -158,12 +308,12 @@ def get_challenge_from_args(database, args, channel_id):
 
     if current_chal:
         # User is in a challenge channel => Check for challenge by name
-        # in parent ctf channel
+        # in parent ctf channel (exact names only, the argument might be a user)
         challenge = get_challenge_by_name(database, challenge_name, current_chal.ctf_channel_id)
     else:
-        # User is in the ctf channel => Check for challenge by name in
-        # current challenge
-        challenge = get_challenge_by_name(database, challenge_name, channel_id)
+        # User is in the ctf channel => Check for challenge by (abbreviated)
+        # name in current ctf
+        challenge = find_challenge_by_name(database, challenge_name, channel_id)
 
     return challenge
 
@@ -173,7 +323,7 @@ def get_challenge_by_channel_id(database, challenge_channel_id):
     Fetch a Challenge object in the database with a given channel ID
     Return the matching Challenge object if found, or None otherwise.
     """
-    ctfs = pickle.load(open(database, "rb"))
+    ctfs = load_ctfs(database)
     for ctf in ctfs.values():
         for challenge in ctf.challenges:
             if challenge.channel_id == challenge_channel_id:
@@ -186,13 +336,8 @@ def save_challenge(database, challenge):
     """
     Save a Challenge object back to the database with a given channel ID.
     """
-    ctfs = pickle.load(open(database, "rb"))
-    challenges = ctfs[challenge.ctf_channel_id].challenges
-    for i in range(0, len(challenges)):
-        if challenges[i].channel_id == challenge.channel_id:
-            challenges[i] = challenge
-            break
-    pickle.dump(ctfs, open(database, "wb"))
+    with ctf_transaction(database) as ctfs:
+        ctfs[challenge.ctf_channel_id].update_challenge(challenge)
 
 
 def get_challenges_for_user_id(database, user_id, ctf_channel_id):
@@ -201,15 +346,20 @@ def get_challenges_for_user_id(database, user_id, ctf_channel_id):
     Return a list of matching Challenge objects.
     """
 
-    ctfs = pickle.load(open(database, "rb"))
-    ctf = ctfs[ctf_channel_id]
+    ctfs = load_ctfs(database)
 
-    challenges = []
-    for challenge in ctf.challenges:
-        if user_id in challenge.players:
-            challenges.append(challenge)
+    return ctfs[ctf_channel_id].challenges_of_player(user_id)
 
-    return challenges
+
+def get_work_of_user_id(database, user_id):
+    """
+    Fetch the challenges a user is working on in all CTFs.
+    Return a list of (CTF, list of Challenge objects) tuples for the CTFs the user works on.
+    """
+    ctfs = load_ctfs(database)
+
+    return [(ctf, challenges) for ctf, challenges in
+            ((ctf, ctf.challenges_of_player(user_id)) for ctf in ctfs.values()) if challenges]
 
 
 def get_challenges_for_ctf_id(database, ctf_channel_id):
@@ -218,7 +368,7 @@ def get_challenges_for_ctf_id(database, ctf_channel_id):
     Return a list of matching Challenge objects.
     """
 
-    ctfs = pickle.load(open(database, "rb"))
+    ctfs = load_ctfs(database)
     ctf = ctfs[ctf_channel_id]
 
     challenges = []
@@ -232,55 +382,37 @@ def update_challenge_name(database, challenge_channel_id, new_name):
     """
     Updates the name of the challenge with the specified challenge id
     """
-    ctfs = pickle.load(open(database, "rb"))
-
-    for ctf in ctfs.values():
-        for chal in ctf.challenges:
-            if chal.channel_id == challenge_channel_id:
-                chal.name = new_name
-                pickle.dump(ctfs, open(database, "wb"))
-                return
+    with ctf_transaction(database) as ctfs:
+        for ctf in ctfs.values():
+            for chal in ctf.challenges:
+                if chal.channel_id == challenge_channel_id:
+                    chal.name = new_name
+                    ctf.update_challenge(chal)
+                    return
 
 
 def update_ctf_name(database, ctf_channel_id, new_name):
     """
     Updates the name of the ctf with the specified channel id
     """
-    ctfs = pickle.load(open(database, "rb"))
-    ctf = ctfs[ctf_channel_id]
-    ctf.name = new_name
-    pickle.dump(ctfs, open(database, "wb"))
+    with ctf_transaction(database) as ctfs:
+        ctfs[ctf_channel_id].name = new_name
 
 
 def remove_challenge_by_channel_id(database, challenge_channel_id, ctf_channel_id):
     """
     Remove a challenge from the database using a given challenge and CTF id.
     """
-    ctfs = pickle.load(open(database, "rb"))
-    ctf = ctfs[ctf_channel_id]
-    ctf.challenges = list(filter(lambda challenge: challenge.channel_id != challenge_channel_id, ctf.challenges))
-    pickle.dump(ctfs, open(database, "wb"))
+    with ctf_transaction(database) as ctfs:
+        ctfs[ctf_channel_id].remove_challenge(challenge_channel_id)
 
 
 def remove_ctf_by_channel_id(database, ctf_channel_id):
     """
     Remove a CTF from the database using a given CTF id.
     """
-    ctfs = pickle.load(open(database, "rb"))
-    ctfs.pop(ctf_channel_id)
-    pickle.dump(ctfs, open(database, "wb"))
-
-
-def cleanup_reminders(slack_wrapper, handler_factory, ctf):
-    """Remove existing reminders for this ctf, if reminder handling is configured."""
-    reminder_offset = handler_factory.botserver.get_config_option("archive_ctf_reminder_offset")
-
-    if not reminder_offset:
-        # no reminder handling configured, bail out
-        return
-
-    # To save space in channel purpose, we'll just search the reminders by creation text
-    slack_wrapper.remove_reminders_by_text("CTF {} - ".format(ctf.name))
+    with ctf_transaction(database) as ctfs:
+        ctfs.pop(ctf_channel_id)
 
 
 def parse_user_id(user_id):
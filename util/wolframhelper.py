@@ -0,0 +1,203 @@
+"""Helper module for wolfram_handler to query Wolfram Alpha with a shared client and an answer cache."""
+import io
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+import wolframalpha
+from requests.adapters import HTTPAdapter
+
+from util.loghandler import log
+from util.tracing import tracer
+
+WOLFRAM_QUERY_URL = "https://api.wolframalpha.com/v2/query"
+WOLFRAM_TIMEOUT = 30
+
+DEFAULT_CACHE_TTL = 3600
+DEFAULT_CACHE_SIZE = 256
+
+
+class WolframClient(wolframalpha.Client):
+    """Wolfram Alpha client, which reuses a pooled HTTP session for all queries."""
+
+    def __init__(self, app_id):
+        super().__init__(app_id)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4)
+        self.session.mount("https://", adapter)
+
+    def query(self, input, params=(), **kwargs):
+        """Query Wolfram Alpha through the pooled session and return the parsed result."""
+        data = [("appid", self.app_id), ("input", input)]
+        data.extend(params)
+        data.extend(kwargs.items())
+
+        with tracer.span("http wolfram", "http"):
+            resp = self.session.get(WOLFRAM_QUERY_URL, params=data, timeout=WOLFRAM_TIMEOUT)
+            resp.raise_for_status()
+
+        return wolframalpha.Result(io.BytesIO(resp.content))
+
+
+class _PendingQuery:
+    """A query, which is currently in flight and can be waited for by other askers."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.answer = None
+        self.error = None
+
+
+class AnswerCache:
+    """
+    Bounded LRU cache for rendered answers with expiry.
+    Concurrent lookups for the same key, which aren't cached yet, are deduplicated,
+    so only the first asker queries the upstream api and the others wait for its answer.
+    """
+
+    def __init__(self, ttl=DEFAULT_CACHE_TTL, max_size=DEFAULT_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _get_cached(self, key):
+        entry = self.entries.get(key)
+
+        if entry is None:
+            return None
+
+        answer, expires_at = entry
+
+        if expires_at < time.time():
+            del self.entries[key]
+            return None
+
+        self.entries.move_to_end(key)
+        return answer
+
+    def _store(self, key, answer):
+        self.entries[key] = (answer, time.time() + self.ttl)
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def get_or_compute(self, key, compute_func):
+        """Return the cached answer for key or compute it (only once for concurrent askers)."""
+        with self.lock:
+            answer = self._get_cached(key)
+
+            if answer is not None:
+                self.hits += 1
+                return answer
+
+            self.misses += 1
+            pending = self.pending.get(key)
+            is_leader = pending is None
+
+            if is_leader:
+                pending = _PendingQuery()
+                self.pending[key] = pending
+
+        if not is_leader:
+            pending.done.wait()
+
+            if pending.error:
+                raise pending.error
+
+            return pending.answer
+
+        try:
+            pending.answer = compute_func()
+        except Exception as ex:
+            pending.error = ex
+            raise
+        finally:
+            with self.lock:
+                # Don't cache failed or empty answers, so they can be retried
+                if pending.error is None and pending.answer:
+                    self._store(key, pending.answer)
+
+                del self.pending[key]
+
+            pending.done.set()
+
+        return pending.answer
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+def normalize_question(question):
+    """Normalize a question, so trivially different spellings share one cache entry."""
+    return " ".join(question.lower().split()).rstrip("?").strip()
+
+
+def render_answer(res, verbose):
+    """Render a Wolfram Alpha result into a slack message."""
+    answer = ""
+
+    if verbose:
+        for pod in res.pods:
+            for subpod in pod.subpods:
+                if "plaintext" in subpod.keys() and subpod["plaintext"]:
+                    answer += "```\n"
+                    answer += subpod.plaintext[:512] + "\n"
+                    answer += "```\n"
+                    if len(subpod.plaintext) > 512:
+                        answer += "*shortened*"
+    else:
+        result = next(res.results, None)
+
+        if result:
+            if len(result.text) > 2048:
+                answer = result.text[:2048] + "*shortened*"
+            else:
+                answer = result.text
+
+    return answer
+
+
+_client = None
+_client_lock = threading.Lock()
+_answer_cache = AnswerCache()
+
+
+def get_client(app_id):
+    """Return the shared Wolfram Alpha client (recreated if the app id changed)."""
+    global _client
+
+    with _client_lock:
+        if _client is None or _client.app_id != app_id:
+            _client = WolframClient(app_id)
+
+        return _client
+
+
+def configure_cache(ttl=None, max_size=None):
+    """Update the bounds of the answer cache."""
+    if ttl is not None:
+        _answer_cache.ttl = int(ttl)
+
+    if max_size is not None:
+        _answer_cache.max_size = int(max_size)
+
+
+def ask(app_id, question, verbose=False):
+    """Return the rendered answer for a question, served from the cache if possible."""
+    key = (normalize_question(question), verbose)
+
+    def query():
+        log.debug("Querying wolfram alpha: %s (verbose: %s)", question, verbose)
+        res = get_client(app_id).query(question)
+
+        return render_answer(res, verbose)
+
+    return _answer_cache.get_or_compute(key, query)